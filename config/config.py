@@ -15,6 +15,9 @@ class Config:
     # Qdrant 設定
     QDRANT_URL = os.getenv("QDRANT_URL", "http://ec2-13-112-118-36.ap-northeast-1.compute.amazonaws.com:6333")
     QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "steven_JH")
+    QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "32"))  # 共用客戶端的連線池大小
+    RAG_REGISTRY_TTL = float(os.getenv("RAG_REGISTRY_TTL", "3600"))  # 共用 RAG 實例閒置超過此秒數後釋放
+    RAG_REGISTRY_MAX_SYSTEMS = int(os.getenv("RAG_REGISTRY_MAX_SYSTEMS", "32"))  # 共用 RAG 實例數上限
 
     # OpenAI API 設定 - 從 .env 讀取
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -24,6 +27,32 @@ class Config:
     # Zerox 視覺處理模型
     ZEROX_MODEL = os.getenv("ZEROX_MODEL", "gpt-4o")
 
+    # Zerox 自適應並發 - 延遲與錯誤率正常時增加同時處理的頁面數，遇到節流時減半
+    ZEROX_CONCURRENCY_INITIAL = int(os.getenv("ZEROX_CONCURRENCY_INITIAL", "2"))
+    ZEROX_CONCURRENCY_MIN = int(os.getenv("ZEROX_CONCURRENCY_MIN", "1"))
+    ZEROX_CONCURRENCY_MAX = int(os.getenv("ZEROX_CONCURRENCY_MAX", "8"))
+    ZEROX_CONCURRENCY_LIMITS = os.getenv("ZEROX_CONCURRENCY_LIMITS", "")  # 依模型設定上限，例如 gpt-4o=16,bedrock/*=4
+    ZEROX_LATENCY_TARGET = float(os.getenv("ZEROX_LATENCY_TARGET", "60"))  # 單頁延遲超過此秒數時不再增加並發
+    ZEROX_MAX_RETRIES = int(os.getenv("ZEROX_MAX_RETRIES", "3"))  # 節流時單頁最大重試次數
+
+    # PDF 頁面掃描 - 空白頁檢測（有文字層的頁面不渲染）
+    PAGE_SCAN_WORKERS = int(os.getenv("PAGE_SCAN_WORKERS", "0"))  # 進程數（0 為 CPU 核心數）
+    BLANK_PAGE_THRESHOLD = float(os.getenv("BLANK_PAGE_THRESHOLD", "0.95"))  # 白色像素比例超過此值視為空白頁
+    PAGE_RENDER_WORKERS = int(os.getenv("PAGE_RENDER_WORKERS", "2"))  # 頁面圖片渲染的進程數上限
+
+    # 文字層快速路徑 - 文字為主的頁面直接由文字層轉為 markdown，不送視覺模型
+    TEXT_FAST_PATH_ENABLED = os.getenv("TEXT_FAST_PATH_ENABLED", "true").lower() == "true"
+    TEXT_FAST_PATH_MIN_CHARS = int(os.getenv("TEXT_FAST_PATH_MIN_CHARS", "200"))  # 文字層字元數下限
+    TEXT_FAST_PATH_MAX_VISUAL_RATIO = float(os.getenv("TEXT_FAST_PATH_MAX_VISUAL_RATIO", "0.15"))  # 圖片與繪圖面積比例上限
+
+    # 自適應頁面解析度 - 依內容密度選擇送給視覺模型的圖片高度（px）
+    PAGE_RESOLUTION_ADAPTIVE = os.getenv("PAGE_RESOLUTION_ADAPTIVE", "true").lower() == "true"
+    PAGE_RESOLUTION_HEIGHTS = os.getenv("PAGE_RESOLUTION_HEIGHTS", "512,768,1056")  # 低 / 中 / 高
+    PAGE_RESOLUTION_BASELINE = int(os.getenv("PAGE_RESOLUTION_BASELINE", "1056"))  # 固定解析度（Zerox 預設），用於估算節省
+    PAGE_RESOLUTION_LOW_DENSITY = float(os.getenv("PAGE_RESOLUTION_LOW_DENSITY", "0.15"))  # 密度低於此值使用低解析度
+    PAGE_RESOLUTION_HIGH_DENSITY = float(os.getenv("PAGE_RESOLUTION_HIGH_DENSITY", "0.5"))  # 密度達到此值使用高解析度
+    PAGE_RESOLUTION_LOW_FIRST = os.getenv("PAGE_RESOLUTION_LOW_FIRST", "false").lower() == "true"  # 先低解析度，信心不足再提高
+
     # AWS Bedrock 設定 - 從 .env 讀取
     AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", "")
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "")
@@ -49,6 +78,77 @@ class Config:
     # 向量檢索設定
     EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "3072"))  # text-embedding-3-large
 
+    # 兩階段搜尋：以縮減維度檢索較多候選，再以完整維度向量重新評分（需要文件向量快取）
+    EMBEDDING_RESCORE_ENABLED = os.getenv("EMBEDDING_RESCORE_ENABLED", "false").lower() == "true"
+    EMBEDDING_RESCORE_CANDIDATES = int(os.getenv("EMBEDDING_RESCORE_CANDIDATES", "4"))  # 候選數 = top_k x 倍數
+
+    # 集合狀態快取（是否存在、點數），背景任務定期更新
+    COLLECTION_STATE_TTL = float(os.getenv("COLLECTION_STATE_TTL", "30"))  # 秒
+    COLLECTION_STATE_REFRESH_INTERVAL = float(os.getenv("COLLECTION_STATE_REFRESH_INTERVAL", "15"))  # 秒
+
+    # 批量查詢設定（/query/batch）
+    BATCH_QUERY_MAX_QUESTIONS = int(os.getenv("BATCH_QUERY_MAX_QUESTIONS", "50"))
+    BATCH_QUERY_MAX_CONCURRENCY = int(os.getenv("BATCH_QUERY_MAX_CONCURRENCY", "4"))  # 同時進行的 LLM 呼叫上限
+
+    # 父段落快取設定（條目數為0時停用）
+    PARENT_CACHE_MAX_ENTRIES = int(os.getenv("PARENT_CACHE_MAX_ENTRIES", "2048"))
+    PARENT_CACHE_MAX_BYTES = int(os.getenv("PARENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    PARENT_CACHE_TTL = float(os.getenv("PARENT_CACHE_TTL", "3600"))  # 秒
+
+    # 集合資料版本（寫入新資料後使父段落快取與回答快取失效）- 存放在所有工作進程共用的目錄
+    CACHE_GENERATION_DIR = os.getenv("CACHE_GENERATION_DIR", "outputs/cache/generations")
+    CACHE_GENERATION_CHECK_INTERVAL = float(os.getenv("CACHE_GENERATION_CHECK_INTERVAL", "2"))  # 秒
+
+    # 上下文打包 - 依相關性放入父段落直到 token 預算，略過與已放入段落高度重疊的父段落
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 為不限制
+    CONTEXT_OVERLAP_THRESHOLD = float(os.getenv("CONTEXT_OVERLAP_THRESHOLD", "0.8"))
+
+    # 語意回答快取 - 查詢向量相似度超過門檻時直接返回先前的回答，集合寫入新資料後失效
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # 最低餘弦相似度
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # 秒
+
+    # 查詢向量快取設定（路徑留空時只使用記憶體層）
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+    QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+    # 文件向量持久快取（以段落內容哈希為鍵，路徑留空時停用）
+    DOCUMENT_EMBEDDING_CACHE_PATH = os.getenv("DOCUMENT_EMBEDDING_CACHE_PATH", "outputs/cache/document_embeddings.sqlite")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+    # 查詢嵌入微批次（同時進行的請求合併為單次API呼叫）
+    EMBEDDING_BATCHER_ENABLED = os.getenv("EMBEDDING_BATCHER_ENABLED", "true").lower() == "true"
+    EMBEDDING_BATCHER_WINDOW_MS = float(os.getenv("EMBEDDING_BATCHER_WINDOW_MS", "5"))
+    EMBEDDING_BATCHER_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCHER_MAX_ITEMS", "64"))
+    EMBEDDING_BATCHER_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_BATCHER_MAX_IN_FLIGHT", "4"))  # 同時進行的批量呼叫上限
+
+    # 混合檢索設定（向量 + jieba BM25，以 RRF 融合）
+    HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", "outputs/bm25")
+    RRF_K = int(os.getenv("RRF_K", "60"))
+
+    # 跨集合聯合檢索 - 逗號分隔的集合名稱，可使用萬用字元（例如 pdf_*）；留空時只檢索 QDRANT_COLLECTION_NAME
+    FEDERATED_COLLECTIONS = os.getenv("FEDERATED_COLLECTIONS", "")
+    FEDERATED_TIMEOUT = float(os.getenv("FEDERATED_TIMEOUT", "3.0"))  # 單一集合的檢索逾時秒數
+    FEDERATED_MAX_COLLECTIONS = int(os.getenv("FEDERATED_MAX_COLLECTIONS", "20"))
+    FEDERATED_REFRESH_INTERVAL = float(os.getenv("FEDERATED_REFRESH_INTERVAL", "60"))  # 重新比對集合的間隔秒數
+
+    # 最大邊際相關性（MMR）多樣化 - 避免重複範本頁面的子段落佔滿上下文
+    MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1 為只看相關性，0 為只看多樣性
+    MMR_FETCH_MULTIPLIER = int(os.getenv("MMR_FETCH_MULTIPLIER", "2"))  # 候選數 = 子段落數 x 倍數
+    MMR_MAX_PER_FILE = int(os.getenv("MMR_MAX_PER_FILE", "0"))  # 同一檔案最多子段落數（0 為不限制）
+    MMR_MAX_PER_PAGE = int(os.getenv("MMR_MAX_PER_PAGE", "2"))  # 同一頁面最多子段落數（0 為不限制）
+
+    # 本地向量副本（記憶體映射的 NumPy 矩陣，從子段落集合同步）
+    LOCAL_VECTOR_INDEX_ENABLED = os.getenv("LOCAL_VECTOR_INDEX_ENABLED", "false").lower() == "true"
+    LOCAL_VECTOR_INDEX_DIR = os.getenv("LOCAL_VECTOR_INDEX_DIR", "outputs/vector_index")
+
+    # 向量量化設定（none / int8 / binary），量化向量過採樣後以原始向量重新評分
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+    QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))
+
     # Chain 設定
     CHAIN_TYPE = os.getenv("CHAIN_TYPE", "stuff")  # stuff, map_reduce, refine, map_rerank
     RETURN_SOURCE_DOCUMENTS = os.getenv("RETURN_SOURCE_DOCUMENTS", "true").lower() == "true"
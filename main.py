@@ -29,7 +29,11 @@ from langchain.memory import ConversationSummaryBufferMemory
 from langchain.schema import BaseMessage, HumanMessage, AIMessage
 from langchain_openai import ChatOpenAI
 
-from src.core.langchain_rag_system import LangChainParentChildRAG
+from src.core.langchain_rag_system import get_rag_system, get_rag_registry_stats, release_collection
+from src.core.embedding_batcher import get_embedding_batcher_stats
+from src.core.collection_monitor import refresh_all_monitors
+from src.core.retrieval_filters import RetrievalFilter
+from src.core.federated_retrieval import build_federated_retriever
 from config.config import Config
 from src.processors.pdf_processor import PDFProcessor
 from src.processors.file_converter import FileConverter
@@ -40,20 +44,51 @@ logger = logging.getLogger(__name__)
 
 # 全域變數
 rag_system = None
+federated_retriever = None  # 設定 FEDERATED_COLLECTIONS 時跨集合檢索
 memory_manager = None
 persistent_session_id = None  # 全域持續會話ID
 
 # 圖片目錄路徑
 IMAGES_DIR = "outputs/images/zerox_output"
 
+async def refresh_collection_state_periodically():
+    """背景定期更新集合狀態快取，請求路徑只讀取快取"""
+    while True:
+        await asyncio.sleep(Config.COLLECTION_STATE_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(refresh_all_monitors)
+        except Exception as e:
+            logger.warning(f"背景更新集合狀態失敗: {e}")
+
+async def refresh_federated_collections_periodically():
+    """背景定期重新比對聯合檢索的集合，啟動後新增或刪除的集合不需重啟服務"""
+    while True:
+        await asyncio.sleep(Config.FEDERATED_REFRESH_INTERVAL)
+        if federated_retriever is None:
+            continue
+        try:
+            await asyncio.to_thread(federated_retriever.refresh_collections)
+        except Exception as e:
+            logger.warning(f"背景更新聯合檢索集合失敗: {e}")
+
+def log_collection_check_result(task: asyncio.Task):
+    """背景集合檢查完成時的回呼 - 檢查失敗不會中斷服務，但必須留下錯誤記錄"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(f"主要集合檢查失敗，查詢與上傳可能無法使用: {error}")
+    else:
+        logger.info("主要集合檢查完成")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """應用生命週期管理"""
     # 啟動時初始化
-    global rag_system, memory_manager
+    global rag_system, federated_retriever, memory_manager
     try:
         logger.info("正在初始化 LangChain Parent-Child RAG 系統...")
-        rag_system = LangChainParentChildRAG(Config.QDRANT_COLLECTION_NAME)
+        rag_system = get_rag_system(Config.QDRANT_COLLECTION_NAME)
 
         logger.info("LANGCHAIN RAG 系統初始化完成")
         logger.info(f"  系統類型: {rag_system.get_system_info()['system_type']}")
@@ -61,6 +96,12 @@ async def lifespan(app: FastAPI):
             logger.info(f"  子段落集合: {rag_system.child_collection_name}")
             logger.info(f"  父段落集合: {rag_system.parent_collection_name}")
 
+        # 跨集合聯合檢索（可選）- 初始化失敗時只使用主要集合
+        try:
+            federated_retriever = build_federated_retriever(rag_system)
+        except Exception as e:
+            logger.warning(f"聯合檢索初始化失敗，只檢索 {rag_system.collection_name}: {e}")
+
         # 初始化記憶管理器
         memory_manager = MemoryManager()
         logger.info("記憶管理器初始化完成")
@@ -75,9 +116,18 @@ async def lifespan(app: FastAPI):
         logger.error(f"系統初始化失敗: {e}")
         raise
 
+    collection_state_task = asyncio.create_task(refresh_collection_state_periodically())
+    federated_refresh_task = asyncio.create_task(refresh_federated_collections_periodically())
+    # 主要集合的存在、維度與 payload 索引檢查在背景進行，不延遲啟動；失敗時記錄錯誤
+    collection_check_task = asyncio.create_task(asyncio.to_thread(rag_system._ensure_collections))
+    collection_check_task.add_done_callback(log_collection_check_result)
+
     yield
 
     # 關閉時清理（如果需要）
+    collection_state_task.cancel()
+    federated_refresh_task.cancel()
+    collection_check_task.cancel()
     logger.info("應用關閉")
 
 # 初始化 FastAPI 應用
@@ -238,10 +288,35 @@ class MemoryManager:
 # Pydantic 模型
 
 
+class RetrievalFilters(BaseModel):
+    """檢索過濾條件（同一欄位內為 OR，不同欄位之間為 AND）"""
+    source_filenames: List[str] = []
+    topics: List[str] = []
+    content_types: List[str] = []
+    page_nums: List[int] = []
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+    def to_filter(self) -> RetrievalFilter:
+        return RetrievalFilter(**self.model_dump())
+
+def to_retrieval_filter(filters: Optional[RetrievalFilters]) -> Optional[RetrievalFilter]:
+    """請求中的過濾條件轉為檢索用的 RetrievalFilter"""
+    return filters.to_filter() if filters is not None else None
+
 class FlowiseRequest(BaseModel):
     """Flowise 查詢請求模型"""
     question: str
     chatId: str
+    filters: Optional[RetrievalFilters] = None
+    bypass_cache: bool = False  # 略過語意回答快取，強制重新生成
+
+class BatchQueryRequest(BaseModel):
+    """批量查詢請求模型"""
+    questions: List[str]
+    chatId: str
+    top_k: int = 10
+    filters: Optional[RetrievalFilters] = None
 
 class NewChatRequest(BaseModel):
     """新的聊天請求模型"""
@@ -249,6 +324,7 @@ class NewChatRequest(BaseModel):
     streaming: bool = False
     sessionId: Optional[str] = None  # 可選，如果不提供則自動生成
     use_persistent_session: bool = True  # 是否使用持續會話記憶
+    filters: Optional[RetrievalFilters] = None  # 可選的檢索過濾（來源檔名、頁碼、主題、內容類型）
 
 class FlowiseResponse(BaseModel):
     """Flowise 查詢回應模型"""
@@ -258,6 +334,11 @@ class FlowiseResponse(BaseModel):
     sessionId: str
     chatMessageId: str
 
+class BatchQueryResponse(BaseModel):
+    """批量查詢回應模型"""
+    results: List[FlowiseResponse]
+    processing_time: float
+
 class NewChatResponse(BaseModel):
     """新的聊天回應模型"""
     text: str
@@ -310,6 +391,7 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = None
     use_rag: bool = True
     top_k: int = 3
+    filters: Optional[RetrievalFilters] = None
 
 class TestFolderRequest(BaseModel):
     """資料夾測試請求模型"""
@@ -386,6 +468,35 @@ def get_image_url(image_path: str) -> Optional[str]:
 
     return image_url
 
+def get_retriever():
+    """聊天與查詢端點使用的檢索器 - 設定聯合檢索時跨集合檢索，否則為主要 RAG 系統"""
+    return federated_retriever or rag_system
+
+def result_image_urls(result) -> List[str]:
+    """檢索結果父段落的圖片 URL"""
+    if not (result.parent_chunk.has_images and result.parent_chunk.image_paths):
+        return []
+    return [url for url in (get_image_url(path) for path in result.parent_chunk.image_paths) if url]
+
+def rag_context_header(result) -> str:
+    return f"【{result.parent_chunk.topic}】\n"
+
+def rag_context_footer(result) -> str:
+    image_urls = result_image_urls(result)
+    return "\n\n相關圖片：\n" + "\n".join(image_urls) if image_urls else ""
+
+def build_rag_context(retrieval_results, image_urls: List[str]) -> str:
+    """
+    以共用的上下文打包器組合聊天端點的 RAG 上下文（與 generate_answer 相同的 token 預算）
+    放入上下文的段落圖片加入 image_urls（最多3張）
+    """
+    packed = rag_system.pack_context(retrieval_results, header=rag_context_header, footer=rag_context_footer)
+    for result in packed.results:
+        for image_url in result_image_urls(result):
+            if image_url not in image_urls and len(image_urls) < 3:
+                image_urls.append(image_url)
+    return packed.text
+
 def format_answer_with_images(answer: str) -> str:
     """將回答中的圖片 URL 轉換為實際的圖片顯示"""
     import re
@@ -436,7 +547,6 @@ async def stream_chat_response(request: NewChatRequest):
     """串流聊天回應生成器"""
     try:
         import uuid
-        from openai import OpenAI
 
         logger.info(f"開始串流回應: {request.user_query} (sessionId: {request.sessionId}, persistent: {request.use_persistent_session})")
 
@@ -462,40 +572,20 @@ async def stream_chat_response(request: NewChatRequest):
 
         # 檢索相關內容 (預設啟用RAG)
         # 檢查 Qdrant 集合是否有資料，而不是檢查本地 chunks
-        if rag_system.has_vector_data():
+        if get_retriever().has_vector_data():
             try:
                 # 檢索相關文件段落 - 增加檢索數量以確保有足夠圖片
-                retrieval_results = rag_system.retrieve_relevant_chunks(
+                retrieval_results = await get_retriever().aretrieve_relevant_chunks(
                     query=request.user_query,
-                    top_k=10  # 增加檢索數量以確保有足夠圖片
+                    top_k=10,  # 增加檢索數量以確保有足夠圖片
+                    filters=to_retrieval_filter(request.filters)
                 )
 
                 if retrieval_results:
                     rag_used = True
 
-                    # 準備RAG上下文
-                    rag_context_parts = []
-                    for result in retrieval_results:
-                        context_part = f"【{result.parent_chunk.topic}】\n{result.parent_chunk.content}"
-
-                        # 添加相關圖片
-                        if result.parent_chunk.has_images and result.parent_chunk.image_paths:
-                            current_image_urls = []
-                            for image_path in result.parent_chunk.image_paths:
-                                # 使用統一的 URL 生成函數
-                                image_url = get_image_url(image_path)
-                                if image_url:
-                                    current_image_urls.append(image_url)
-                                    # 添加到全局圖片URL列表（最多3張）
-                                    if image_url not in image_urls and len(image_urls) < 3:
-                                        image_urls.append(image_url)
-
-                            if current_image_urls:
-                                context_part += f"\n\n相關圖片：\n" + "\n".join(current_image_urls)
-
-                        rag_context_parts.append(context_part)
-
-                    rag_context = "\n\n".join(rag_context_parts)
+                    # 準備RAG上下文（在 token 預算內依相關性打包父段落）
+                    rag_context = build_rag_context(retrieval_results, image_urls)
 
                     # 添加RAG上下文到對話
                     rag_message = f"""基於以下教材內容回答問題：
@@ -534,10 +624,8 @@ async def stream_chat_response(request: NewChatRequest):
 
         temp_messages = [system_message, current_question]
 
-        # 調用OpenAI API生成串流回應
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-
-        stream = client.chat.completions.create(
+        # 調用OpenAI API生成串流回應（非同步客戶端，等待 LLM 時不阻塞其他請求）
+        stream = await rag_system.async_openai_client.chat.completions.create(
             model=Config.OPENAI_MODEL,
             messages=temp_messages,
             max_tokens=Config.MAX_TOKENS,
@@ -549,7 +637,7 @@ async def stream_chat_response(request: NewChatRequest):
         full_response = ""
 
         # 串流輸出
-        for chunk in stream:
+        async for chunk in stream:
             if chunk.choices[0].delta.content is not None:
                 content = chunk.choices[0].delta.content
                 full_response += content
@@ -599,7 +687,9 @@ async def get_current_collection():
             "current_collection": rag_system.collection_name,
             "qdrant_url": rag_system.qdrant_url,
             "collection_info": collection_info,
-            "has_vector_data": rag_system.has_vector_data()
+            "has_vector_data": rag_system.has_vector_data(),
+            "federated_retrieval": federated_retriever.stats() if federated_retriever else {"enabled": False},
+            "shared_instances": get_rag_registry_stats()
         }
     except Exception as e:
         logger.error(f"獲取當前集合資訊失敗: {e}")
@@ -712,14 +802,8 @@ async def health_check():
                 images_available=0
             )
 
-        # 檢查 Qdrant 連線
-        qdrant_connected = True
-        try:
-            # 嘗試獲取集合資訊
-            collection_info = rag_system.qdrant_client.get_collection(rag_system.collection_name)
-            qdrant_connected = True
-        except Exception:
-            qdrant_connected = False
+        # 檢查 Qdrant 連線（讀取背景更新的集合狀態，不在請求中呼叫 Qdrant）
+        qdrant_connected = rag_system.collection_monitor.connected
 
         # 統計圖片數量
         images_count = 0
@@ -727,15 +811,7 @@ async def health_check():
             images_count = len([f for f in os.listdir(IMAGES_DIR) if f.endswith(('.png', '.jpg', '.jpeg'))])
 
         # 檢查向量資料庫中的資料量
-        chunks_loaded = 0
-        if qdrant_connected and rag_system.has_vector_data():
-            try:
-                # 獲取子段落集合的資料量
-                child_info = rag_system.qdrant_client.get_collection(rag_system.child_collection_name)
-                chunks_loaded = child_info.vectors_count or child_info.points_count or 0
-            except Exception as e:
-                logger.warning(f"無法獲取向量資料量: {e}")
-                chunks_loaded = 0
+        chunks_loaded = rag_system.get_chunks_count() if qdrant_connected else 0
 
         return HealthResponse(
             status="healthy" if qdrant_connected else "degraded",
@@ -755,6 +831,21 @@ async def health_check():
 
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """檢索快取統計端點"""
+    if rag_system is None:
+        raise HTTPException(status_code=500, detail="RAG系統未初始化")
+
+    system_info = rag_system.get_system_info()
+    return {
+        "parent_cache": system_info.get("parent_cache", {}),
+        "query_embedding_cache": system_info.get("query_embedding_cache", {}),
+        "answer_cache": system_info.get("answer_cache", {}),
+        # 進程內所有批次器（以嵌入模型與維度區分，所有集合共用）
+        "embedding_batcher": get_embedding_batcher_stats() or {"enabled": False}
+    }
+
 @app.post("/query", response_model=FlowiseResponse)
 async def query_rag(request: FlowiseRequest):
     """RAG 查詢端點"""
@@ -762,57 +853,104 @@ async def query_rag(request: FlowiseRequest):
         raise HTTPException(status_code=500, detail="RAG 系統未初始化")
 
     try:
-        import time
-        import uuid
-
         logger.info(f"收到查詢: {request.question} (chatId: {request.chatId})")
 
         # 使用 Parent-Child RAG 系統生成回答
-        response = rag_system.generate_answer(
+        response = await get_retriever().agenerate_answer(
             query=request.question,
-            top_k=10  # 增加檢索數量以確保有足夠圖片
+            top_k=10,  # 增加檢索數量以確保有足夠圖片
+            filters=to_retrieval_filter(request.filters),
+            use_cache=not request.bypass_cache
         )
 
-        # 收集最多三張圖片 URL
-        image_urls = []
-        seen_urls = set()
-        for source in response.get("sources", []):
-            if source.get("has_images", False) and source.get("image_paths"):
-                for image_path in source["image_paths"]:
-                    image_url = get_image_url(image_path)
-                    if image_url and image_url not in seen_urls:
-                        image_urls.append(image_url)
-                        seen_urls.add(image_url)
-                        if len(image_urls) >= 3:  # 最多收集3張圖片
-                            break
-            if len(image_urls) >= 3:  # 如果已經收集到3張圖片，停止搜索
-                break
-
-        # 準備回應，將圖片 URL 作為單獨字段返回
-        answer = response["answer"]
-
-        # 可選：仍然在文本中添加圖片 URL 以保持向後兼容
-        if image_urls:
-            answer += "\n\n📷 相關圖片："
-            for i, url in enumerate(image_urls, 1):
-                answer += f"\n{i}. {url}"
-
-        # 生成唯一的 sessionId 和 chatMessageId
-        session_id = f"session_{request.chatId}_{int(time.time())}"
-        chat_message_id = str(uuid.uuid4())
-
-        return FlowiseResponse(
-            text=answer,  # 只返回純文字，不進行HTML轉換
-            question=request.question,
-            chatId=request.chatId,
-            sessionId=session_id,
-            chatMessageId=chat_message_id
-        )
+        return build_flowise_response(request.question, request.chatId, response)
 
     except Exception as e:
         logger.error(f"查詢處理失敗: {e}")
         raise HTTPException(status_code=500, detail=f"查詢處理失敗: {str(e)}")
 
+def build_flowise_response(question: str, chat_id: str, response: Dict[str, Any]) -> FlowiseResponse:
+    """將 generate_answer 的結果轉為 Flowise 回應（附上最多三張圖片 URL）"""
+    # 收集最多三張圖片 URL
+    image_urls = []
+    seen_urls = set()
+    for source in response.get("sources", []):
+        if source.get("has_images", False) and source.get("image_paths"):
+            for image_path in source["image_paths"]:
+                image_url = get_image_url(image_path)
+                if image_url and image_url not in seen_urls:
+                    image_urls.append(image_url)
+                    seen_urls.add(image_url)
+                    if len(image_urls) >= 3:  # 最多收集3張圖片
+                        break
+        if len(image_urls) >= 3:  # 如果已經收集到3張圖片，停止搜索
+            break
+
+    # 準備回應，將圖片 URL 作為單獨字段返回
+    answer = response["answer"]
+
+    # 可選：仍然在文本中添加圖片 URL 以保持向後兼容
+    if image_urls:
+        answer += "\n\n📷 相關圖片："
+        for i, url in enumerate(image_urls, 1):
+            answer += f"\n{i}. {url}"
+
+    # 生成唯一的 sessionId 和 chatMessageId
+    session_id = f"session_{chat_id}_{int(time.time())}"
+    chat_message_id = str(uuid.uuid4())
+
+    return FlowiseResponse(
+        text=answer,  # 只返回純文字，不進行HTML轉換
+        question=question,
+        chatId=chat_id,
+        sessionId=session_id,
+        chatMessageId=chat_message_id
+    )
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    批量 RAG 查詢端點
+
+    所有問題以單次嵌入呼叫完成嵌入（單一集合時再以單次 Qdrant batch 查詢完成檢索），
+    設定聯合檢索時與 /query 相同跨集合檢索；LLM 生成在 BATCH_QUERY_MAX_CONCURRENCY 的並發上限內同時進行
+    """
+    if rag_system is None:
+        raise HTTPException(status_code=500, detail="RAG 系統未初始化")
+
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="questions 不可為空")
+
+    if len(request.questions) > Config.BATCH_QUERY_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"單次最多 {Config.BATCH_QUERY_MAX_QUESTIONS} 個問題，收到 {len(request.questions)} 個"
+        )
+
+    try:
+        start_time = time.time()
+        logger.info(f"收到批量查詢: {len(request.questions)} 個問題 (chatId: {request.chatId})")
+
+        responses = await get_retriever().agenerate_many(
+            request.questions,
+            top_k=request.top_k,
+            max_concurrency=Config.BATCH_QUERY_MAX_CONCURRENCY,
+            filters=to_retrieval_filter(request.filters)
+        )
+
+        results = [
+            build_flowise_response(question, request.chatId, response)
+            for question, response in zip(request.questions, responses)
+        ]
+        processing_time = time.time() - start_time
+        logger.info(f"批量查詢完成: {len(results)} 個回答，耗時 {processing_time:.2f} 秒")
+
+        return BatchQueryResponse(results=results, processing_time=processing_time)
+
+    except Exception as e:
+        logger.error(f"批量查詢處理失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"批量查詢處理失敗: {str(e)}")
+
 @app.post("/query-with-memory")
 async def query_flowise_with_memory(request: NewChatRequest):
     """
@@ -872,40 +1010,20 @@ async def query_flowise_with_memory(request: NewChatRequest):
         image_urls = []
 
         # 檢索相關內容 (預設啟用RAG)
-        if rag_system.has_vector_data():
+        if get_retriever().has_vector_data():
             try:
                 # 檢索相關文件段落
-                retrieval_results = rag_system.retrieve_relevant_chunks(
+                retrieval_results = await get_retriever().aretrieve_relevant_chunks(
                     query=request.user_query,
-                    top_k=3  # 預設使用3個相關文件
+                    top_k=3,  # 預設使用3個相關文件
+                    filters=to_retrieval_filter(request.filters)
                 )
 
                 if retrieval_results:
                     rag_used = True
 
-                    # 準備RAG上下文
-                    rag_context_parts = []
-                    for result in retrieval_results:
-                        context_part = f"【{result.parent_chunk.topic}】\n{result.parent_chunk.content}"
-
-                        # 添加相關圖片
-                        if result.parent_chunk.has_images and result.parent_chunk.image_paths:
-                            current_image_urls = []
-                            for image_path in result.parent_chunk.image_paths:
-                                # 使用統一的 URL 生成函數
-                                image_url = get_image_url(image_path)
-                                if image_url:
-                                    current_image_urls.append(image_url)
-                                    # 添加到全局圖片URL列表（最多3張）
-                                    if image_url not in image_urls and len(image_urls) < 3:
-                                        image_urls.append(image_url)
-
-                            if current_image_urls:
-                                context_part += f"\n\n相關圖片：\n" + "\n".join(current_image_urls)
-
-                        rag_context_parts.append(context_part)
-
-                    rag_context = "\n\n".join(rag_context_parts)
+                    # 準備RAG上下文（在 token 預算內依相關性打包父段落）
+                    rag_context = build_rag_context(retrieval_results, image_urls)
 
                     # 添加RAG上下文到對話
                     rag_message = f"""基於以下教材內容回答問題：
@@ -986,11 +1104,8 @@ async def query_flowise_with_memory(request: NewChatRequest):
             # 如果沒有RAG內容，直接使用原始問題
             temp_messages.append({"role": "user", "content": request.user_query})
 
-        # 調用OpenAI API生成回應
-        from openai import OpenAI
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-
-        completion = client.chat.completions.create(
+        # 調用OpenAI API生成回應（非同步客戶端）
+        completion = await rag_system.async_openai_client.chat.completions.create(
             model=Config.OPENAI_MODEL,
             messages=temp_messages,
             max_tokens=Config.MAX_TOKENS,
@@ -1180,25 +1295,25 @@ async def process_file(
 
         if not chunks:
             raise HTTPException(status_code=400, detail="PDF處理失敗，未能提取到任何內容")
+        if pdf_processor.failed_pages:
+            errors.append(f"{len(pdf_processor.failed_pages)} 個頁面處理失敗，未包含在結果中: {pdf_processor.failed_pages}")
 
         # 統計圖片數量
         images_count = len([c for c in chunks if hasattr(c, 'has_images') and c.has_images])
 
         # 初始化 RAG 系統
         target_collection = collection_name or f"pdf_{int(time.time())}"
-        rag_system_temp = LangChainParentChildRAG(target_collection)
+        rag_system_temp = get_rag_system(target_collection)
         logger.info("使用 LangChain Parent-Child 策略處理段落...")
         result = rag_system_temp.add_documents_from_zerox(chunks)
 
         if not result["success"]:
             raise HTTPException(status_code=500, detail="Parent-Child 處理失敗")
 
-        # 更新全域RAG系統（如果使用預設集合名稱）
-        global rag_system
-        if target_collection == rag_system.collection_name:
-            # 重新初始化全域 RAG 系統以載入新數據
-            rag_system = LangChainParentChildRAG(target_collection)
-            logger.info("已更新全域 LangChain RAG 系統")
+        # 共用實例在寫入時已更新快取與索引，寫入預設集合時不需重新建立全域 RAG 系統
+        if federated_retriever is not None and federated_retriever.matches(target_collection):
+            # 新上傳的集合立即加入聯合檢索
+            federated_retriever.add_system(rag_system_temp)
 
         processing_time = time.time() - start_time
 
@@ -1311,6 +1426,12 @@ async def delete_collection(collection_name: str):
 
         # 刪除集合
         rag_system.qdrant_client.delete_collection(collection_name)
+        rag_system.collection_monitor.set_state(collection_name, exists=False, points_count=0)
+        if collection_name in (rag_system.child_collection_name, rag_system.docstore.collection_name):
+            # 使父段落與語意回答快取失效
+            rag_system.docstore.bump_generation()
+        # 清除依附於集合的本地索引，避免已刪除的集合仍回答查詢
+        release_collection(collection_name)
 
         logger.info(f"已刪除集合: {collection_name}")
         return {"message": f"成功刪除集合 '{collection_name}'"}
@@ -1452,40 +1573,20 @@ async def chat_with_memory(request: ChatRequest):
         image_urls = []
 
         # 如果啟用RAG，檢索相關內容
-        if request.use_rag and rag_system.has_vector_data():
+        if request.use_rag and get_retriever().has_vector_data():
             try:
                 # 檢索相關文件段落
-                retrieval_results = rag_system.retrieve_relevant_chunks(
+                retrieval_results = await get_retriever().aretrieve_relevant_chunks(
                     query=request.message,
-                    top_k=request.top_k
+                    top_k=request.top_k,
+                    filters=to_retrieval_filter(request.filters)
                 )
 
                 if retrieval_results:
                     rag_used = True
 
-                    # 準備RAG上下文
-                    rag_context_parts = []
-                    for result in retrieval_results:
-                        context_part = f"【{result.parent_chunk.topic}】\n{result.parent_chunk.content}"
-
-                        # 添加相關圖片
-                        if result.parent_chunk.has_images and result.parent_chunk.image_paths:
-                            current_image_urls = []
-                            for image_path in result.parent_chunk.image_paths:
-                                # 使用統一的 URL 生成函數
-                                image_url = get_image_url(image_path)
-                                if image_url:
-                                    current_image_urls.append(image_url)
-                                    # 添加到全局圖片URL列表（最多3張）
-                                    if image_url not in image_urls and len(image_urls) < 3:
-                                        image_urls.append(image_url)
-
-                            if current_image_urls:
-                                context_part += f"\n\n相關圖片：\n" + "\n".join(current_image_urls)
-
-                        rag_context_parts.append(context_part)
-
-                    rag_context = "\n\n".join(rag_context_parts)
+                    # 準備RAG上下文（在 token 預算內依相關性打包父段落）
+                    rag_context = build_rag_context(retrieval_results, image_urls)
 
                     # 添加RAG上下文到對話
                     rag_message = f"""基於以下教材內容回答問題：
@@ -1578,11 +1679,8 @@ async def chat_with_memory(request: ChatRequest):
             # 不使用RAG，直接對話
             temp_messages = messages
 
-        # 調用OpenAI API生成回應
-        from openai import OpenAI
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-
-        completion = client.chat.completions.create(
+        # 調用OpenAI API生成回應（非同步客戶端）
+        completion = await rag_system.async_openai_client.chat.completions.create(
             model=Config.OPENAI_MODEL,
             messages=temp_messages,
             max_tokens=Config.MAX_TOKENS,
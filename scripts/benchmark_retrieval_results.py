@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+檢索結果物件的微基準測試
+比較原本每次存取 child_chunk / parent_chunk 都以 type(...) 建立新類別的做法，
+與建立結果時組合一次的 __slots__ 檢視物件：每個請求的 CPU 時間與記憶體配置
+"""
+
+import sys
+import argparse
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List
+
+# 添加項目根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from langchain.schema import Document
+
+from src.core.langchain_rag_system import LangChainRetrievalResult
+
+
+@dataclass
+class LegacyRetrievalResult:
+    """原本的檢索結果實作（每次存取屬性都建立新類別）"""
+    document: Document
+    similarity_score: float
+    relevance_reason: str
+    parent_content: str
+    child_content: str
+
+    @property
+    def child_chunk(self):
+        return type('ChildChunk', (), {
+            'content': self.child_content,
+            'topic': self.document.metadata.get('topic', ''),
+            'sub_topic': self.document.metadata.get('sub_topic', ''),
+            'page_num': self.document.metadata.get('page_num', 0),
+            'keywords': self.document.metadata.get('keywords', []),
+            'has_images': self.document.metadata.get('has_images', False),
+            'image_path': self.document.metadata.get('image_path', ''),
+            'content_type': self.document.metadata.get('content_type', '未指定'),
+            'source_filename': self.document.metadata.get('source_filename', '')
+        })()
+
+    @property
+    def parent_chunk(self):
+        return type('ParentChunk', (), {
+            'content': self.parent_content,
+            'topic': self.document.metadata.get('topic', ''),
+            'page_range': (self.document.metadata.get('page_num', 0), self.document.metadata.get('page_num', 0)),
+            'has_images': self.document.metadata.get('has_images', False),
+            'image_paths': [self.document.metadata.get('image_path', '')] if self.document.metadata.get('image_path') else [],
+            'content_type': self.document.metadata.get('content_type', '未指定'),
+            'source_filename': self.document.metadata.get('source_filename', '')
+        })()
+
+
+def make_documents(count: int) -> List[Document]:
+    return [
+        Document(
+            page_content=f"子段落 {i} " * 40,
+            metadata={
+                "page_num": i, "topic": f"主題{i % 3}", "sub_topic": "子主題", "content_type": "diagram",
+                "keywords": ["線位圖", "料號"], "has_images": i % 2 == 0, "image_path": f"images/page_{i}.png",
+                "source_filename": "教材.pdf", "doc_id": f"parent-{i}"
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def handle_request(result_class, documents: List[Document]) -> int:
+    """模擬一個聊天請求：建立結果、組合上下文、圖片與來源資訊（與 main.py 的存取模式相同）"""
+    total = 0
+    results = [result_class(doc, 0.8, "高度相關", doc.page_content * 3, doc.page_content) for doc in documents]
+    for result in results:
+        # 上下文與圖片
+        total += len(result.parent_chunk.topic)
+        if result.parent_chunk.has_images and result.parent_chunk.image_paths:
+            total += len(result.parent_chunk.image_paths)
+        # 來源資訊
+        child_chunk = result.child_chunk
+        parent_chunk = result.parent_chunk
+        total += child_chunk.page_num + len(parent_chunk.topic) + len(child_chunk.sub_topic)
+        total += len(child_chunk.content) + len(child_chunk.content_type) + len(child_chunk.keywords)
+        total += parent_chunk.page_range[0] + int(parent_chunk.has_images)
+        # 檔名
+        total += len(result.child_chunk.source_filename or result.parent_chunk.source_filename)
+    return total
+
+
+def measure(name: str, request: Callable[[], int], iterations: int) -> dict:
+    request()  # 預熱
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        request()
+    cpu_us = (time.perf_counter() - start) / iterations * 1e6
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    request()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+    print(f"{name:<10} {cpu_us:>10.1f} µs/請求  峰值 {peak / 1024:>8.1f} KiB  "
+          f"保留配置 {allocated / 1024:>8.1f} KiB ({blocks} 個區塊)")
+    return {"cpu_us": cpu_us, "peak": peak}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="檢索結果物件微基準測試")
+    parser.add_argument("--results", type=int, default=10, help="每個請求的檢索結果數")
+    parser.add_argument("--iterations", type=int, default=2000)
+
+    args = parser.parse_args()
+    documents = make_documents(args.results)
+
+    print(f"📊 每個請求 {args.results} 個檢索結果，重複 {args.iterations} 次")
+    legacy = measure("原本", lambda: handle_request(LegacyRetrievalResult, documents), args.iterations)
+    slotted = measure("slots", lambda: handle_request(LangChainRetrievalResult, documents), args.iterations)
+    print(f"✅ CPU 時間減少 {(1 - slotted['cpu_us'] / legacy['cpu_us']) * 100:.1f}%，"
+          f"峰值記憶體減少 {(1 - slotted['peak'] / legacy['peak']) * 100:.1f}%")
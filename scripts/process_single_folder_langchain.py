@@ -253,6 +253,8 @@ def process_folder_with_langchain(folder_path: str):
                         processed_files += 1
 
                         print(f"  ✅ 處理完成: {len(chunks)} 個段落, {file_time:.2f}秒")
+                        if processor.failed_pages:
+                            print(f"  ⚠️  {len(processor.failed_pages)} 個頁面處理失敗，未包含在段落中: {processor.failed_pages}")
                     else:
                         print(f"  ❌ 處理失敗: 沒有生成段落")
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+子段落集合的重新嵌入遷移
+以目前的 EMBEDDING_DIMENSION（或 --dimension）重新嵌入所有子段落並重建集合：
+1. 掃描子段落 payload，先備份到 JSON（中途失敗可用 --restore 從備份重建）
+2. 分批重新嵌入（經過文件向量快取，兩階段搜尋時同時保存完整維度向量）
+3. 以新維度重建集合並寫回相同的點ID與 payload（父段落集合不受影響）
+"""
+
+import sys
+import json
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 添加項目根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from qdrant_client.models import PointStruct
+
+from config.config import Config
+
+# 設置日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def scroll_points(client, collection_name: str, batch_size: int = 512) -> List[Dict[str, Any]]:
+    """掃描集合中所有點的ID與 payload"""
+    points, offset = [], None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False
+        )
+        points.extend({"id": point.id, "payload": point.payload or {}} for point in batch)
+        if offset is None:
+            return points
+
+
+def reembed(collection_name: str, backup_dir: str, batch_size: int, restore: bool):
+    """重新嵌入子段落集合"""
+    from src.core.langchain_rag_system import LangChainParentChildRAG
+
+    rag = LangChainParentChildRAG(collection_name)
+    client = rag.qdrant_client
+    child_collection = rag.child_collection_name
+    backup_path = Path(backup_dir) / f"{child_collection}.json"
+
+    if restore:
+        with open(backup_path, "r", encoding="utf-8") as f:
+            points = json.load(f)
+        print(f"📂 從備份載入 {len(points)} 個子段落: {backup_path}")
+    else:
+        points = scroll_points(client, child_collection)
+        backup_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(backup_path, "w", encoding="utf-8") as f:
+            json.dump(points, f, ensure_ascii=False)
+        print(f"💾 已備份 {len(points)} 個子段落: {backup_path}")
+
+    if not points:
+        print("❌ 集合中沒有子段落")
+        return
+
+    # 先完成全部嵌入再重建集合，嵌入失敗時原集合保持不變
+    start_time = time.time()
+    embeddings = rag.vectorstore.embeddings
+    texts = [point["payload"].get("page_content", "") for point in points]
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+        print(f"🔄 已嵌入 {min(start + batch_size, len(texts))}/{len(texts)}")
+
+    client.delete_collection(child_collection)
+    rag._ensure_child_collection()
+    for start in range(0, len(points), batch_size):
+        client.upsert(
+            collection_name=child_collection,
+            points=[
+                PointStruct(id=point["id"], vector=vector, payload=point["payload"])
+                for point, vector in zip(points[start:start + batch_size], vectors[start:start + batch_size])
+            ]
+        )
+
+    rag.collection_monitor.refresh()
+    if rag.local_index is not None:
+        rag.sync_local_index()
+
+    print(f"✅ {child_collection} 已以 {rag.embedding_dimension} 維重建 "
+          f"({len(points)} 個子段落，耗時 {time.time() - start_time:.2f}秒，"
+          f"兩階段重新評分: {'啟用' if rag.two_stage_rescore else '停用'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以新的向量維度重新嵌入子段落集合")
+    parser.add_argument("--collection", default=Config.QDRANT_COLLECTION_NAME)
+    parser.add_argument("--dimension", type=int, help="覆蓋 EMBEDDING_DIMENSION")
+    parser.add_argument("--batch-size", type=int, default=Config.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--backup-dir", default="outputs/migrations")
+    parser.add_argument("--restore", action="store_true", help="從備份 JSON 重建（不重新掃描集合）")
+
+    args = parser.parse_args()
+    if args.dimension:
+        Config.EMBEDDING_DIMENSION = args.dimension
+    reembed(args.collection, args.backup_dir, args.batch_size, args.restore)
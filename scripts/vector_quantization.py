@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+子段落集合的向量量化工具
+- migrate: 將現有集合遷移到 int8 / binary 量化（或關閉量化）
+- benchmark: 比較 float 與量化路徑的 recall@10 與延遲（Qdrant 與本地向量副本）
+"""
+
+import sys
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# 添加項目根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from qdrant_client.models import SearchParams
+
+from src.core.langchain_rag_system import LangChainParentChildRAG
+from src.core.local_vector_index import LocalVectorIndex
+from src.core.quantization import QUANTIZATION_MODES, build_search_params
+from config.config import Config
+
+# 設置日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def migrate(collection_name: str, mode: str):
+    """遷移現有子段落集合的量化模式"""
+    rag = LangChainParentChildRAG(collection_name)
+    result = rag.apply_quantization(mode)
+    print(f"✅ 已更新 {result['collection']} 的量化模式: {result['quantization']}")
+    print("   Qdrant 會在背景重建量化索引，請以 /collections/{name}/count 確認狀態")
+
+
+def sample_query_vectors(rag: LangChainParentChildRAG, num_queries: int) -> List[List[float]]:
+    """從集合中取樣子段落向量作為查詢（不產生嵌入API成本）"""
+    points, _ = rag.qdrant_client.scroll(
+        collection_name=rag.child_collection_name,
+        limit=num_queries,
+        with_payload=False,
+        with_vectors=True
+    )
+    return [point.vector for point in points]
+
+
+def measure(search: Callable[[List[float]], List[str]], queries: List[List[float]],
+            ground_truth: List[List[str]]) -> Dict[str, float]:
+    """計算 recall@10 與延遲統計"""
+    latencies, recalls = [], []
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(found) & set(expected)) / max(1, len(expected)))
+    return {
+        "recall@10": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+
+def benchmark(collection_name: str, num_queries: int, oversampling: float):
+    """比較 float 與量化搜尋的召回率與延遲"""
+    rag = LangChainParentChildRAG(collection_name)
+    client = rag.qdrant_client
+    collection = rag.child_collection_name
+
+    queries = sample_query_vectors(rag, num_queries)
+    if not queries:
+        print("❌ 集合中沒有向量數據")
+        return
+
+    def qdrant_search(params):
+        return lambda vector: [str(point.id) for point in client.query_points(
+            collection_name=collection, query=vector, limit=10, search_params=params, with_payload=False
+        ).points]
+
+    # 以精確（暴力）搜尋作為標準答案
+    ground_truth = [qdrant_search(SearchParams(exact=True))(vector) for vector in queries]
+
+    info = client.get_collection(collection)
+    quantization_config = info.config.quantization_config
+    current_mode = Config.VECTOR_QUANTIZATION
+
+    rows = [
+        ("qdrant float (HNSW)", measure(qdrant_search(build_search_params("none", oversampling, ignore=True)), queries, ground_truth))
+    ]
+    if quantization_config is not None:
+        rows.append((f"qdrant quantized ({type(quantization_config).__name__})",
+                     measure(qdrant_search(build_search_params(current_mode, oversampling)), queries, ground_truth)))
+
+    # 本地副本：同一份 float 矩陣分別以各量化模式搜尋
+    with tempfile.TemporaryDirectory() as temp_dir:
+        float_index = LocalVectorIndex(temp_dir, collection)
+        float_index.sync(client)
+
+        for mode in QUANTIZATION_MODES:
+            index = LocalVectorIndex(temp_dir, collection, quantization=mode, oversampling=oversampling)
+            search = lambda vector, index=index: [index.ids[i] for i, _ in index.search(vector, k=10)]
+            stats = measure(search, queries, ground_truth)
+            stats["memory_mb"] = (index.stats()["quantized_bytes"] or index.stats()["bytes"]) / 1024 / 1024
+            rows.append((f"local {mode}", stats))
+
+    print(f"\n📊 {collection} - {len(queries)} 個查詢，過採樣 {oversampling}x")
+    print(f"{'路徑':<36}{'recall@10':>10}{'p50 ms':>10}{'p95 ms':>10}{'記憶體 MB':>12}")
+    for name, stats in rows:
+        memory = f"{stats['memory_mb']:.1f}" if "memory_mb" in stats else "-"
+        print(f"{name:<36}{stats['recall@10']:>10.3f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{memory:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="子段落集合的向量量化工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="遷移現有集合的量化模式")
+    migrate_parser.add_argument("--collection", default=Config.QDRANT_COLLECTION_NAME)
+    migrate_parser.add_argument("--mode", choices=QUANTIZATION_MODES, required=True)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="比較 float 與量化搜尋")
+    benchmark_parser.add_argument("--collection", default=Config.QDRANT_COLLECTION_NAME)
+    benchmark_parser.add_argument("--queries", type=int, default=100)
+    benchmark_parser.add_argument("--oversampling", type=float, default=Config.QUANTIZATION_OVERSAMPLING)
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args.collection, args.mode)
+    else:
+        benchmark(args.collection, args.queries, args.oversampling)
@@ -0,0 +1,207 @@
+"""
+語意回答快取
+以查詢向量的餘弦相似度比對已回答過的問題，相似度超過門檻時直接返回先前的回答與來源；
+問題中的數字與編號（線號、料號、頁碼等）必須完全相同才會命中，避免只差一個數字的問題共用回答。
+條目在 TTL 到期或集合的資料版本（每次寫入新資料時更新，所有工作進程共用）改變時失效
+"""
+
+import copy
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 含數字的編號（W1、M8、J-12、3.5）與英文縮寫（PLC、CNC）
+SIGNATURE_PATTERN = re.compile(r"(?:[A-Za-z]+[_\-]?)?\d+(?:[.,:/_\-]?[A-Za-z0-9]+)*|(?<![A-Za-z])[A-Z]{2,}(?![A-Za-z])")
+
+
+def query_signature(query: str) -> Tuple[str, ...]:
+    """問題中的數字與編號（不分大小寫、不計順序），回答快取只在簽章相同時命中"""
+    return tuple(sorted({match.upper() for match in SIGNATURE_PATTERN.findall(query or "")}))
+
+
+@dataclass
+class AnswerCacheEntry:
+    """單一快取回答"""
+    query: str
+    answer: Dict[str, Any]
+    generation: Hashable
+    expires_at: float
+    signature: Tuple[str, ...] = ()
+    hits: int = 0
+
+
+class SemanticAnswerCache:
+    """以查詢向量相似度比對的回答快取（執行緒安全）"""
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.95, ttl: float = 3600):
+        """
+        Args:
+            max_entries: 每個分組（集合 + 過濾條件 + top_k）的最大條目數（0 表示停用）
+            threshold: 視為同一問題的最低餘弦相似度
+            ttl: 條目存活秒數（0 表示不過期）
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # 分組 -> (正規化查詢向量矩陣, 條目列表)，矩陣列與條目一一對應
+        self._groups: Dict[Tuple, Tuple[Optional[np.ndarray], List[AnswerCacheEntry]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    @staticmethod
+    def _similarities(matrix: np.ndarray, entries: List[AnswerCacheEntry], vector: np.ndarray,
+                      signature: Tuple[str, ...]) -> np.ndarray:
+        """餘弦相似度，數字與編號不同的條目設為 -1（不會命中）"""
+        similarities = matrix @ vector
+        mismatched = [i for i, entry in enumerate(entries) if entry.signature != signature]
+        similarities[mismatched] = -1.0
+        return similarities
+
+    def lookup(self, group: Tuple, query: str, query_vector, generation: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        查找相似問題的回答，未命中返回 None
+
+        Args:
+            group: 分組鍵值（集合名稱、過濾條件、top_k）
+            query: 問題（用於比對數字與編號）
+            query_vector: 查詢向量
+            generation: 集合目前的資料版本
+        """
+        if not self.enabled:
+            return None
+
+        vector = self._normalize(query_vector)
+        with self._lock:
+            self._purge(group, generation)
+            matrix, entries = self._groups.get(group, (None, []))
+            if matrix is None or matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = self._similarities(matrix, entries, vector, query_signature(query))
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = entries[best]
+            entry.hits += 1
+            self.hits += 1
+            answer = copy.deepcopy(entry.answer)
+
+        answer["cache_hit"] = {"similarity": float(similarities[best]), "cached_query": entry.query}
+        return answer
+
+    def store(self, group: Tuple, query: str, query_vector, generation: Hashable, answer: Dict[str, Any]) -> None:
+        """寫入回答（超過上限時淘汰最早寫入的條目）"""
+        if not self.enabled:
+            return
+
+        vector = self._normalize(query_vector)
+        entry = AnswerCacheEntry(
+            query=query,
+            answer=copy.deepcopy(answer),
+            generation=generation,
+            expires_at=time.monotonic() + self.ttl if self.ttl else 0,
+            signature=query_signature(query)
+        )
+        with self._lock:
+            self._purge(group, generation)
+            matrix, entries = self._groups.get(group, (None, []))
+            if matrix is not None and matrix.shape[1] != vector.shape[0]:
+                matrix, entries = None, []
+
+            # 幾乎相同（且數字與編號相同）的問題覆蓋舊條目，避免重複
+            if matrix is not None:
+                similarities = self._similarities(matrix, entries, vector, entry.signature)
+                duplicate = int(np.argmax(similarities))
+                if similarities[duplicate] >= self.threshold:
+                    entries[duplicate] = entry
+                    matrix[duplicate] = vector
+                    return
+
+            matrix = vector[None, :] if matrix is None else np.vstack([matrix, vector])
+            entries = entries + [entry]
+            overflow = len(entries) - self.max_entries
+            if overflow > 0:
+                matrix, entries = matrix[overflow:], entries[overflow:]
+                self.evictions += overflow
+            self._groups[group] = (matrix, entries)
+
+    def _purge(self, group: Tuple, generation: Hashable) -> None:
+        """移除分組中過期或資料版本不符的條目（呼叫端持有鎖）"""
+        matrix, entries = self._groups.get(group, (None, []))
+        if not entries:
+            return
+        now = time.monotonic()
+        keep = [i for i, entry in enumerate(entries)
+                if entry.generation == generation and not (entry.expires_at and entry.expires_at < now)]
+        if len(keep) == len(entries):
+            return
+
+        self.invalidations += len(entries) - len(keep)
+        if keep:
+            self._groups[group] = (matrix[keep], [entries[i] for i in keep])
+        else:
+            del self._groups[group]
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            self._groups.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取快取統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": sum(len(entries) for _, entries in self._groups.values()),
+                "groups": len(self._groups),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# 進程內共用的回答快取 - 以嵌入模型與維度區分（不同維度的查詢向量不可比較）
+_answer_cache_lock = threading.Lock()
+_answer_caches: Dict[tuple, SemanticAnswerCache] = {}
+
+
+def get_answer_cache(model: str, dimension: int, max_entries: int = 1000, threshold: float = 0.95,
+                     ttl: float = 3600) -> SemanticAnswerCache:
+    """獲取（或建立）指定嵌入模型與維度的共用回答快取"""
+    key = (model, dimension)
+    with _answer_cache_lock:
+        if key not in _answer_caches:
+            _answer_caches[key] = SemanticAnswerCache(max_entries, threshold, ttl)
+        return _answer_caches[key]
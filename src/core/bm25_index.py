@@ -0,0 +1,199 @@
+"""
+子段落 BM25 倒排索引
+使用 jieba 分詞，保留料號、標準代碼等英數字串為完整詞元，可增量更新並持久化為 JSON
+"""
+
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 料號、標準代碼等英數字串（如 AB-1234、CNS-3.5），作為完整詞元保留
+CODE_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-_./]*[a-z0-9]")
+WORD_PATTERN = re.compile(r"\w", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """jieba 搜尋模式分詞 + 英數代碼詞元"""
+    import jieba
+
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    tokens = [token.strip() for token in jieba.lcut_for_search(normalized)]
+    tokens = [token for token in tokens if token and WORD_PATTERN.search(token)]
+    tokens.extend(CODE_PATTERN.findall(normalized))
+    return tokens
+
+
+class BM25Index:
+    """可增量維護的 BM25 倒排索引"""
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: 索引 JSON 檔案路徑（None 時只保存在記憶體）
+            k1: 詞頻飽和參數
+            b: 文件長度正規化參數
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self.documents: Dict[str, Dict[str, Any]] = {}  # doc_id -> {"text", "metadata", "tf", "length"}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: tf}
+        self.total_length = 0
+        self._loaded_mtime = None
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add_documents(self, doc_ids: Iterable[str], texts: Iterable[str],
+                      metadatas: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+        """新增或覆蓋文件（相同ID重新寫入時替換舊的詞元）"""
+        doc_ids = list(doc_ids)
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{}] * len(doc_ids)
+        with self._lock:
+            for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+                self._remove(doc_id)
+                tf = Counter(tokenize(text))
+                length = sum(tf.values())
+                self.documents[doc_id] = {
+                    "text": text,
+                    "metadata": metadata or {},
+                    "tf": dict(tf),
+                    "length": length
+                }
+                self.total_length += length
+                for term, count in tf.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+
+    def remove_documents(self, doc_ids: Iterable[str]) -> None:
+        """刪除文件"""
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        self.total_length -= document["length"]
+        for term in document["tf"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 10,
+               metadata_filter: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Tuple[str, float]]:
+        """BM25 檢索，返回 [(doc_id, score)]（metadata_filter 判斷文件 metadata 是否納入）"""
+        with self._lock:
+            self.reload_if_changed()
+            doc_count = len(self.documents)
+            if not doc_count:
+                return []
+
+            avg_length = self.total_length / doc_count or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self.documents[doc_id]["length"]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            if metadata_filter is not None:
+                scores = {doc_id: score for doc_id, score in scores.items()
+                          if metadata_filter(self.documents[doc_id]["metadata"])}
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """獲取文件內容與 metadata"""
+        with self._lock:
+            return self.documents.get(doc_id)
+
+    def save(self) -> None:
+        """寫入 JSON 檔案（先寫暫存檔再替換，避免讀到半寫入的索引）"""
+        if not self.path:
+            return
+        with self._lock:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            data = {
+                doc_id: {"text": doc["text"], "metadata": doc["metadata"], "tf": doc["tf"]}
+                for doc_id, doc in self.documents.items()
+            }
+            # 暫存檔以進程與執行緒區分，多個寫入者不會互相覆蓋尚未替換的暫存檔
+            temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"k1": self.k1, "b": self.b, "documents": data}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
+
+    def clear(self) -> None:
+        """清空索引並刪除 JSON 檔案（集合刪除後使用）"""
+        with self._lock:
+            self.documents = {}
+            self.postings = {}
+            self.total_length = 0
+            self._loaded_mtime = None
+            if self.path:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+    def load(self) -> None:
+        """從 JSON 檔案載入並重建倒排表"""
+        with self._lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            self.documents = {}
+            self.postings = {}
+            self.total_length = 0
+            for doc_id, doc in data.get("documents", {}).items():
+                tf = doc["tf"]
+                length = sum(tf.values())
+                self.documents[doc_id] = {"text": doc["text"], "metadata": doc["metadata"], "tf": tf, "length": length}
+                self.total_length += length
+                for term, count in tf.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+
+            self._loaded_mtime = os.path.getmtime(self.path)
+            logger.info(f"✅ 載入BM25索引: {self.path} ({len(self.documents)} 個子段落)")
+
+    def reload_if_changed(self) -> None:
+        """其他進程更新索引檔案時重新載入"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            if os.path.getmtime(self.path) != self._loaded_mtime:
+                self.load()
+        except Exception as e:
+            logger.warning(f"重新載入BM25索引失敗: {e}")
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """以倒數排名融合多個排序結果，返回 [(doc_id, rrf_score)]（分數由高到低）"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
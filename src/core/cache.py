@@ -0,0 +1,187 @@
+"""
+進程內快取工具
+提供以條目數與位元組數限制的 LRU/TTL 快取，以及各集合的資料版本
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 各集合的資料版本 - 每次寫入新資料時更新，讓依賴舊資料的快取失效。
+# 版本寫在共用目錄的檔案中，同一主機的所有工作進程與匯入腳本共用；
+# 讀取結果只在進程內保留 CACHE_GENERATION_CHECK_INTERVAL 秒，其他進程寫入後最多延遲這段時間失效
+_generation_lock = threading.Lock()
+_collection_generations: Dict[str, tuple] = {}  # collection -> (generation, checked_at)
+
+
+def _generation_path(collection_name: str) -> str:
+    return os.path.join(Config.CACHE_GENERATION_DIR, f"{collection_name}.generation")
+
+
+def _read_generation(collection_name: str, default: int) -> int:
+    try:
+        with open(_generation_path(collection_name), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        logger.warning(f"讀取集合 {collection_name} 資料版本失敗，沿用目前版本: {e}")
+        return default
+
+
+def get_collection_generation(collection_name: str) -> int:
+    """獲取集合目前的資料版本"""
+    now = time.monotonic()
+    with _generation_lock:
+        generation, checked_at = _collection_generations.get(collection_name, (0, None))
+        if checked_at is not None and now - checked_at < Config.CACHE_GENERATION_CHECK_INTERVAL:
+            return generation
+
+    generation = _read_generation(collection_name, generation)
+    with _generation_lock:
+        _collection_generations[collection_name] = (generation, now)
+    return generation
+
+
+def bump_collection_generation(collection_name: str) -> int:
+    """更新集合的資料版本並返回新版本（以時間戳記為版本，多個進程同時寫入也不會得到相同的版本）"""
+    path = _generation_path(collection_name)
+    with _generation_lock:
+        previous, _ = _collection_generations.get(collection_name, (0, None))
+        generation = max(time.time_ns(), previous + 1)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(str(generation))
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"寫入集合 {collection_name} 資料版本失敗，只有目前進程的快取會失效: {e}")
+        _collection_generations[collection_name] = (generation, time.monotonic())
+        return generation
+
+
+def default_sizeof(value: Any) -> int:
+    """估算快取值佔用的位元組數"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """以條目數與位元組數限制的執行緒安全 LRU/TTL 快取"""
+
+    def __init__(self, max_entries: int, max_bytes: int = 0, ttl: float = 0,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        """
+        Args:
+            max_entries: 最大條目數（0 表示停用快取）
+            max_bytes: 最大位元組數（0 表示不限制）
+            ttl: 條目存活秒數（0 表示不過期）
+            sizeof: 計算值大小的函數
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or default_sizeof
+
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """獲取快取值，命中時移到最近使用端"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, size, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """寫入快取值，超出限制時淘汰最久未使用的條目"""
+        if not self.enabled:
+            return
+
+        size = self.sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+
+            while self._data and (len(self._data) > self.max_entries or
+                                  (self.max_bytes and self._bytes > self.max_bytes)):
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """刪除快取條目"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取快取統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,154 @@
+"""
+集合狀態監控
+快取各集合是否存在與點數，請求路徑只讀取快取；
+過期時在背景執行緒重新整理，寫入路徑（處理文件、刪除集合）直接更新狀態
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from qdrant_client import QdrantClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CollectionState:
+    """單一集合的快取狀態"""
+    exists: bool = False
+    points_count: int = 0
+    checked_at: float = 0.0
+
+
+class CollectionStateMonitor:
+    """集合存在與點數的 TTL 快取 - 同一 Qdrant 服務的所有 RAG 實例共用"""
+
+    def __init__(self, qdrant_client: QdrantClient, ttl: float = 30.0):
+        self.qdrant_client = qdrant_client
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._states: Dict[str, CollectionState] = {}
+        self._refreshing = False
+        self.connected = False
+        self.last_refresh = 0.0
+        self.last_error: Optional[str] = None
+        self.refresh_count = 0
+
+    def watch(self, collection_names: Iterable[str], refresh: bool = True) -> None:
+        """登記需要追蹤的集合，尚未檢查過的集合立即同步檢查一次"""
+        with self._lock:
+            new_names = [name for name in collection_names if name not in self._states]
+            for name in new_names:
+                self._states[name] = CollectionState()
+        if new_names and refresh:
+            self.refresh(new_names)
+
+    def unwatch(self, collection_names: Iterable[str]) -> None:
+        """停止追蹤集合（實例釋放或集合刪除後），背景更新不再查詢這些集合"""
+        with self._lock:
+            for name in collection_names:
+                self._states.pop(name, None)
+
+    def refresh(self, collection_names: Optional[List[str]] = None) -> bool:
+        """從 Qdrant 重新讀取集合狀態（None 時更新所有追蹤中的集合），返回是否連線成功"""
+        with self._lock:
+            names = list(collection_names if collection_names is not None else self._states)
+        try:
+            existing = {col.name for col in self.qdrant_client.get_collections().collections}
+            states = {}
+            for name in names:
+                count = 0
+                if name in existing:
+                    info = self.qdrant_client.get_collection(name)
+                    count = info.points_count or info.vectors_count or 0
+                states[name] = CollectionState(exists=name in existing, points_count=count, checked_at=time.time())
+
+            with self._lock:
+                self._states.update(states)
+                self.connected = True
+                self.last_refresh = time.time()
+                self.last_error = None
+                self.refresh_count += 1
+            return True
+        except Exception as e:
+            with self._lock:
+                self.connected = False
+                self.last_error = str(e)
+            logger.warning(f"更新集合狀態失敗: {e}")
+            return False
+
+    def _refresh_in_background(self) -> None:
+        """過期時在背景執行緒更新（同時只有一個更新在執行）"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="collection-state-refresh", daemon=True).start()
+
+    def get(self, collection_name: str) -> CollectionState:
+        """讀取快取狀態（不呼叫 Qdrant），過期時觸發背景更新"""
+        with self._lock:
+            state = self._states.get(collection_name)
+            if state is None:
+                self._states[collection_name] = state = CollectionState()
+            stale = time.time() - state.checked_at > self.ttl
+        if stale:
+            self._refresh_in_background()
+        return state
+
+    def has_data(self, collection_name: str) -> bool:
+        """集合是否存在且有資料"""
+        state = self.get(collection_name)
+        return state.exists and state.points_count > 0
+
+    def set_state(self, collection_name: str, exists: bool, points_count: int) -> None:
+        """寫入路徑直接更新狀態（例如建立、刪除集合後）"""
+        with self._lock:
+            self._states[collection_name] = CollectionState(
+                exists=exists, points_count=points_count, checked_at=time.time()
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取監控狀態"""
+        with self._lock:
+            return {
+                "connected": self.connected,
+                "ttl": self.ttl,
+                "last_refresh": self.last_refresh,
+                "last_error": self.last_error,
+                "refresh_count": self.refresh_count,
+                "collections": {name: asdict(state) for name, state in self._states.items()}
+            }
+
+
+# 進程內共用的監控器 - 以 Qdrant URL 區分
+_monitor_lock = threading.Lock()
+_monitors: Dict[str, CollectionStateMonitor] = {}
+
+
+def get_collection_monitor(qdrant_url: str, qdrant_client: QdrantClient, ttl: float = 30.0) -> CollectionStateMonitor:
+    """獲取（或建立）指定 Qdrant 服務的共用集合狀態監控器"""
+    with _monitor_lock:
+        if qdrant_url not in _monitors:
+            _monitors[qdrant_url] = CollectionStateMonitor(qdrant_client, ttl)
+        return _monitors[qdrant_url]
+
+
+def refresh_all_monitors() -> None:
+    """更新所有監控器（供背景任務定期呼叫）"""
+    with _monitor_lock:
+        monitors = list(_monitors.values())
+    for monitor in monitors:
+        monitor.refresh()
@@ -0,0 +1,176 @@
+"""
+上下文打包
+依檢索相關性順序把父段落放入提示詞，直到達到 token 預算為止；
+已被先前段落涵蓋（相同或高度重疊）的父段落略過；單一父段落就超過預算時截斷到預算內。
+父段落的 token 數在寫入時預先計算並存放在子段落 payload（parent_token_count），請求時不需重新分詞
+"""
+
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# 子段落 metadata 中父段落 token 數的欄位
+PARENT_TOKEN_COUNT_KEY = "parent_token_count"
+
+_encoding_lock = threading.Lock()
+_encodings: Dict[str, Any] = {}
+
+
+def get_encoding(model: str):
+    """獲取模型的 tiktoken 編碼器（不支援的模型使用 gpt-4 編碼器；無法載入時返回 None）"""
+    with _encoding_lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    logger.warning(f"模型 {model} 不被 tiktoken 支援，使用 gpt-4 編碼器")
+                    _encodings[model] = tiktoken.encoding_for_model("gpt-4")
+            except Exception as e:
+                logger.warning(f"載入 tiktoken 編碼器失敗，改以字元數估算 token 數: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str) -> int:
+    """計算文字的 token 數"""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        # 中文約每字一個 token，以字元數作為保守估計
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, model: str, max_tokens: int) -> str:
+    """截斷文字到 max_tokens 個 token 以內"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+@dataclass
+class PackedContext:
+    """打包結果"""
+    results: List[Any] = field(default_factory=list)  # 放入提示詞的檢索結果（依相關性順序）
+    parts: List[str] = field(default_factory=list)
+    token_count: int = 0
+    budget: int = 0
+    dropped_overlap: int = 0
+    dropped_budget: int = 0
+    truncated: int = 0  # 超過預算而截斷的父段落數
+    separator: str = "\n\n"
+
+    @property
+    def text(self) -> str:
+        return self.separator.join(self.parts)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "packed": len(self.results),
+            "tokens": self.token_count,
+            "budget": self.budget,
+            "dropped_overlap": self.dropped_overlap,
+            "dropped_budget": self.dropped_budget,
+            "truncated": self.truncated
+        }
+
+
+class ContextPacker:
+    """以 token 預算打包父段落"""
+
+    def __init__(self, model: str, budget: int = 3000, overlap_threshold: float = 0.8,
+                 separator: str = "\n\n", shingle_size: int = 5):
+        """
+        Args:
+            model: 計算 token 數使用的 LLM 模型
+            budget: 上下文 token 上限（0 表示不限制）
+            overlap_threshold: 與已放入段落的字元 n-gram 重疊比例達到此值時視為已涵蓋
+            separator: 段落之間的分隔字串
+            shingle_size: 比對重疊的字元 n-gram 長度
+        """
+        self.model = model
+        self.budget = budget
+        self.overlap_threshold = overlap_threshold
+        self.separator = separator
+        self.shingle_size = shingle_size
+        self._separator_tokens = count_tokens(separator, model)
+
+    def _shingles(self, text: str) -> Set[str]:
+        text = "".join(text.split())
+        size = self.shingle_size
+        if len(text) <= size:
+            return {text} if text else set()
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def _is_covered(self, shingles: Set[str], packed_shingles: List[Set[str]]) -> bool:
+        """段落的 n-gram 大部分已出現在某個已放入的段落中"""
+        if not shingles:
+            return True
+        return any(len(shingles & other) / len(shingles) >= self.overlap_threshold for other in packed_shingles)
+
+    def content_tokens(self, result) -> int:
+        """父段落 token 數 - 優先使用寫入時預先計算的值"""
+        token_count = getattr(result, "parent_token_count", None)
+        if token_count is None:
+            token_count = count_tokens(result.parent_content, self.model)
+        return token_count
+
+    def pack(self, results: List[Any], header: Optional[Callable[[Any], str]] = None,
+             footer: Optional[Callable[[Any], str]] = None) -> PackedContext:
+        """
+        依順序打包檢索結果
+
+        Args:
+            results: 已依相關性排序的檢索結果（需有 parent_content）
+            header / footer: 附加在父段落前後的短文字（例如主題標題、圖片連結），會即時計算 token 數
+        """
+        packed = PackedContext(budget=self.budget, separator=self.separator)
+        packed_shingles: List[Set[str]] = []
+
+        for result in results:
+            shingles = self._shingles(result.parent_content)
+            if self._is_covered(shingles, packed_shingles):
+                packed.dropped_overlap += 1
+                continue
+
+            prefix = header(result) if header else ""
+            suffix = footer(result) if footer else ""
+            extra_tokens = count_tokens(prefix, self.model) + count_tokens(suffix, self.model)
+            content = result.parent_content
+            cost = self.content_tokens(result) + extra_tokens
+            if packed.parts:
+                cost += self._separator_tokens
+
+            if self.budget and packed.token_count + cost > self.budget:
+                # 預算不足時略過此段落，繼續嘗試較短的後續段落；
+                # 第一個段落就超過預算時截斷到預算內，避免沒有任何上下文
+                if packed.parts:
+                    packed.dropped_budget += 1
+                    continue
+                content = truncate_tokens(content, self.model, self.budget - extra_tokens)
+                cost = count_tokens(content, self.model) + extra_tokens
+                if not content or cost > self.budget:
+                    packed.dropped_budget += 1
+                    continue
+                packed.truncated += 1
+
+            packed.results.append(result)
+            packed.parts.append(f"{prefix}{content}{suffix}")
+            packed.token_count += cost
+            packed_shingles.append(shingles)
+
+        logger.info(f"📦 上下文打包: {len(packed.results)}/{len(results)} 個父段落，"
+                    f"{packed.token_count}/{self.budget or '∞'} tokens "
+                    f"(重疊略過 {packed.dropped_overlap}，超出預算 {packed.dropped_budget}，截斷 {packed.truncated})")
+        return packed
@@ -0,0 +1,189 @@
+"""
+查詢向量微批次
+同時進行的請求各自呼叫一次嵌入API時，在短暫的時間窗內收集查詢，
+以單次批量呼叫送出後再分別完成各請求的 future（同步與非同步呼叫端皆可使用）
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """完成 future（呼叫端已取消或已完成時略過）"""
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        # 檢查後才被取消
+        pass
+
+
+class EmbeddingBatcher:
+    """跨請求的查詢嵌入批次器"""
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = 5.0, max_items: int = 64,
+                 max_in_flight: int = 4, history_size: int = 1000):
+        """
+        Args:
+            embeddings: 實際的嵌入模型
+            window_ms: 收到第一個查詢後等待更多查詢的時間（毫秒）
+            max_items: 單一批次的查詢上限
+            max_in_flight: 同時進行的批量API呼叫上限
+            history_size: 計算批次大小與等待時間百分位數時保留的筆數
+        """
+        self.embeddings = embeddings
+        self.window = max(0.0, window_ms) / 1000
+        self.max_items = max(1, max_items)
+
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="embedding-batch")
+        self._lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=history_size)
+        self._wait_times = deque(maxlen=history_size)
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+
+        self._collector = threading.Thread(target=self._collect_loop, name="embedding-batcher", daemon=True)
+        self._collector.start()
+
+    def submit(self, text: str) -> Future:
+        """加入一個查詢，返回完成時帶有向量的 future"""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            with self._lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """同步取得查詢向量"""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        """非同步取得查詢向量（等待時不阻塞事件迴圈）"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[Tuple[str, Future, float]]) -> None:
+        dispatched_at = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._wait_times.extend((dispatched_at - submitted_at) * 1000 for _, _, submitted_at in batch)
+
+        # 已取消的請求不送出；相同的查詢只送出一次
+        pending = [(text, future) for text, future, _ in batch if not future.done()]
+        if not pending:
+            return
+        unique_texts = list(dict.fromkeys(text for text, _ in pending))
+        try:
+            vectors = dict(zip(unique_texts, self.embeddings.embed_documents(unique_texts)))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning(f"批量嵌入查詢失敗 ({len(pending)} 個): {e}")
+            for _, future in pending:
+                _resolve(future, error=e)
+            return
+
+        for text, future in pending:
+            if text in vectors:
+                _resolve(future, vectors[text])
+            else:
+                _resolve(future, error=ValueError(f"嵌入API未返回查詢向量: {text[:50]}"))
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取批次統計：批次大小、等待時間（毫秒）與佇列深度"""
+        with self._lock:
+            sizes = np.asarray(self._batch_sizes, dtype=np.float32)
+            waits = np.asarray(self._wait_times, dtype=np.float32)
+            return {
+                "enabled": True,
+                "window_ms": self.window * 1000,
+                "max_items": self.max_items,
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "p95_batch_size": float(np.percentile(sizes, 95)) if sizes.size else 0.0,
+                "max_batch_size": int(sizes.max()) if sizes.size else 0,
+                "p50_wait_ms": float(np.percentile(waits, 50)) if waits.size else 0.0,
+                "p95_wait_ms": float(np.percentile(waits, 95)) if waits.size else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth
+            }
+
+
+class BatchedEmbeddings(Embeddings):
+    """包裝嵌入模型 - 單一查詢經過批次器合併，文件嵌入維持原本的批量呼叫"""
+
+    def __init__(self, embeddings: Embeddings, batcher: EmbeddingBatcher):
+        self.embeddings = embeddings
+        self.batcher = batcher
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.batcher.aembed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+
+# 進程內共用的批次器 - 以嵌入模型與維度區分
+_batcher_lock = threading.Lock()
+_batchers: Dict[tuple, EmbeddingBatcher] = {}
+
+
+def get_embedding_batcher(model: str, dimension: int, embeddings: Embeddings, window_ms: float = 5.0,
+                          max_items: int = 64, max_in_flight: int = 4) -> EmbeddingBatcher:
+    """獲取（或建立）指定模型與維度的共用批次器"""
+    key = (model, dimension)
+    with _batcher_lock:
+        if key not in _batchers:
+            _batchers[key] = EmbeddingBatcher(embeddings, window_ms, max_items, max_in_flight)
+        return _batchers[key]
+
+
+def get_embedding_batcher_stats() -> Optional[Dict[str, Any]]:
+    """所有批次器的統計"""
+    with _batcher_lock:
+        if not _batchers:
+            return None
+        return {f"{model}:{dimension}": batcher.stats() for (model, dimension), batcher in _batchers.items()}
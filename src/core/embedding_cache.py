@@ -0,0 +1,341 @@
+"""
+嵌入向量快取
+查詢向量：正規化查詢 -> float32 向量，記憶體 LRU 層 + 可選的 SQLite 磁碟層
+文件向量：段落內容哈希 -> float32 向量，持久化於 SQLite，重新處理時只嵌入新段落
+兩階段搜尋時快取保存完整維度向量，輸出給向量庫的是截斷並重新正規化的短向量
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.core.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def shorten_vector(vector: np.ndarray, dimension: Optional[int]) -> np.ndarray:
+    """截斷到前 dimension 維並重新正規化（text-embedding-3 的 dimensions 參數即等同此運算）"""
+    if not dimension or vector.shape[-1] <= dimension:
+        return vector
+    short = vector[..., :dimension]
+    norms = np.linalg.norm(short, axis=-1, keepdims=True)
+    return short / np.maximum(norms, 1e-12)
+
+
+def normalize_query(query: str) -> str:
+    """正規化查詢文字（全半形、大小寫、空白），讓相同問題共用快取"""
+    text = unicodedata.normalize("NFKC", query).strip().lower()
+    return re.sub(r"\s+", " ", text)
+
+
+class SQLiteVectorStore:
+    """以 SQLite 保存的 key -> float32 向量磁碟存儲"""
+
+    def __init__(self, path: str, table: str = "vectors"):
+        self.path = path
+        self.table = table
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量讀取向量"""
+        found = {}
+        with self._lock:
+            # SQLite 參數數量有上限，分批查詢
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM {self.table} WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def set_many(self, items: Dict[str, np.ndarray]) -> None:
+        """批量寫入向量"""
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class QueryEmbeddingCache:
+    """查詢向量快取 - 以嵌入模型與維度區分"""
+
+    def __init__(self, model: str, dimension: int, max_entries: int = 4096, disk_path: str = ""):
+        self.model = model
+        self.dimension = dimension
+        self.memory = LRUCache(max_entries=max_entries)
+        self.disk = SQLiteVectorStore(disk_path, table="query_embeddings") if disk_path else None
+        self.disk_hits = 0
+
+    def _key(self, query: str) -> str:
+        raw = f"{self.model}:{self.dimension}:{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """獲取快取向量，磁碟層命中時回填記憶體層"""
+        vector = self.get_memory(query)
+        return vector if vector is not None else self.get_disk(query)
+
+    def get_memory(self, query: str) -> Optional[np.ndarray]:
+        """只查記憶體層（不做 I/O，可在事件迴圈中呼叫）"""
+        return self.memory.get(self._key(query))
+
+    def get_disk(self, query: str) -> Optional[np.ndarray]:
+        """查磁碟層，命中時回填記憶體層（SQLite 讀取，非同步呼叫端應放到執行緒中）"""
+        if self.disk is None:
+            return None
+        key = self._key(query)
+        vector = self.disk.get_many([key]).get(key)
+        if vector is not None:
+            self.disk_hits += 1
+            self.memory.set(key, vector)
+        return vector
+
+    def set(self, query: str, vector: List[float]) -> np.ndarray:
+        """寫入查詢向量"""
+        array = self.set_memory(query, vector)
+        self.set_disk(query, array)
+        return array
+
+    def set_memory(self, query: str, vector: List[float]) -> np.ndarray:
+        """只寫入記憶體層"""
+        array = np.asarray(vector, dtype=np.float32)
+        self.memory.set(self._key(query), array)
+        return array
+
+    def set_disk(self, query: str, vector: np.ndarray) -> None:
+        """寫入磁碟層（SQLite 寫入，非同步呼叫端應放到執行緒中）"""
+        if self.disk is None:
+            return
+        try:
+            self.disk.set_many({self._key(query): vector})
+        except Exception as e:
+            logger.warning(f"寫入查詢向量磁碟快取失敗: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取快取統計（hit_rate 包含磁碟層命中）"""
+        stats = self.memory.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "model": self.model,
+            "dimension": self.dimension,
+            "disk_enabled": self.disk is not None,
+            "disk_hits": self.disk_hits,
+            "hit_rate": (stats["hits"] + self.disk_hits) / lookups if lookups else 0.0
+        })
+        return stats
+
+
+class DocumentEmbeddingCache:
+    """文件向量持久快取 - 以段落內容哈希為鍵"""
+
+    def __init__(self, model: str, dimension: int, path: str):
+        self.model = model
+        self.dimension = dimension
+        self.store = SQLiteVectorStore(path, table="document_embeddings")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model}:{self.dimension}:{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取快取統計"""
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "dimension": self.dimension,
+            "path": self.store.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """包裝嵌入模型 - 查詢向量與文件向量分別經過對應的快取"""
+
+    def __init__(self, embeddings: Embeddings, query_cache: QueryEmbeddingCache,
+                 document_cache: Optional[DocumentEmbeddingCache] = None, batch_size: int = 256,
+                 output_dimension: Optional[int] = None):
+        """
+        Args:
+            output_dimension: 設定時快取保存完整向量，返回截斷到此維度的短向量（兩階段搜尋）
+        """
+        self.embeddings = embeddings
+        self.query_cache = query_cache
+        self.document_cache = document_cache
+        self.batch_size = batch_size
+        self.output_dimension = output_dimension
+
+    def full_query_vector(self, text: str) -> np.ndarray:
+        """完整維度的查詢向量（經過查詢快取）"""
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.query_cache.set(text, self.embeddings.embed_query(text))
+        return vector
+
+    def full_document_vectors(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """從文件向量快取讀取完整維度向量，不調用嵌入API（未快取的段落返回 None）"""
+        if self.document_cache is None:
+            return [None] * len(texts)
+        keys = [self.document_cache.key(text) for text in texts]
+        vectors = self.document_cache.store.get_many(list(dict.fromkeys(keys)))
+        return [vectors.get(key) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return shorten_vector(self.full_query_vector(text), self.output_dimension).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # 記憶體層直接查詢，磁碟層（SQLite）的讀寫放到執行緒中，不阻塞事件迴圈
+        vector = self.query_cache.get_memory(text)
+        if vector is None and self.query_cache.disk is not None:
+            vector = await asyncio.to_thread(self.query_cache.get_disk, text)
+        if vector is None:
+            vector = self.query_cache.set_memory(text, await self.embeddings.aembed_query(text))
+            if self.query_cache.disk is not None:
+                await asyncio.to_thread(self.query_cache.set_disk, text, vector)
+        return shorten_vector(vector, self.output_dimension).tolist()
+
+    def _pending_queries(self, texts: List[str]):
+        """查詢快取未命中的問題（正規化後相同的問題只嵌入一次），返回 (已快取向量, {正規化問題: 原始問題})"""
+        vectors = [self.query_cache.get(text) for text in texts]
+        pending = {}
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                pending.setdefault(normalize_query(text), text)
+        return vectors, pending
+
+    def _merge_queries(self, texts: List[str], vectors: List[Optional[np.ndarray]], pending: Dict[str, str],
+                       embedded: List[List[float]]) -> List[List[float]]:
+        new_vectors = {key: self.query_cache.set(text, vector) for (key, text), vector in zip(pending.items(), embedded)}
+        vectors = [vector if vector is not None else new_vectors[normalize_query(text)]
+                   for text, vector in zip(texts, vectors)]
+        return [shorten_vector(vector, self.output_dimension).tolist() for vector in vectors]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入查詢 - 查詢快取未命中的問題以單次 API 呼叫嵌入"""
+        vectors, pending = self._pending_queries(texts)
+        embedded = self.embeddings.embed_documents(list(pending.values())) if pending else []
+        return self._merge_queries(texts, vectors, pending, embedded)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_queries 的非同步版本（有磁碟層時快取讀寫放到執行緒中）"""
+        if self.query_cache.disk is None:
+            vectors, pending = self._pending_queries(texts)
+        else:
+            vectors, pending = await asyncio.to_thread(self._pending_queries, texts)
+        embedded = await self.embeddings.aembed_documents(list(pending.values())) if pending else []
+        if self.query_cache.disk is None or not pending:
+            return self._merge_queries(texts, vectors, pending, embedded)
+        return await asyncio.to_thread(self._merge_queries, texts, vectors, pending, embedded)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """先查內容哈希快取，只將未嵌入過的段落分批送往 API"""
+        if self.document_cache is None:
+            embedded = self.embeddings.embed_documents(texts)
+            if not self.output_dimension:
+                return embedded
+            return [shorten_vector(np.asarray(vector, dtype=np.float32), self.output_dimension).tolist()
+                    for vector in embedded]
+
+        keys = [self.document_cache.key(text) for text in texts]
+        try:
+            vectors = self.document_cache.store.get_many(list(dict.fromkeys(keys)))
+        except Exception as e:
+            logger.warning(f"讀取文件向量快取失敗: {e}")
+            vectors = {}
+
+        # 同一批次中重複的段落只嵌入一次
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                pending.setdefault(key, text)
+
+        hits = len(texts) - sum(1 for key in keys if key in pending)
+        self.document_cache.hits += hits
+        self.document_cache.misses += len(texts) - hits
+
+        pending_items = list(pending.items())
+        for start in range(0, len(pending_items), self.batch_size):
+            batch = pending_items[start:start + self.batch_size]
+            embedded = self.embeddings.embed_documents([text for _, text in batch])
+            new_vectors = {key: np.asarray(vector, dtype=np.float32) for (key, _), vector in zip(batch, embedded)}
+            vectors.update(new_vectors)
+            try:
+                self.document_cache.store.set_many(new_vectors)
+            except Exception as e:
+                logger.warning(f"寫入文件向量快取失敗: {e}")
+
+        if texts:
+            logger.info(f"📦 文件向量快取: 命中 {hits}/{len(texts)}，新嵌入 {len(pending_items)} 個段落")
+
+        return [shorten_vector(vectors[key], self.output_dimension).tolist() for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.document_cache is None:
+            return await self.embeddings.aembed_documents(texts)
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+
+# 進程內共用的查詢向量快取 - 所有 RAG 實例與端點共用
+_query_cache_lock = threading.Lock()
+_query_caches: Dict[tuple, QueryEmbeddingCache] = {}
+
+
+def get_query_embedding_cache(model: str, dimension: int, max_entries: int = 4096,
+                              disk_path: str = "") -> QueryEmbeddingCache:
+    """獲取（或建立）指定模型與維度的共用查詢向量快取"""
+    key = (model, dimension)
+    with _query_cache_lock:
+        if key not in _query_caches:
+            _query_caches[key] = QueryEmbeddingCache(model, dimension, max_entries, disk_path)
+        return _query_caches[key]
+
+
+_document_cache_lock = threading.Lock()
+_document_caches: Dict[tuple, DocumentEmbeddingCache] = {}
+
+
+def get_document_embedding_cache(model: str, dimension: int, path: str) -> Optional[DocumentEmbeddingCache]:
+    """獲取（或建立）共用的文件向量持久快取，路徑為空時停用"""
+    if not path:
+        return None
+    key = (model, dimension, path)
+    with _document_cache_lock:
+        if key not in _document_caches:
+            try:
+                _document_caches[key] = DocumentEmbeddingCache(model, dimension, path)
+            except Exception as e:
+                logger.warning(f"初始化文件向量快取失敗，將直接調用嵌入API: {e}")
+                return None
+        return _document_caches[key]
@@ -0,0 +1,266 @@
+"""
+跨集合聯合檢索
+同一查詢只嵌入一次，同時在多個集合中檢索；各集合的分數正規化後合併取前 top_k，
+單一集合逾時或失敗時略過，不拖慢整體回答
+"""
+
+import asyncio
+import fnmatch
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config.config import Config
+from src.core.langchain_rag_system import LangChainParentChildRAG, LangChainRetrievalResult, get_rag_system
+from src.core.retrieval_filters import RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+CHILD_COLLECTION_SUFFIX = "_langchain_children"
+
+
+def parse_collection_patterns(value: str) -> List[str]:
+    """解析逗號分隔的集合名稱（可使用 * 萬用字元，例如 pdf_*）"""
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class FederatedRetriever:
+    """在多個 LangChainParentChildRAG 集合中同時檢索"""
+
+    def __init__(self, primary: LangChainParentChildRAG, patterns: List[str], timeout: float = 3.0,
+                 max_collections: int = 20):
+        """
+        Args:
+            primary: 主要 RAG 系統（負責嵌入查詢與生成回答，也一定參與檢索）
+            patterns: 參與檢索的集合名稱或萬用字元模式
+            timeout: 單一集合的檢索逾時秒數
+            max_collections: 參與檢索的集合上限（不含主要集合）
+        """
+        self.primary = primary
+        self.patterns = patterns
+        self.timeout = timeout
+        self.max_collections = max_collections
+
+        self._lock = threading.Lock()
+        self.systems: Dict[str, LangChainParentChildRAG] = {primary.collection_name: primary}
+        self.timeouts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.latencies: Dict[str, float] = {}
+
+        self.refresh_collections()
+
+    def refresh_collections(self) -> List[str]:
+        """
+        依模式比對 Qdrant 中現有的集合，返回參與檢索的集合
+        新集合加入、已刪除的集合移除；其餘集合重新向共用註冊表取得實例，
+        註冊表釋放並重建過的實例會在此替換，不會沿用已不共用的舊實例
+        """
+        try:
+            existing = sorted(
+                col.name[:-len(CHILD_COLLECTION_SUFFIX)]
+                for col in self.primary.qdrant_client.get_collections().collections
+                if col.name.endswith(CHILD_COLLECTION_SUFFIX)
+            )
+        except Exception as e:
+            logger.warning(f"讀取集合列表失敗，沿用目前的聯合檢索集合: {e}")
+            return self.collection_names
+
+        matched = [name for name in existing
+                   if any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)]
+        if len(matched) > self.max_collections:
+            logger.warning(f"符合的集合超過上限 {self.max_collections}，只使用最新的集合")
+            matched = matched[-self.max_collections:]
+
+        with self._lock:
+            removed = [name for name in self.systems if name not in matched and name != self.primary.collection_name]
+            for name in removed:
+                self.systems.pop(name)
+        if removed:
+            logger.info(f"🔗 移除已不存在的聯合檢索集合: {', '.join(removed)}")
+
+        for name in matched:
+            try:
+                rag_system = get_rag_system(name)
+            except Exception as e:
+                logger.warning(f"初始化集合 {name} 失敗，不參與聯合檢索: {e}")
+                continue
+            if self.systems.get(name) is not rag_system:
+                self.add_system(rag_system)
+
+        logger.info(f"🔗 聯合檢索集合: {', '.join(self.collection_names)}")
+        return self.collection_names
+
+    def add_system(self, rag_system: LangChainParentChildRAG) -> None:
+        """加入（或替換）參與檢索的 RAG 實例，例如剛上傳的新集合"""
+        with self._lock:
+            self.systems[rag_system.collection_name] = rag_system
+            if rag_system.collection_name == self.primary.collection_name:
+                self.primary = rag_system
+
+    def matches(self, collection_name: str) -> bool:
+        return any(fnmatch.fnmatchcase(collection_name, pattern) for pattern in self.patterns)
+
+    @property
+    def collection_names(self) -> List[str]:
+        with self._lock:
+            return list(self.systems)
+
+    def has_vector_data(self) -> bool:
+        with self._lock:
+            systems = list(self.systems.values())
+        return any(rag_system.has_vector_data() for rag_system in systems)
+
+    async def _search_collection(self, name: str, rag_system: LangChainParentChildRAG, query: str,
+                                 top_k: int, filters: Optional[RetrievalFilter],
+                                 query_vector: List[float]) -> List[LangChainRetrievalResult]:
+        start_time = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                rag_system.aretrieve_relevant_chunks(query, top_k, filters=filters, query_vector=query_vector),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+            logger.warning(f"集合 {name} 檢索逾時（{self.timeout}秒），略過")
+            return []
+        except Exception as e:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            logger.warning(f"集合 {name} 檢索失敗，略過: {e}")
+            return []
+        finally:
+            with self._lock:
+                self.latencies[name] = (time.perf_counter() - start_time) * 1000
+
+    @staticmethod
+    def _normalized_scores(results_by_collection: Dict[str, List[LangChainRetrievalResult]]) -> List[tuple]:
+        """
+        各集合分數先以最小-最大值正規化到 0-1，再乘以該集合最高分與全體最高分的比例，
+        分數分布不同的集合可以比較，同時整體較不相關的集合不會因正規化而被拉高
+        """
+        best_overall = max((result.retrieval_score for results in results_by_collection.values() for result in results),
+                           default=0.0)
+        scored = []
+        for name, results in results_by_collection.items():
+            if not results:
+                continue
+            scores = [result.retrieval_score for result in results]
+            low, high = min(scores), max(scores)
+            weight = high / best_overall if best_overall > 0 else 1.0
+            for rank, result in enumerate(results):
+                normalized = (result.retrieval_score - low) / (high - low) if high > low else 1.0
+                scored.append((weight * normalized, name, rank, result))
+        # 同分時依集合內名次排序
+        scored.sort(key=lambda item: (-item[0], item[2]))
+        return scored
+
+    async def aretrieve_relevant_chunks(self, query: str, top_k: int = 10,
+                                        filters: Optional[RetrievalFilter] = None,
+                                        query_vector: Optional[List[float]] = None) -> List[LangChainRetrievalResult]:
+        """跨集合檢索 - 與 LangChainParentChildRAG.aretrieve_relevant_chunks 相同的介面"""
+        with self._lock:
+            systems = dict(self.systems)
+        if len(systems) == 1:
+            return await self.primary.aretrieve_relevant_chunks(query, top_k, filters=filters,
+                                                                query_vector=query_vector)
+
+        # 所有集合使用相同的嵌入模型與維度，查詢只嵌入一次
+        if query_vector is None:
+            query_vector = await self.primary.vectorstore.embeddings.aembed_query(query)
+        names = [name for name, rag_system in systems.items() if rag_system.has_vector_data()]
+        results_list = await asyncio.gather(*[
+            self._search_collection(name, systems[name], query, top_k, filters, query_vector) for name in names
+        ])
+
+        merged = self._normalized_scores(dict(zip(names, results_list)))[:top_k]
+        logger.info(f"🔗 聯合檢索 {len(names)} 個集合，合併 {sum(len(results) for results in results_list)} "
+                    f"個結果 -> {len(merged)} 個 ({', '.join(sorted({name for _, name, _, _ in merged}))})")
+        return [result for _, _, _, result in merged]
+
+    async def agenerate_many(self, queries: List[str], top_k: int = 10, max_concurrency: int = 4,
+                             filters: Optional[RetrievalFilter] = None) -> List[Dict[str, Any]]:
+        """
+        批量跨集合檢索並生成回答 - 與 LangChainParentChildRAG.agenerate_many 相同的介面
+        所有問題以單次呼叫嵌入，各問題的跨集合檢索與 LLM 呼叫在並發上限內同時進行
+        """
+        with self._lock:
+            single = len(self.systems) == 1
+        primary = self.primary
+        if single:
+            return await primary.agenerate_many(queries, top_k, max_concurrency=max_concurrency, filters=filters)
+        if not queries:
+            return []
+
+        query_vectors = await primary.vectorstore.embeddings.aembed_queries(queries)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def generate(query: str, query_vector: List[float]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    retrieval_results = await self.aretrieve_relevant_chunks(query, top_k, filters=filters,
+                                                                             query_vector=query_vector)
+                    return await primary._agenerate_from_results(query, retrieval_results)
+                except Exception as e:
+                    logger.error(f"聯合檢索批量生成回答失敗 ({query}): {e}")
+                    return primary._error_answer(query, e)
+
+        return await asyncio.gather(*[generate(query, query_vector)
+                                      for query, query_vector in zip(queries, query_vectors)])
+
+    async def agenerate_answer(self, query: str, top_k: int = 10, filters: Optional[RetrievalFilter] = None,
+                               use_cache: bool = True) -> Dict[str, Any]:
+        """
+        跨集合檢索後以主要 RAG 系統生成回答
+        語意回答快取以所有參與集合分組，任一集合寫入新資料後失效
+        """
+        primary = self.primary
+        try:
+            cache_context = None
+            query_vector = None
+            if primary.answer_cache is not None and use_cache:
+                query_vector = await primary.vectorstore.embeddings.aembed_query(query)
+                cache_context, cached = await asyncio.to_thread(
+                    primary._lookup_answer_cache, query, query_vector, top_k, filters, self.collection_names
+                )
+                if cached is not None:
+                    return cached
+            elif primary.answer_cache is not None:
+                primary.answer_cache.record_bypass()
+
+            retrieval_results = await self.aretrieve_relevant_chunks(query, top_k, filters=filters,
+                                                                     query_vector=query_vector)
+            response = await primary._agenerate_from_results(query, retrieval_results)
+            if retrieval_results:
+                primary._store_answer_cache(cache_context, query, response)
+            return response
+        except Exception as e:
+            logger.error(f"聯合檢索生成回答失敗: {e}")
+            return self.primary._error_answer(query, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取聯合檢索統計"""
+        with self._lock:
+            return {
+                "enabled": True,
+                "patterns": self.patterns,
+                "timeout": self.timeout,
+                "collections": list(self.systems),
+                "timeouts": dict(self.timeouts),
+                "errors": dict(self.errors),
+                "last_latency_ms": dict(self.latencies)
+            }
+
+
+def build_federated_retriever(primary: LangChainParentChildRAG) -> Optional[FederatedRetriever]:
+    """依 FEDERATED_COLLECTIONS 設定建立聯合檢索器，未設定時返回 None"""
+    patterns = parse_collection_patterns(Config.FEDERATED_COLLECTIONS)
+    if not patterns:
+        return None
+    return FederatedRetriever(
+        primary,
+        patterns,
+        timeout=Config.FEDERATED_TIMEOUT,
+        max_collections=Config.FEDERATED_MAX_COLLECTIONS
+    )
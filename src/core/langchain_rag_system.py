@@ -3,12 +3,20 @@ LangChain Parent-Child RAG系統
 使用LangChain的ParentDocumentRetriever實現更優化的檢索
 """
 
+import asyncio
+import hashlib
 import logging
+import os
+import threading
 import time
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import uuid
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
 
+import httpx
+import numpy as np
+
 from langchain.retrievers import ParentDocumentRetriever
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.storage import InMemoryStore
@@ -16,14 +24,59 @@ from langchain_core.stores import BaseStore
 from langchain_community.vectorstores import Qdrant
 from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, VectorParamsDiff, Filter, FieldCondition, MatchAny, MatchValue, FilterSelector, PointIdsList, Disabled, QueryRequest
 
 from config.config import Config
+from src.core.cache import LRUCache, get_collection_generation, bump_collection_generation
+from src.core.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.core.local_vector_index import LocalVectorIndex
+from src.core.quantization import normalize_mode, build_quantization_config, build_search_params
+from src.core.embedding_cache import CachedEmbeddings, get_query_embedding_cache, get_document_embedding_cache
+from src.core.collection_monitor import get_collection_monitor
+from src.core.embedding_batcher import BatchedEmbeddings, get_embedding_batcher
+from src.core.retrieval_filters import RetrievalFilter, METADATA_PAYLOAD_KEY, PAYLOAD_INDEXES, payload_field
+from src.core.mmr import mmr_select
+from src.core.answer_cache import get_answer_cache
+from src.core.context_packer import ContextPacker, PackedContext, PARENT_TOKEN_COUNT_KEY, count_tokens
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# 向量點ID的命名空間 - 同一內容在任何進程中都產生相同的UUID
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "jh-langchain-parent-child")
+
+
+def stable_point_id(*parts: Any) -> str:
+    """以UUIDv5生成穩定的點ID，重新處理同一文件時成為冪等的upsert"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, ":".join(str(part) for part in parts)))
+
+@dataclass(slots=True)
+class ChildChunkView:
+    """子段落屬性（兼容原有 child_chunk 格式）"""
+    content: str
+    topic: str
+    sub_topic: str
+    page_num: int
+    keywords: List[str]
+    has_images: bool
+    image_path: str
+    content_type: str
+    source_filename: str
+
+
+@dataclass(slots=True)
+class ParentChunkView:
+    """父段落屬性（兼容原有 parent_chunk 格式）"""
+    content: str
+    topic: str
+    page_range: Tuple[int, int]
+    has_images: bool
+    image_paths: List[str]
+    content_type: str
+    source_filename: str
+
+
+@dataclass(slots=True)
 class LangChainRetrievalResult:
     """LangChain檢索結果 - 兼容原有格式"""
     document: Document
@@ -31,46 +84,64 @@ class LangChainRetrievalResult:
     relevance_reason: str
     parent_content: str
     child_content: str
+    parent_token_count: Optional[int] = None  # 寫入時預先計算的父段落 token 數
+    retrieval_score: float = 0.0  # 檢索原始分數（向量相似度，或融合後沿用的分數），跨集合合併時使用
 
-    # 兼容原有格式的屬性
-    @property
-    def child_chunk(self):
-        """兼容原有child_chunk屬性"""
-        return type('ChildChunk', (), {
-            'content': self.child_content,
-            'topic': self.document.metadata.get('topic', ''),
-            'sub_topic': self.document.metadata.get('sub_topic', ''),
-            'page_num': self.document.metadata.get('page_num', 0),
-            'keywords': self.document.metadata.get('keywords', []),
-            'has_images': self.document.metadata.get('has_images', False),
-            'image_path': self.document.metadata.get('image_path', ''),
-            'content_type': self.document.metadata.get('content_type', '未指定'),
-            'source_filename': self.document.metadata.get('source_filename', '')
-        })()
+    # 兼容原有格式的屬性 - 建立結果時組合一次，之後的讀取不再重新建構
+    child_chunk: ChildChunkView = field(init=False, repr=False)
+    parent_chunk: ParentChunkView = field(init=False, repr=False)
+
+    def __post_init__(self):
+        metadata = self.document.metadata
+        topic = metadata.get('topic', '')
+        page_num = metadata.get('page_num', 0)
+        has_images = metadata.get('has_images', False)
+        image_path = metadata.get('image_path', '')
+        content_type = metadata.get('content_type', '未指定')
+        source_filename = metadata.get('source_filename', '')
+
+        self.child_chunk = ChildChunkView(
+            content=self.child_content,
+            topic=topic,
+            sub_topic=metadata.get('sub_topic', ''),
+            page_num=page_num,
+            keywords=metadata.get('keywords', []),
+            has_images=has_images,
+            image_path=image_path,
+            content_type=content_type,
+            source_filename=source_filename
+        )
+        self.parent_chunk = ParentChunkView(
+            content=self.parent_content,
+            topic=topic,
+            page_range=(page_num, page_num),
+            has_images=has_images,
+            image_paths=[image_path] if image_path else [],
+            content_type=content_type,
+            source_filename=source_filename
+        )
 
-    @property
-    def parent_chunk(self):
-        """兼容原有parent_chunk屬性"""
-        return type('ParentChunk', (), {
-            'content': self.parent_content,
-            'topic': self.document.metadata.get('topic', ''),
-            'page_range': (self.document.metadata.get('page_num', 0), self.document.metadata.get('page_num', 0)),
-            'has_images': self.document.metadata.get('has_images', False),
-            'image_paths': [self.document.metadata.get('image_path', '')] if self.document.metadata.get('image_path') else [],
-            'content_type': self.document.metadata.get('content_type', '未指定'),
-            'source_filename': self.document.metadata.get('source_filename', '')
-        })()
 
 class QdrantDocStore(BaseStore[str, str]):
     """Qdrant文檔存儲器，用於存儲父文檔"""
     
-    def __init__(self, qdrant_client: QdrantClient, collection_name: str):
+    def __init__(self, qdrant_client: QdrantClient, collection_name: str,
+                 async_client_factory=None):
         self.qdrant_client = qdrant_client
+        self._async_client_factory = async_client_factory
+        self.base_collection_name = collection_name
         self.collection_name = f"{collection_name}_docstore"
-        self._ensure_collection()
-    
-    def _ensure_collection(self):
-        """確保集合存在"""
+
+        # 父段落在兩次寫入之間不變，以進程內快取減少 Qdrant 往返
+        self.cache = LRUCache(
+            max_entries=Config.PARENT_CACHE_MAX_ENTRIES,
+            max_bytes=Config.PARENT_CACHE_MAX_BYTES,
+            ttl=Config.PARENT_CACHE_TTL
+        )
+        self._cache_generation = get_collection_generation(collection_name)
+
+    def ensure_collection(self):
+        """確保集合存在（首次寫入前由 RAG 系統呼叫）"""
         try:
             collections = self.qdrant_client.get_collections().collections
             collection_names = [col.name for col in collections]
@@ -89,27 +160,120 @@ class QdrantDocStore(BaseStore[str, str]):
             logger.error(f"創建文檔存儲集合失敗: {e}")
     
     def mget(self, keys: List[str]) -> List[Optional[str]]:
-        """批量獲取文檔"""
+        """批量獲取文檔 - 先查快取，未命中的鍵值以單次請求取回"""
+        if not keys:
+            return []
         try:
-            results = []
-            for key in keys:
-                points = self.qdrant_client.scroll(
-                    collection_name=self.collection_name,
-                    scroll_filter={
-                        "must": [{"key": "doc_id", "match": {"value": key}}]
-                    },
-                    limit=1,
-                    with_payload=True
-                )[0]
-                
-                if points:
-                    results.append(points[0].payload.get("content"))
-                else:
-                    results.append(None)
-            return results
+            contents, missing_keys = self._lookup_cache(keys)
+            if missing_keys:
+                contents.update(self._cache_fetched(self._fetch(missing_keys)))
+            return [contents.get(key) for key in keys]
         except Exception as e:
             logger.error(f"批量獲取文檔失敗: {e}")
             return [None] * len(keys)
+
+    async def amget(self, keys: List[str]) -> List[Optional[str]]:
+        """非同步批量獲取文檔 - 與 mget 相同的快取流程，未命中時使用 AsyncQdrantClient"""
+        if not keys:
+            return []
+        if self._async_client_factory is None:
+            return await asyncio.to_thread(self.mget, keys)
+        try:
+            # 快取查詢前會讀取集合資料版本檔案，放到執行緒中
+            contents, missing_keys = await asyncio.to_thread(self._lookup_cache, keys)
+            if missing_keys:
+                contents.update(self._cache_fetched(await self._afetch(missing_keys)))
+            return [contents.get(key) for key in keys]
+        except Exception as e:
+            logger.error(f"非同步批量獲取文檔失敗: {e}")
+            return [None] * len(keys)
+
+    def _lookup_cache(self, keys: List[str]):
+        """返回 (快取命中的內容, 未命中的鍵值)"""
+        self._sync_cache_generation()
+
+        contents = {}
+        missing_keys = []
+        for key in dict.fromkeys(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing_keys.append(key)
+            else:
+                contents[key] = cached
+        return contents, missing_keys
+
+    def _cache_fetched(self, fetched: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        for key, content in fetched.items():
+            if content is not None:
+                self.cache.set(key, content)
+        return fetched
+
+    def _retrieve_kwargs(self, keys: List[str]) -> Dict[str, Any]:
+        return {
+            "collection_name": self.collection_name,
+            "ids": [stable_point_id(key) for key in keys],
+            "with_payload": True,
+            "with_vectors": False
+        }
+
+    def _legacy_scroll_kwargs(self, keys: List[str]) -> Dict[str, Any]:
+        # 舊版資料使用不穩定的hash ID，改以單一 MatchAny 過濾補查
+        return {
+            "collection_name": self.collection_name,
+            "scroll_filter": Filter(must=[FieldCondition(key="doc_id", match=MatchAny(any=keys))]),
+            "limit": len(keys),
+            "with_payload": True,
+            "with_vectors": False
+        }
+
+    @staticmethod
+    def _collect_contents(points, contents: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        for point in points:
+            payload = point.payload or {}
+            contents.setdefault(payload.get("doc_id"), payload.get("content"))
+        return contents
+
+    def _fetch(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """以點ID單次 retrieve 從 Qdrant 取回文檔"""
+        contents = self._collect_contents(self.qdrant_client.retrieve(**self._retrieve_kwargs(keys)), {})
+
+        missing_keys = [key for key in keys if key not in contents]
+        if missing_keys:
+            legacy_points, _ = self.qdrant_client.scroll(**self._legacy_scroll_kwargs(missing_keys))
+            self._collect_contents(legacy_points, contents)
+
+        return contents
+
+    async def _afetch(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """_fetch 的非同步版本"""
+        client = self._async_client_factory()
+        contents = self._collect_contents(await client.retrieve(**self._retrieve_kwargs(keys)), {})
+
+        missing_keys = [key for key in keys if key not in contents]
+        if missing_keys:
+            legacy_points, _ = await client.scroll(**self._legacy_scroll_kwargs(missing_keys))
+            self._collect_contents(legacy_points, contents)
+
+        return contents
+
+    def _sync_cache_generation(self):
+        """集合資料版本變更時清空快取"""
+        generation = get_collection_generation(self.base_collection_name)
+        if generation != self._cache_generation:
+            self.cache.clear()
+            self._cache_generation = generation
+
+    def bump_generation(self) -> int:
+        """遞增集合資料版本，使所有實例的父段落快取失效"""
+        generation = bump_collection_generation(self.base_collection_name)
+        self._sync_cache_generation()
+        return generation
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """獲取父段落快取統計"""
+        stats = self.cache.stats()
+        stats["generation"] = self._cache_generation
+        return stats
     
     def mset(self, key_value_pairs: List[tuple]) -> None:
         """批量設置文檔"""
@@ -117,13 +281,15 @@ class QdrantDocStore(BaseStore[str, str]):
             from qdrant_client.models import PointStruct
             
             points = []
-            for i, (key, value) in enumerate(key_value_pairs):
+            for key, value in key_value_pairs:
+                # Document 只保存內容，與 mget 返回值保持一致
+                content = value.page_content if isinstance(value, Document) else value
                 point = PointStruct(
-                    id=hash(key) % (2**63),  # 生成唯一ID
+                    id=stable_point_id(key),  # 穩定的點ID，可直接以鍵值定址
                     vector=[0.0],  # 占位向量
                     payload={
                         "doc_id": key,
-                        "content": value
+                        "content": content
                     }
                 )
                 points.append(point)
@@ -133,22 +299,28 @@ class QdrantDocStore(BaseStore[str, str]):
                     collection_name=self.collection_name,
                     points=points
                 )
+                for key, _ in key_value_pairs:
+                    self.cache.delete(key)
                 logger.info(f"✅ 批量存儲 {len(points)} 個文檔")
         except Exception as e:
             logger.error(f"批量設置文檔失敗: {e}")
     
     def mdelete(self, keys: List[str]) -> None:
         """批量刪除文檔"""
+        if not keys:
+            return
         try:
-            for key in keys:
-                self.qdrant_client.delete(
-                    collection_name=self.collection_name,
-                    points_selector={
-                        "filter": {
-                            "must": [{"key": "doc_id", "match": {"value": key}}]
-                        }
-                    }
+            # 以 doc_id 過濾刪除，同時涵蓋新舊兩種點ID
+            self.qdrant_client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(
+                    filter=Filter(
+                        must=[FieldCondition(key="doc_id", match=MatchAny(any=list(keys)))]
+                    )
                 )
+            )
+            for key in keys:
+                self.cache.delete(key)
             logger.info(f"✅ 批量刪除 {len(keys)} 個文檔")
         except Exception as e:
             logger.error(f"批量刪除文檔失敗: {e}")
@@ -184,27 +356,129 @@ class LangChainParentChildRAG:
         self.child_collection_name = f"{collection_name}_langchain_children"
         self.parent_collection_name = f"{collection_name}_langchain_parents"
         
-        # 初始化Qdrant客戶端
-        self.qdrant_client = QdrantClient(url=Config.QDRANT_URL)
+        # Qdrant 客戶端 - 同一服務的所有實例共用連線池
+        self.qdrant_url = Config.QDRANT_URL
+        self.qdrant_client = get_qdrant_client(self.qdrant_url)
+        self._async_qdrant_client = None
+        self._async_openai_client = None
         
-        # 初始化嵌入模型
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=Config.OPENAI_API_KEY,
-            model=Config.OPENAI_EMBEDDING_MODEL
+        # 嵌入維度：索引使用 EMBEDDING_DIMENSION，兩階段搜尋時 API 返回完整維度供重新評分
+        self.embedding_dimension = self._get_embedding_dimension()
+        self.full_embedding_dimension = self._get_native_embedding_dimension()
+        self.two_stage_rescore = (
+            Config.EMBEDDING_RESCORE_ENABLED and self.embedding_dimension < self.full_embedding_dimension
+        )
+        if self.two_stage_rescore and not Config.DOCUMENT_EMBEDDING_CACHE_PATH:
+            logger.warning("兩階段搜尋需要文件向量快取保存完整向量，已停用重新評分")
+            self.two_stage_rescore = False
+        api_dimension = self.full_embedding_dimension if self.two_stage_rescore else self.embedding_dimension
+
+        # 嵌入模型 - 相同模型與維度的實例共用（text-embedding-3 系列以 dimensions 參數直接返回縮減維度）
+        self.embeddings = get_shared_embeddings(
+            Config.OPENAI_EMBEDDING_MODEL, api_dimension, self.full_embedding_dimension
         )
+
+        # 查詢嵌入微批次 - 同時進行的請求在短暫時間窗內合併為單次API呼叫
+        self.embedding_batcher = None
+        if Config.EMBEDDING_BATCHER_ENABLED:
+            self.embedding_batcher = get_embedding_batcher(
+                Config.OPENAI_EMBEDDING_MODEL,
+                api_dimension,
+                self.embeddings,
+                window_ms=Config.EMBEDDING_BATCHER_WINDOW_MS,
+                max_items=Config.EMBEDDING_BATCHER_MAX_ITEMS,
+                max_in_flight=Config.EMBEDDING_BATCHER_MAX_IN_FLIGHT
+            )
+            self.embeddings = BatchedEmbeddings(self.embeddings, self.embedding_batcher)
         
-        # 確保子集合存在
-        self._ensure_child_collection()
+        # 查詢向量快取 - 進程內所有實例與端點共用
+        self.query_embedding_cache = get_query_embedding_cache(
+            model=Config.OPENAI_EMBEDDING_MODEL,
+            dimension=api_dimension,
+            max_entries=Config.QUERY_EMBEDDING_CACHE_SIZE,
+            disk_path=Config.QUERY_EMBEDDING_CACHE_PATH
+        )
+
+        # 文件向量持久快取 - 內容未變的段落重新處理時不再調用嵌入API
+        self.document_embedding_cache = get_document_embedding_cache(
+            model=Config.OPENAI_EMBEDDING_MODEL,
+            dimension=api_dimension,
+            path=Config.DOCUMENT_EMBEDDING_CACHE_PATH
+        )
+        if self.two_stage_rescore and self.document_embedding_cache is None:
+            self.two_stage_rescore = False
+
+        # 上下文打包 - 依相關性在 token 預算內放入父段落
+        self.context_packer = ContextPacker(
+            Config.OPENAI_MODEL,
+            budget=Config.CONTEXT_TOKEN_BUDGET,
+            overlap_threshold=Config.CONTEXT_OVERLAP_THRESHOLD
+        )
 
-        # 初始化向量存儲
+        # 語意回答快取 - 措辭相近的問題直接返回先前的回答（以縮減後的查詢向量比對）
+        self.answer_cache = None
+        if Config.ANSWER_CACHE_ENABLED:
+            self.answer_cache = get_answer_cache(
+                Config.OPENAI_EMBEDDING_MODEL,
+                self.embedding_dimension,
+                max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+                threshold=Config.ANSWER_CACHE_THRESHOLD,
+                ttl=Config.ANSWER_CACHE_TTL
+            )
+
+        # 集合存在與維度檢查延後到首次寫入（_ensure_collections），建立實例時不額外呼叫 Qdrant
+        self._collections_ready = False
+        self._collections_lock = threading.Lock()
+
+        # 初始化向量存儲（查詢與文件向量都經過快取）
         self.vectorstore = Qdrant(
             client=self.qdrant_client,
             collection_name=self.child_collection_name,
-            embeddings=self.embeddings
+            embeddings=CachedEmbeddings(
+                self.embeddings,
+                self.query_embedding_cache,
+                self.document_embedding_cache,
+                batch_size=Config.EMBEDDING_BATCH_SIZE,
+                output_dimension=self.embedding_dimension if self.two_stage_rescore else None
+            )
         )
         
         # 初始化文檔存儲
-        self.docstore = QdrantDocStore(self.qdrant_client, collection_name)
+        self.docstore = QdrantDocStore(
+            self.qdrant_client, collection_name, async_client_factory=lambda: self.async_qdrant_client
+        )
+
+        # 集合狀態監控 - 請求路徑以快取判斷是否有資料，不再每次查詢 Qdrant
+        self.collection_monitor = get_collection_monitor(
+            self.qdrant_url, self.qdrant_client, ttl=Config.COLLECTION_STATE_TTL
+        )
+        self.collection_monitor.watch([self.child_collection_name, self.docstore.collection_name])
+
+        # 子段落 BM25 索引 - 與向量檢索以 RRF 融合，提升料號與專有名詞的召回
+        self.bm25_index = None
+        self._bm25_lock = threading.Lock()
+        self._bm25_building = False
+        self._bm25_generation = 0  # 重設索引時遞增，使進行中的背景建立停止
+        self._bm25_ready = threading.Event()
+        if Config.HYBRID_SEARCH_ENABLED:
+            self.bm25_index = BM25Index(os.path.join(Config.BM25_INDEX_DIR, f"{self.child_collection_name}.json"))
+            if len(self.bm25_index) > 0:
+                self._bm25_ready.set()
+
+        # MMR 多樣化 - 向量檢索同時取回子段落向量，在融合後重新挑選
+        self.mmr_enabled = Config.MMR_ENABLED
+
+        # 可選的本地向量副本 - 查詢時不經過網路；Qdrant 仍是資料來源與備援
+        self.local_index = None
+        if Config.LOCAL_VECTOR_INDEX_ENABLED:
+            self.local_index = LocalVectorIndex(
+                Config.LOCAL_VECTOR_INDEX_DIR,
+                self.child_collection_name,
+                quantization=Config.VECTOR_QUANTIZATION,
+                oversampling=Config.QUANTIZATION_OVERSAMPLING
+            )
+            if not self.local_index.synced:
+                self.sync_local_index()
         
         # 初始化文本分割器 - 更保守的參數
         self.parent_splitter = RecursiveCharacterTextSplitter(
@@ -232,6 +506,17 @@ class LangChainParentChildRAG:
         logger.info(f"  子段落集合: {self.child_collection_name}")
         logger.info(f"  父段落存儲: {self.parent_collection_name}")
 
+    def _ensure_collections(self):
+        """首次寫入前確認子段落與父段落集合存在（集合被刪除後再次寫入時重新建立）"""
+        if (self._collections_ready
+                and self.collection_monitor.get(self.child_collection_name).exists
+                and self.collection_monitor.get(self.docstore.collection_name).exists):
+            return
+        with self._collections_lock:
+            self._ensure_child_collection()
+            self.docstore.ensure_collection()
+            self._collections_ready = True
+
     def _ensure_child_collection(self):
         """確保子集合存在"""
         try:
@@ -242,23 +527,53 @@ class LangChainParentChildRAG:
                 # 獲取嵌入模型的維度
                 embedding_dimension = self._get_embedding_dimension()
 
-                # 創建子集合用於向量存儲
+                # 創建子集合用於向量存儲（啟用量化時原始向量放在磁碟，量化向量常駐記憶體）
+                quantization_mode = normalize_mode(Config.VECTOR_QUANTIZATION)
                 self.qdrant_client.create_collection(
                     collection_name=self.child_collection_name,
                     vectors_config=VectorParams(
                         size=embedding_dimension,
-                        distance=Distance.COSINE
-                    )
+                        distance=Distance.COSINE,
+                        on_disk=quantization_mode != "none"
+                    ),
+                    quantization_config=build_quantization_config(quantization_mode)
                 )
-                logger.info(f"✅ 創建子段落集合: {self.child_collection_name} (維度: {embedding_dimension})")
+                logger.info(f"✅ 創建子段落集合: {self.child_collection_name} (維度: {embedding_dimension}, 量化: {quantization_mode})")
+                self._ensure_payload_indexes()
             else:
                 logger.info(f"✅ 子段落集合已存在: {self.child_collection_name}")
+                collection_info = self.qdrant_client.get_collection(self.child_collection_name)
+                existing_dimension = self._get_collection_dimension(collection_info)
+                if existing_dimension and existing_dimension != self._get_embedding_dimension():
+                    logger.warning(
+                        f"⚠️ 子段落集合維度 {existing_dimension} 與設定的 EMBEDDING_DIMENSION "
+                        f"{self._get_embedding_dimension()} 不一致，請執行 scripts/reembed_collection.py 遷移"
+                    )
+                # 舊集合補建缺少的 payload 索引
+                self._ensure_payload_indexes(set(collection_info.payload_schema or {}))
         except Exception as e:
             logger.error(f"創建子段落集合失敗: {e}")
             raise
 
-    def _get_embedding_dimension(self) -> int:
-        """獲取嵌入模型的維度"""
+    def _ensure_payload_indexes(self, existing_fields: Optional[set] = None):
+        """為來源檔名、頁碼、主題、內容類型建立 payload 索引，過濾檢索時不需掃描全部點"""
+        existing_fields = existing_fields or set()
+        for name, schema in PAYLOAD_INDEXES.items():
+            field_name = payload_field(name)
+            if field_name in existing_fields:
+                continue
+            try:
+                self.qdrant_client.create_payload_index(
+                    collection_name=self.child_collection_name,
+                    field_name=field_name,
+                    field_schema=schema
+                )
+                logger.info(f"✅ 建立 payload 索引: {field_name} ({schema.value})")
+            except Exception as e:
+                logger.warning(f"建立 payload 索引失敗 ({field_name}): {e}")
+
+    def _get_native_embedding_dimension(self) -> int:
+        """獲取嵌入模型的原生維度"""
         model_dimensions = {
             "text-embedding-ada-002": 1536,
             "text-embedding-3-small": 1536,
@@ -266,6 +581,25 @@ class LangChainParentChildRAG:
         }
 
         return model_dimensions.get(Config.OPENAI_EMBEDDING_MODEL, 1536)
+
+    def _get_embedding_dimension(self) -> int:
+        """獲取索引使用的向量維度（只有 text-embedding-3 系列支援縮減維度）"""
+        native_dimension = self._get_native_embedding_dimension()
+        if not Config.OPENAI_EMBEDDING_MODEL.startswith("text-embedding-3"):
+            return native_dimension
+        return max(1, min(Config.EMBEDDING_DIMENSION, native_dimension))
+
+    def _get_collection_dimension(self, collection_info=None) -> Optional[int]:
+        """獲取現有子段落集合的向量維度"""
+        try:
+            collection_info = collection_info or self.qdrant_client.get_collection(self.child_collection_name)
+            vectors = collection_info.config.params.vectors
+            if isinstance(vectors, dict):
+                vectors = next(iter(vectors.values()), None)
+            return vectors.size if vectors is not None else None
+        except Exception as e:
+            logger.warning(f"獲取子段落集合維度失敗: {e}")
+            return None
     
     def add_documents_from_zerox(self, zerox_chunks: List) -> Dict[str, Any]:
         """從Zerox處理結果添加文檔"""
@@ -298,6 +632,7 @@ class LangChainParentChildRAG:
                         "has_images": getattr(chunk, 'has_images', False),
                         "image_path": getattr(chunk, 'image_path', ''),
                         "source_filename": getattr(chunk, 'source_filename', ''),
+                        "source_file_hash": getattr(chunk, 'source_file_hash', ''),
                         "source": f"page_{chunk.page_num}"
                     }
                 )
@@ -307,7 +642,39 @@ class LangChainParentChildRAG:
             logger.info(f"🔄 開始處理 {len(documents)} 個文檔...")
             start_time = time.time()
             
-            self.retriever.add_documents(documents)
+            embedding_cache = self.document_embedding_cache
+            cache_hits_before = embedding_cache.hits if embedding_cache else 0
+            cache_misses_before = embedding_cache.misses if embedding_cache else 0
+
+            self._ensure_collections()
+
+            # 以穩定ID寫入子段落與父段落，重新處理同一文件時覆蓋而非重複
+            child_docs, child_ids, parent_docs = self._split_documents_for_ingest(documents)
+            # 寫入前找出同一來源頁面舊版本留下、這次不再寫入的點（段落數減少或文件內容變更）
+            stale_child_ids, stale_parent_ids = self._find_stale_points(
+                documents, child_ids, [parent_id for parent_id, _ in parent_docs]
+            )
+            self.vectorstore.add_documents(child_docs, ids=child_ids)
+            self.docstore.mset(parent_docs)
+            # 新資料寫入後才刪除舊的點，檢索不會看到頁面暫時消失
+            self._delete_stale_points(stale_child_ids, stale_parent_ids)
+            self.docstore.bump_generation()
+
+            if self.bm25_index is not None:
+                self.bm25_index.remove_documents(stale_child_ids)
+                self.bm25_index.add_documents(
+                    child_ids,
+                    [doc.page_content for doc in child_docs],
+                    [doc.metadata for doc in child_docs]
+                )
+                self.bm25_index.save()
+
+            if self.local_index is not None:
+                # 只取回剛寫入的子段落，不重新掃描整個集合
+                self.sync_local_index(child_ids, removed_ids=stale_child_ids)
+
+            # 寫入後立即更新集合狀態，查詢端不需等待背景更新
+            self.collection_monitor.refresh([self.child_collection_name, self.docstore.collection_name])
             
             processing_time = time.time() - start_time
             
@@ -316,6 +683,11 @@ class LangChainParentChildRAG:
                 "success": True,
                 "original_chunks": len(zerox_chunks),
                 "documents_added": len(documents),
+                "parent_chunks": len(parent_docs),
+                "child_chunks": len(child_docs),
+                "stale_points_removed": len(stale_child_ids) + len(stale_parent_ids),
+                "embeddings_reused": (embedding_cache.hits - cache_hits_before) if embedding_cache else 0,
+                "embeddings_computed": (embedding_cache.misses - cache_misses_before) if embedding_cache else len(child_docs),
                 "processing_time": processing_time,
                 "child_collection": self.child_collection_name,
                 "parent_collection": self.parent_collection_name
@@ -324,6 +696,7 @@ class LangChainParentChildRAG:
             logger.info(f"✅ LangChain處理完成:")
             logger.info(f"  原始段落: {result['original_chunks']}")
             logger.info(f"  添加文檔: {result['documents_added']}")
+            logger.info(f"  向量重用/新嵌入: {result['embeddings_reused']}/{result['embeddings_computed']}")
             logger.info(f"  處理時間: {result['processing_time']:.2f}秒")
             
             return result
@@ -332,94 +705,159 @@ class LangChainParentChildRAG:
             logger.error(f"添加文檔失敗: {e}")
             return {"success": False, "error": str(e)}
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = 10) -> List[LangChainRetrievalResult]:
-        """檢索相關段落 - 真正的父子關係檢索"""
+    def _split_documents_for_ingest(self, documents: List[Document]):
+        """
+        分割父子段落並生成穩定的點ID
+
+        ID 由來源文件哈希、頁碼與段落序號決定（同 ParentDocumentRetriever 的
+        分割流程，但不使用隨機 uuid4），同一文件重新處理會覆蓋原有的點。
+
+        Returns:
+            (子段落列表, 子段落ID列表, [(父段落ID, 父段落Document)])
+        """
+        child_docs = []
+        child_ids = []
+        parent_docs = []
+        id_key = self.retriever.id_key
+        content_keyed = 0
+
+        for document in documents:
+            metadata = document.metadata
+            source_key = metadata.get('source_file_hash') or metadata.get('source_filename')
+            if not source_key:
+                # 沒有來源資訊時以內容哈希代替，不同來源的同一頁碼不會共用ID而互相覆蓋
+                source_key = f"content:{hashlib.sha256(document.page_content.encode('utf-8')).hexdigest()}"
+                content_keyed += 1
+            page_num = metadata.get('page_num', 0)
+
+            for parent_index, parent_doc in enumerate(self.parent_splitter.split_documents([document])):
+                parent_id = stable_point_id(source_key, page_num, parent_index)
+                # 父段落 token 數隨子段落 payload 保存，打包上下文時不需重新分詞
+                parent_doc.metadata[PARENT_TOKEN_COUNT_KEY] = count_tokens(parent_doc.page_content, Config.OPENAI_MODEL)
+
+                for child_index, child_doc in enumerate(self.child_splitter.split_documents([parent_doc])):
+                    child_doc.metadata[id_key] = parent_id
+                    child_docs.append(child_doc)
+                    child_ids.append(stable_point_id(parent_id, child_index))
+
+                parent_docs.append((parent_id, parent_doc))
+
+        if content_keyed:
+            logger.warning(f"⚠️ {content_keyed} 個文檔缺少來源文件哈希與檔名，以內容哈希生成點ID（重新處理時無法覆蓋舊資料）")
+        return child_docs, child_ids, parent_docs
+
+    def _find_stale_points(self, documents: List[Document], child_ids: List[str],
+                           parent_ids: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        找出這次寫入的來源頁面在子段落集合中已有、但不在新ID內的子段落與其父段落
+
+        來源以文件哈希比對：不同資料夾的同名文件不會互相刪除；沒有文件哈希的文檔不比對
+        （其點ID以檔名或內容哈希生成，無法確定是否為同一文件）
+
+        Returns:
+            (舊子段落ID列表, 舊父段落ID列表)
+        """
+        pages_by_source: Dict[str, set] = {}
+        for document in documents:
+            source_file_hash = document.metadata.get('source_file_hash')
+            if source_file_hash:
+                pages_by_source.setdefault(source_file_hash, set()).add(document.metadata.get('page_num', 0))
+
+        new_child_ids, new_parent_ids = set(child_ids), set(parent_ids)
+        id_key = self.retriever.id_key
+        stale_child_ids, stale_parent_ids = [], set()
+        for source_file_hash, pages in pages_by_source.items():
+            scroll_filter = Filter(must=[
+                FieldCondition(key=payload_field("source_file_hash"), match=MatchValue(value=source_file_hash)),
+                FieldCondition(key=payload_field("page_num"), match=MatchAny(any=sorted(pages)))
+            ])
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    collection_name=self.child_collection_name,
+                    scroll_filter=scroll_filter,
+                    limit=1024,
+                    offset=offset,
+                    with_payload=[payload_field(id_key)],
+                    with_vectors=False
+                )
+                for point in points:
+                    if str(point.id) in new_child_ids:
+                        continue
+                    stale_child_ids.append(str(point.id))
+                    parent_id = ((point.payload or {}).get(METADATA_PAYLOAD_KEY) or {}).get(id_key)
+                    if parent_id and parent_id not in new_parent_ids:
+                        stale_parent_ids.add(parent_id)
+                if offset is None:
+                    break
+        return stale_child_ids, sorted(stale_parent_ids)
+
+    def _delete_stale_points(self, child_ids: List[str], parent_ids: List[str]) -> None:
+        """刪除重新處理後不再使用的子段落與父段落"""
+        if child_ids:
+            try:
+                self.qdrant_client.delete(
+                    collection_name=self.child_collection_name,
+                    points_selector=PointIdsList(points=child_ids)
+                )
+            except Exception as e:
+                logger.warning(f"刪除舊子段落失敗: {e}")
+        if parent_ids:
+            self.docstore.mdelete(parent_ids)
+        if child_ids or parent_ids:
+            logger.info(f"🔄 刪除重新處理前的舊段落: 子段落 {len(child_ids)} 個，父段落 {len(parent_ids)} 個")
+
+    @property
+    def async_qdrant_client(self) -> AsyncQdrantClient:
+        """非同步 Qdrant 客戶端（同一服務的實例共用，首次使用時建立）"""
+        if self._async_qdrant_client is None:
+            self._async_qdrant_client = get_async_qdrant_client(self.qdrant_url)
+        return self._async_qdrant_client
+
+    @property
+    def async_openai_client(self):
+        """非同步 OpenAI 客戶端（首次使用時建立，所有請求共用連線池）"""
+        if self._async_openai_client is None:
+            self._async_openai_client = get_async_openai_client()
+        return self._async_openai_client
+
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 10,
+                                 filters: Optional[RetrievalFilter] = None) -> List[LangChainRetrievalResult]:
+        """
+        檢索相關段落 - 真正的父子關係檢索
+
+        Args:
+            query: 查詢
+            top_k: 返回的父段落數量
+            filters: 可選的來源檔名、頁碼、主題、內容類型過濾
+        """
         try:
-            logger.info(f"🔍 LangChain檢索查詢: {query}")
+            filters = self._normalize_filters(filters)
+            logger.info(f"🔍 LangChain檢索查詢: {query}" + (f" (過濾: {filters})" if filters else ""))
 
             # 步驟1: 先在子段落中搜索，獲取相關的子段落
-            child_docs = self.vectorstore.similarity_search_with_score(query, k=top_k*2)
+            fetch_k = self._fetch_k(top_k*2)
+            child_docs = self._dense_search(query, k=fetch_k, filters=filters)
             logger.info(f"🔍 在子段落中找到 {len(child_docs)} 個相關結果")
 
-            # 步驟2: 根據子段落的ID獲取對應的父段落
-            results = []
-            processed_parent_ids = set()  # 避免重複的父段落
+            if self.bm25_index is not None:
+                child_docs = self._hybrid_fuse(query, child_docs, k=fetch_k, filters=filters)
+            if self.mmr_enabled:
+                child_docs = self._diversify(child_docs, top_k*2)
 
-            for child_doc, score in child_docs:
-                try:
-                    # 獲取子段落的父文檔ID
-                    parent_id = child_doc.metadata.get('doc_id', '')
-                    logger.debug(f"子段落metadata: {child_doc.metadata}")
-                    logger.debug(f"父文檔ID: {parent_id}")
-
-                    if not parent_id or parent_id in processed_parent_ids:
-                        # 如果沒有父ID，直接使用子段落內容作為父內容
-                        if not parent_id:
-                            logger.debug("沒有找到父文檔ID，使用子段落內容")
-                            parent_content = child_doc.page_content
-                        else:
-                            continue
-                    else:
-                        processed_parent_ids.add(parent_id)
-
-                        # 從docstore獲取完整的父段落
-                        parent_docs = self.docstore.mget([parent_id])
-                        logger.debug(f"從docstore獲取的父文檔: {parent_docs}")
-
-                        if parent_docs and parent_docs[0]:
-                            parent_content = parent_docs[0]
-                            logger.debug(f"父段落長度: {len(parent_content)}")
-                        else:
-                            logger.debug("docstore返回空，使用子段落內容作為父內容")
-                            parent_content = child_doc.page_content
-
-                    # 計算相似度分數（轉換為0-1範圍）
-                    similarity_score = max(0.1, min(1.0, 1.0 - score))
-
-                    # 生成相關性解釋
-                    relevance_reason = self._explain_relevance(query, child_doc, similarity_score)
-
-                    # 創建結果對象，包含真正的父子關係
-                    result = LangChainRetrievalResult(
-                        document=child_doc,  # 保留原始子文檔的metadata
-                        similarity_score=similarity_score,
-                        relevance_reason=relevance_reason,
-                        parent_content=parent_content,  # 完整的父段落內容
-                        child_content=child_doc.page_content  # 匹配的子段落內容
-                    )
-                    results.append(result)
-
-                    # 限制結果數量
-                    if len(results) >= top_k:
-                        break
+            # 步驟2: 先收集所有父文檔ID，再以單次請求批量獲取父段落
+            parent_ids = self._collect_parent_ids(child_docs)
+            parent_contents = dict(zip(parent_ids, self.docstore.mget(parent_ids))) if parent_ids else {}
+            logger.debug(f"從docstore批量獲取 {len(parent_ids)} 個父文檔")
 
-                except Exception as doc_error:
-                    logger.error(f"處理子文檔時出錯: {doc_error}")
-                    continue
+            results = self._build_retrieval_results(query, child_docs, parent_contents, top_k)
 
-            # 如果子段落檢索失敗，回退到原始方法
-            if not results:
+            # 如果子段落檢索失敗，回退到原始方法（有過濾條件時不回退，避免返回範圍外的內容）
+            if not results and not filters:
                 logger.warning("子段落檢索失敗，回退到ParentDocumentRetriever")
-                docs = self.retriever.get_relevant_documents(query)
-                docs = docs[:top_k]
-
-                for i, doc in enumerate(docs):
-                    similarity_score = max(0.1, 1.0 - (i * 0.1))
-                    relevance_reason = self._explain_relevance(query, doc, similarity_score)
-
-                    result = LangChainRetrievalResult(
-                        document=doc,
-                        similarity_score=similarity_score,
-                        relevance_reason=relevance_reason,
-                        parent_content=doc.page_content,
-                        child_content=doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content
-                    )
-                    results.append(result)
-
-            logger.info(f"✅ LangChain父子檢索完成，找到 {len(results)} 個相關結果")
-            logger.info(f"   父段落平均長度: {sum(len(r.parent_content) for r in results) // len(results) if results else 0} 字符")
-            logger.info(f"   子段落平均長度: {sum(len(r.child_content) for r in results) // len(results) if results else 0} 字符")
+                results = self._fallback_results(query, self.retriever.get_relevant_documents(query), top_k)
 
+            self._log_retrieval_results(results)
             return results
 
         except Exception as e:
@@ -427,7 +865,640 @@ class LangChainParentChildRAG:
             import traceback
             logger.error(f"詳細錯誤: {traceback.format_exc()}")
             return []
+
+    async def aretrieve_relevant_chunks(self, query: str, top_k: int = 10,
+                                        filters: Optional[RetrievalFilter] = None,
+                                        query_vector: Optional[List[float]] = None) -> List[LangChainRetrievalResult]:
+        """
+        非同步檢索相關段落 - 與 retrieve_relevant_chunks 相同流程，網路呼叫不阻塞事件迴圈
+        query_vector: 已計算的查詢向量（跨集合檢索時只嵌入一次）
+        """
+        try:
+            filters = self._normalize_filters(filters)
+            logger.info(f"🔍 LangChain非同步檢索查詢: {query}" + (f" (過濾: {filters})" if filters else ""))
+
+            fetch_k = self._fetch_k(top_k*2)
+            child_docs = await self._adense_search(query, k=fetch_k, filters=filters, query_vector=query_vector)
+            logger.info(f"🔍 在子段落中找到 {len(child_docs)} 個相關結果")
+
+            if self.bm25_index is not None:
+                child_docs = await asyncio.to_thread(self._hybrid_fuse, query, child_docs, fetch_k, filters)
+            if self.mmr_enabled:
+                child_docs = await self._adiversify(child_docs, top_k*2)
+
+            parent_ids = self._collect_parent_ids(child_docs)
+            parent_contents = dict(zip(parent_ids, await self.docstore.amget(parent_ids))) if parent_ids else {}
+
+            results = self._build_retrieval_results(query, child_docs, parent_contents, top_k)
+
+            if not results and not filters:
+                logger.warning("子段落檢索失敗，回退到ParentDocumentRetriever")
+                docs = await asyncio.to_thread(self.retriever.get_relevant_documents, query)
+                results = self._fallback_results(query, docs, top_k)
+
+            self._log_retrieval_results(results)
+            return results
+
+        except Exception as e:
+            logger.error(f"LangChain非同步檢索失敗: {e}")
+            import traceback
+            logger.error(f"詳細錯誤: {traceback.format_exc()}")
+            return []
+
+    def retrieve_many(self, queries: List[str], top_k: int = 10,
+                      filters: Optional[RetrievalFilter] = None) -> List[List[LangChainRetrievalResult]]:
+        """
+        批量檢索多個問題 - 單次嵌入呼叫、單次 Qdrant batch 查詢、單次 docstore 取回父段落
+
+        Returns:
+            與 queries 順序對應的檢索結果列表
+        """
+        if not queries:
+            return []
+        try:
+            filters = self._normalize_filters(filters)
+            logger.info(f"🔍 LangChain批量檢索 {len(queries)} 個查詢")
+            fetch_k = self._fetch_k(top_k*2)
+            child_docs_list = self._dense_search_many(queries, k=fetch_k, filters=filters)
+            if self.bm25_index is not None:
+                child_docs_list = [self._hybrid_fuse(query, child_docs, k=fetch_k, filters=filters)
+                                   for query, child_docs in zip(queries, child_docs_list)]
+            if self.mmr_enabled:
+                child_docs_list = self._diversify_many(child_docs_list, top_k*2)
+
+            parent_ids = self._collect_parent_ids([pair for child_docs in child_docs_list for pair in child_docs])
+            parent_contents = dict(zip(parent_ids, self.docstore.mget(parent_ids))) if parent_ids else {}
+
+            results_list = []
+            for query, child_docs in zip(queries, child_docs_list):
+                results = self._build_retrieval_results(query, child_docs, parent_contents, top_k)
+                if not results and not filters:
+                    results = self._fallback_results(query, self.retriever.get_relevant_documents(query), top_k)
+                results_list.append(results)
+
+            logger.info(f"✅ 批量檢索完成，共 {sum(len(results) for results in results_list)} 個結果")
+            return results_list
+
+        except Exception as e:
+            logger.error(f"LangChain批量檢索失敗: {e}")
+            return [[] for _ in queries]
+
+    async def aretrieve_many(self, queries: List[str], top_k: int = 10,
+                             filters: Optional[RetrievalFilter] = None) -> List[List[LangChainRetrievalResult]]:
+        """retrieve_many 的非同步版本"""
+        if not queries:
+            return []
+        try:
+            filters = self._normalize_filters(filters)
+            logger.info(f"🔍 LangChain非同步批量檢索 {len(queries)} 個查詢")
+            fetch_k = self._fetch_k(top_k*2)
+            child_docs_list = await self._adense_search_many(queries, k=fetch_k, filters=filters)
+            if self.bm25_index is not None:
+                child_docs_list = await asyncio.to_thread(
+                    lambda: [self._hybrid_fuse(query, child_docs, k=fetch_k, filters=filters)
+                             for query, child_docs in zip(queries, child_docs_list)]
+                )
+            if self.mmr_enabled:
+                child_docs_list = await self._adiversify_many(child_docs_list, top_k*2)
+
+            parent_ids = self._collect_parent_ids([pair for child_docs in child_docs_list for pair in child_docs])
+            parent_contents = dict(zip(parent_ids, await self.docstore.amget(parent_ids))) if parent_ids else {}
+
+            results_list = []
+            for query, child_docs in zip(queries, child_docs_list):
+                results = self._build_retrieval_results(query, child_docs, parent_contents, top_k)
+                if not results and not filters:
+                    docs = await asyncio.to_thread(self.retriever.get_relevant_documents, query)
+                    results = self._fallback_results(query, docs, top_k)
+                results_list.append(results)
+
+            logger.info(f"✅ 非同步批量檢索完成，共 {sum(len(results) for results in results_list)} 個結果")
+            return results_list
+
+        except Exception as e:
+            logger.error(f"LangChain非同步批量檢索失敗: {e}")
+            return [[] for _ in queries]
+
+    @staticmethod
+    def _normalize_filters(filters: Optional[RetrievalFilter]) -> Optional[RetrievalFilter]:
+        """沒有任何條件的過濾視為不過濾"""
+        return filters if filters is not None and not filters.is_empty else None
+
+    @staticmethod
+    def _collect_parent_ids(child_docs: List[tuple]) -> List[str]:
+        """依檢索順序收集不重複的父文檔ID"""
+        parent_ids = []
+        for child_doc, _ in child_docs:
+            parent_id = child_doc.metadata.get('doc_id', '')
+            if parent_id and parent_id not in parent_ids:
+                parent_ids.append(parent_id)
+        return parent_ids
+
+    def _build_retrieval_results(self, query: str, child_docs: List[tuple], parent_contents: Dict[str, Optional[str]],
+                                 top_k: int) -> List[LangChainRetrievalResult]:
+        """組合子段落與父段落內容為檢索結果"""
+        results = []
+        processed_parent_ids = set()  # 避免重複的父段落
+
+        for child_doc, score in child_docs:
+            try:
+                # 獲取子段落的父文檔ID
+                parent_id = child_doc.metadata.get('doc_id', '')
+                logger.debug(f"子段落metadata: {child_doc.metadata}")
+                logger.debug(f"父文檔ID: {parent_id}")
+
+                if not parent_id or parent_id in processed_parent_ids:
+                    # 如果沒有父ID，直接使用子段落內容作為父內容
+                    if not parent_id:
+                        logger.debug("沒有找到父文檔ID，使用子段落內容")
+                        parent_content = child_doc.page_content
+                    else:
+                        continue
+                else:
+                    processed_parent_ids.add(parent_id)
+
+                    if parent_contents.get(parent_id):
+                        parent_content = parent_contents[parent_id]
+                        logger.debug(f"父段落長度: {len(parent_content)}")
+                    else:
+                        logger.debug("docstore返回空，使用子段落內容作為父內容")
+                        parent_content = child_doc.page_content
+
+                # 計算相似度分數（轉換為0-1範圍）
+                similarity_score = max(0.1, min(1.0, 1.0 - score))
+
+                # 生成相關性解釋
+                relevance_reason = self._explain_relevance(query, child_doc, similarity_score)
+
+                # 創建結果對象，包含真正的父子關係
+                result = LangChainRetrievalResult(
+                    document=child_doc,  # 保留原始子文檔的metadata
+                    similarity_score=similarity_score,
+                    relevance_reason=relevance_reason,
+                    parent_content=parent_content,  # 完整的父段落內容
+                    child_content=child_doc.page_content,  # 匹配的子段落內容
+                    parent_token_count=child_doc.metadata.get(PARENT_TOKEN_COUNT_KEY) if parent_contents.get(parent_id) else None,
+                    retrieval_score=float(score)
+                )
+                results.append(result)
+
+                # 限制結果數量
+                if len(results) >= top_k:
+                    break
+
+            except Exception as doc_error:
+                logger.error(f"處理子文檔時出錯: {doc_error}")
+                continue
+
+        return results
+
+    def _fallback_results(self, query: str, docs: List[Document], top_k: int) -> List[LangChainRetrievalResult]:
+        """ParentDocumentRetriever 回退結果"""
+        results = []
+        for i, doc in enumerate(docs[:top_k]):
+            similarity_score = max(0.1, 1.0 - (i * 0.1))
+            relevance_reason = self._explain_relevance(query, doc, similarity_score)
+
+            result = LangChainRetrievalResult(
+                document=doc,
+                similarity_score=similarity_score,
+                relevance_reason=relevance_reason,
+                parent_content=doc.page_content,
+                child_content=doc.page_content[:500] + "..." if len(doc.page_content) > 500 else doc.page_content
+            )
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _log_retrieval_results(results: List[LangChainRetrievalResult]) -> None:
+        logger.info(f"✅ LangChain父子檢索完成，找到 {len(results)} 個相關結果")
+        logger.info(f"   父段落平均長度: {sum(len(r.parent_content) for r in results) // len(results) if results else 0} 字符")
+        logger.info(f"   子段落平均長度: {sum(len(r.child_content) for r in results) // len(results) if results else 0} 字符")
     
+    def sync_local_index(self, point_ids: Optional[List[str]] = None,
+                         removed_ids: Optional[List[str]] = None) -> int:
+        """從子段落集合同步本地向量副本（提供點ID時只同步這些點，否則掃描整個集合）"""
+        try:
+            return self.local_index.sync(self.qdrant_client, point_ids=point_ids, removed_ids=removed_ids)
+        except Exception as e:
+            logger.warning(f"同步本地向量索引失敗，將使用 Qdrant 檢索: {e}")
+            return 0
+
+    def _dense_search(self, query: str, k: int, filters: Optional[RetrievalFilter] = None) -> List[tuple]:
+        """
+        向量檢索子段落 - 本地副本可用時在進程內計算，否則查詢 Qdrant
+        兩階段搜尋時先以縮減維度取較多候選，再以完整維度向量重新評分
+        """
+        candidate_k = self._candidate_k(k)
+        results = None
+        if self.local_index is not None:
+            try:
+                self.local_index.reload_if_changed()
+                if self.local_index.ready:
+                    query_vector = self.vectorstore.embeddings.embed_query(query)
+                    results = self.local_index.similarity_search_with_score(
+                        query_vector, k=candidate_k, filters=filters, with_vectors=self.mmr_enabled
+                    )
+            except Exception as e:
+                logger.warning(f"本地向量檢索失敗，改用 Qdrant: {e}")
+
+        if results is None and not self.mmr_enabled:
+            results = self.vectorstore.similarity_search_with_score(
+                query,
+                k=candidate_k,
+                filter=filters.to_qdrant() if filters else None,
+                search_params=build_search_params(Config.VECTOR_QUANTIZATION, Config.QUANTIZATION_OVERSAMPLING)
+            )
+        elif results is None:
+            # MMR 需要子段落向量，直接查詢 Qdrant 一併取回
+            response = self.qdrant_client.query_points(
+                collection_name=self.child_collection_name,
+                query=self.vectorstore.embeddings.embed_query(query),
+                query_filter=filters.to_qdrant() if filters else None,
+                limit=candidate_k,
+                search_params=build_search_params(Config.VECTOR_QUANTIZATION, Config.QUANTIZATION_OVERSAMPLING),
+                with_payload=True,
+                with_vectors=True
+            )
+            results = [(self._point_to_document(point), point.score) for point in response.points]
+
+        if self.two_stage_rescore:
+            results = self._rescore_full_dimension(query, results, k)
+        return results
+
+    async def _adense_search(self, query: str, k: int, filters: Optional[RetrievalFilter] = None,
+                             query_vector: Optional[List[float]] = None) -> List[tuple]:
+        """_dense_search 的非同步版本 - 非同步嵌入與 AsyncQdrantClient"""
+        candidate_k = self._candidate_k(k)
+        if query_vector is None:
+            query_vector = await self.vectorstore.embeddings.aembed_query(query)
+
+        # 本地副本的檔案檢查與矩陣運算在執行緒中進行
+        results = None
+        if self.local_index is not None:
+            results = await asyncio.to_thread(self._local_search_many, [query_vector], candidate_k, filters)
+            results = results[0] if results is not None else None
+
+        if results is None:
+            response = await self.async_qdrant_client.query_points(
+                collection_name=self.child_collection_name,
+                query=query_vector,
+                query_filter=filters.to_qdrant() if filters else None,
+                limit=candidate_k,
+                search_params=build_search_params(Config.VECTOR_QUANTIZATION, Config.QUANTIZATION_OVERSAMPLING),
+                with_payload=True,
+                with_vectors=self.mmr_enabled
+            )
+            results = [(self._point_to_document(point), point.score) for point in response.points]
+
+        if self.two_stage_rescore:
+            # 重新評分會讀取 SQLite 向量快取，完整查詢向量未快取時還會呼叫嵌入 API，不在事件迴圈中執行
+            results = await asyncio.to_thread(self._rescore_full_dimension, query, results, k)
+        return results
+
+    def _fetch_k(self, k: int) -> int:
+        """向量與BM25檢索的子段落數（MMR 啟用時多取候選供多樣化挑選）"""
+        return k * max(1, Config.MMR_FETCH_MULTIPLIER) if self.mmr_enabled else k
+
+    def _candidate_k(self, k: int) -> int:
+        """第一階段候選數（兩階段搜尋時取較多候選供重新評分）"""
+        return k * max(1, Config.EMBEDDING_RESCORE_CANDIDATES) if self.two_stage_rescore else k
+
+    def _local_search_many(self, query_vectors: List[List[float]], k: int,
+                           filters: Optional[RetrievalFilter] = None) -> Optional[List[List[tuple]]]:
+        """本地副本可用時在進程內批量檢索，否則返回 None"""
+        if self.local_index is None:
+            return None
+        try:
+            self.local_index.reload_if_changed()
+            if self.local_index.ready:
+                return [self.local_index.similarity_search_with_score(vector, k=k, filters=filters,
+                                                                      with_vectors=self.mmr_enabled)
+                        for vector in query_vectors]
+        except Exception as e:
+            logger.warning(f"本地向量批量檢索失敗，改用 Qdrant: {e}")
+        return None
+
+    def _batch_query_requests(self, query_vectors: List[List[float]], k: int,
+                              filters: Optional[RetrievalFilter] = None) -> List[QueryRequest]:
+        search_params = build_search_params(Config.VECTOR_QUANTIZATION, Config.QUANTIZATION_OVERSAMPLING)
+        query_filter = filters.to_qdrant() if filters else None
+        return [QueryRequest(query=vector, filter=query_filter, limit=k, params=search_params, with_payload=True,
+                             with_vector=self.mmr_enabled)
+                for vector in query_vectors]
+
+    def _finish_dense_search_many(self, queries: List[str], results: List[List[tuple]], k: int) -> List[List[tuple]]:
+        if not self.two_stage_rescore:
+            return results
+        return [self._rescore_full_dimension(query, docs, k) for query, docs in zip(queries, results)]
+
+    def _dense_search_many(self, queries: List[str], k: int,
+                           filters: Optional[RetrievalFilter] = None) -> List[List[tuple]]:
+        """批量向量檢索 - 單次嵌入呼叫，Qdrant 以單次 batch 查詢完成"""
+        candidate_k = self._candidate_k(k)
+        query_vectors = self.vectorstore.embeddings.embed_queries(queries)
+
+        results = self._local_search_many(query_vectors, candidate_k, filters)
+        if results is None:
+            responses = self.qdrant_client.query_batch_points(
+                collection_name=self.child_collection_name,
+                requests=self._batch_query_requests(query_vectors, candidate_k, filters)
+            )
+            results = [[(self._point_to_document(point), point.score) for point in response.points]
+                       for response in responses]
+        return self._finish_dense_search_many(queries, results, k)
+
+    async def _adense_search_many(self, queries: List[str], k: int,
+                                  filters: Optional[RetrievalFilter] = None) -> List[List[tuple]]:
+        """_dense_search_many 的非同步版本"""
+        candidate_k = self._candidate_k(k)
+        query_vectors = await self.vectorstore.embeddings.aembed_queries(queries)
+
+        results = None
+        if self.local_index is not None:
+            results = await asyncio.to_thread(self._local_search_many, query_vectors, candidate_k, filters)
+        if results is None:
+            responses = await self.async_qdrant_client.query_batch_points(
+                collection_name=self.child_collection_name,
+                requests=self._batch_query_requests(query_vectors, candidate_k, filters)
+            )
+            results = [[(self._point_to_document(point), point.score) for point in response.points]
+                       for response in responses]
+        if not self.two_stage_rescore:
+            return results
+        return await asyncio.to_thread(self._finish_dense_search_many, queries, results, k)
+
+    def _point_to_document(self, point) -> Document:
+        """以與 langchain Qdrant 相同的格式還原子段落 Document"""
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = str(point.id)
+        metadata["_collection_name"] = self.child_collection_name
+        if point.vector is not None:
+            metadata["_vector"] = point.vector
+        return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+    def _rescore_full_dimension(self, query: str, results: List[tuple], k: int) -> List[tuple]:
+        """以文件向量快取中的完整維度向量重新計算餘弦相似度（缺少完整向量的候選保留第一階段分數）"""
+        if not results:
+            return results
+        try:
+            embeddings = self.vectorstore.embeddings
+            query_vector = embeddings.full_query_vector(query)
+            query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+            full_vectors = embeddings.full_document_vectors([doc.page_content for doc, _ in results])
+
+            rescored = []
+            for (doc, score), vector in zip(results, full_vectors):
+                if vector is not None and vector.shape[0] == query_vector.shape[0]:
+                    score = float(vector @ query_vector / max(float(np.linalg.norm(vector)), 1e-12))
+                rescored.append((doc, score))
+            rescored.sort(key=lambda item: item[1], reverse=True)
+            return rescored[:k]
+        except Exception as e:
+            logger.warning(f"完整維度重新評分失敗，使用第一階段結果: {e}")
+            return results[:k]
+
+    def apply_quantization(self, mode: str) -> Dict[str, Any]:
+        """
+        將現有子段落集合遷移到指定的量化模式（Qdrant 會在背景重建量化索引）
+
+        Args:
+            mode: none / int8 / binary
+        """
+        mode = normalize_mode(mode)
+        self.qdrant_client.update_collection(
+            collection_name=self.child_collection_name,
+            vectors_config={"": VectorParamsDiff(on_disk=mode != "none")},
+            quantization_config=build_quantization_config(mode) or Disabled.DISABLED
+        )
+        logger.info(f"✅ 子段落集合量化模式已更新: {self.child_collection_name} -> {mode}")
+
+        if self.local_index is not None:
+            self.local_index = LocalVectorIndex(
+                Config.LOCAL_VECTOR_INDEX_DIR,
+                self.child_collection_name,
+                quantization=mode,
+                oversampling=Config.QUANTIZATION_OVERSAMPLING
+            )
+
+        return {"collection": self.child_collection_name, "quantization": mode}
+
+    def _ensure_bm25_index(self) -> bool:
+        """
+        返回BM25索引是否可用；索引檔案不存在時在背景執行緒從子段落集合掃描建立，
+        建立完成前查詢只使用向量檢索（不在請求路徑上掃描集合與分詞）
+        """
+        if self._bm25_ready.is_set():
+            return True
+        with self._bm25_lock:
+            if self._bm25_ready.is_set() or self._bm25_building:
+                return self._bm25_ready.is_set()
+            if len(self.bm25_index) > 0:
+                self._bm25_ready.set()
+                return True
+            self._bm25_building = True
+            generation = self._bm25_generation
+
+        threading.Thread(
+            target=self._build_bm25_index,
+            args=(generation,),
+            name=f"bm25-build-{self.child_collection_name}",
+            daemon=True
+        ).start()
+        return False
+
+    def _build_bm25_index(self, generation: int) -> None:
+        """背景建立BM25索引（索引被重設時停止）"""
+        try:
+            logger.info(f"🔄 從 {self.child_collection_name} 建立BM25索引...")
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    collection_name=self.child_collection_name,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                with self._bm25_lock:
+                    if generation != self._bm25_generation:
+                        return
+                    self.bm25_index.add_documents(
+                        [str(point.id) for point in points],
+                        [(point.payload or {}).get("page_content", "") for point in points],
+                        [(point.payload or {}).get("metadata") or {} for point in points]
+                    )
+                if offset is None:
+                    break
+            with self._bm25_lock:
+                if generation != self._bm25_generation:
+                    return
+                self.bm25_index.save()
+                self._bm25_ready.set()
+            logger.info(f"✅ BM25索引建立完成: {len(self.bm25_index)} 個子段落")
+        except Exception as e:
+            logger.warning(f"建立BM25索引失敗，僅使用向量檢索: {e}")
+        finally:
+            with self._bm25_lock:
+                if generation == self._bm25_generation:
+                    self._bm25_building = False
+
+    def reset_bm25_index(self) -> None:
+        """子段落集合刪除後清空BM25索引並刪除索引檔案（停止進行中的背景建立）"""
+        if self.bm25_index is None:
+            return
+        with self._bm25_lock:
+            self._bm25_generation += 1
+            self._bm25_building = False
+            self._bm25_ready.clear()
+            self.bm25_index.clear()
+        logger.info(f"🔄 已清空BM25索引: {self.child_collection_name}")
+
+    def _hybrid_fuse(self, query: str, child_docs: List[tuple], k: int,
+                     filters: Optional[RetrievalFilter] = None) -> List[tuple]:
+        """以倒數排名融合（RRF）合併向量檢索與BM25檢索的子段落"""
+        try:
+            if not self._ensure_bm25_index():
+                return child_docs
+            bm25_hits = self.bm25_index.search(query, k=k, metadata_filter=filters.matches if filters else None)
+            if not bm25_hits:
+                return child_docs
+
+            dense_by_id = {}
+            for child_doc, score in child_docs:
+                dense_by_id[str(child_doc.metadata.get('_id'))] = (child_doc, score)
+
+            fused = reciprocal_rank_fusion(
+                [list(dense_by_id), [doc_id for doc_id, _ in bm25_hits]],
+                k=Config.RRF_K
+            )
+
+            # 只由BM25找到的子段落沒有向量分數，使用候選中最低的向量分數
+            floor_score = min((score for _, score in child_docs), default=0.0)
+
+            # 融合分數記錄在 metadata["_fused_score"]，MMR 依各候選自己的融合分數計算相關性
+            results = []
+            for doc_id, fused_score in fused[:k]:
+                if doc_id in dense_by_id:
+                    child_doc, score = dense_by_id[doc_id]
+                    child_doc.metadata["_fused_score"] = fused_score
+                    results.append((child_doc, score))
+                    continue
+                entry = self.bm25_index.get(doc_id)
+                if entry:
+                    metadata = dict(entry["metadata"])
+                    metadata["_id"] = doc_id
+                    metadata["_fused_score"] = fused_score
+                    results.append((Document(page_content=entry["text"], metadata=metadata), floor_score))
+
+            logger.info(f"🔍 混合檢索: 向量 {len(child_docs)} + BM25 {len(bm25_hits)} -> 融合 {len(results)}")
+            return results
+        except Exception as e:
+            logger.warning(f"混合檢索失敗，使用向量檢索結果: {e}")
+            return child_docs
+
+    @staticmethod
+    def _pop_child_vectors(child_docs: List[tuple]) -> Dict[str, Any]:
+        """取出檢索時附在 metadata 中的子段落向量（只由BM25找到的子段落為 None）"""
+        return {str(child_doc.metadata.get('_id')): child_doc.metadata.pop('_vector', None)
+                for child_doc, _ in child_docs}
+
+    def _fetch_child_vectors(self, point_ids: List[str]) -> Dict[str, Any]:
+        """補取缺少的子段落向量 - 本地副本優先，否則以單次 retrieve 從 Qdrant 取得"""
+        if not point_ids:
+            return {}
+        if self.local_index is not None and self.local_index.ready:
+            return self.local_index.vectors_for(point_ids)
+        points = self.qdrant_client.retrieve(
+            collection_name=self.child_collection_name, ids=point_ids, with_payload=False, with_vectors=True
+        )
+        return {str(point.id): point.vector for point in points}
+
+    async def _afetch_child_vectors(self, point_ids: List[str]) -> Dict[str, Any]:
+        """_fetch_child_vectors 的非同步版本"""
+        if not point_ids:
+            return {}
+        if self.local_index is not None and self.local_index.ready:
+            return await asyncio.to_thread(self.local_index.vectors_for, point_ids)
+        points = await self.async_qdrant_client.retrieve(
+            collection_name=self.child_collection_name, ids=point_ids, with_payload=False, with_vectors=True
+        )
+        return {str(point.id): point.vector for point in points}
+
+    def _mmr_rerank(self, child_docs: List[tuple], vectors: Dict[str, Any], k: int) -> List[tuple]:
+        """
+        以 MMR 從候選中挑選 k 個子段落，並套用每個檔案、每個頁面的上限
+        相關性為各候選自己的分數：混合檢索時為融合分數（除以最高分縮放到 0-1，與向量相似度同尺度），否則為向量分數
+        """
+        usable = [i for i, (child_doc, _) in enumerate(child_docs)
+                  if vectors.get(str(child_doc.metadata.get('_id'))) is not None]
+        if len(usable) <= 1:
+            return child_docs[:k]
+
+        candidates = [child_docs[i] for i in usable]
+        fused_scores = [child_doc.metadata.get('_fused_score') for child_doc, _ in candidates]
+        if all(score is not None for score in fused_scores):
+            relevance = np.asarray(fused_scores, dtype=np.float32)
+            relevance = relevance / max(float(relevance.max()), 1e-12)
+        else:
+            relevance = np.asarray([score for _, score in candidates], dtype=np.float32)
+        matrix = np.asarray([vectors[str(child_doc.metadata.get('_id'))] for child_doc, _ in candidates],
+                            dtype=np.float32)
+        file_keys = [child_doc.metadata.get('source_filename') for child_doc, _ in candidates]
+        page_keys = [(child_doc.metadata.get('source_filename'), child_doc.metadata.get('page_num'))
+                     for child_doc, _ in candidates]
+
+        picks = mmr_select(relevance, matrix, k, lambda_mult=Config.MMR_LAMBDA,
+                           file_keys=file_keys, page_keys=page_keys,
+                           max_per_file=Config.MMR_MAX_PER_FILE, max_per_page=Config.MMR_MAX_PER_PAGE)
+        selected = [candidates[i] for i in picks]
+        logger.info(f"🔍 MMR多樣化: {len(child_docs)} 個候選 -> {len(selected)} 個子段落 "
+                    f"(涵蓋 {len({page_keys[i] for i in picks})} 個頁面)")
+        return selected
+
+    def _diversify(self, child_docs: List[tuple], k: int) -> List[tuple]:
+        """MMR 多樣化融合後的子段落，失敗時返回原排序的前 k 個"""
+        return self._diversify_many([child_docs], k)[0]
+
+    async def _adiversify(self, child_docs: List[tuple], k: int) -> List[tuple]:
+        """_diversify 的非同步版本"""
+        return (await self._adiversify_many([child_docs], k))[0]
+
+    def _diversify_many(self, child_docs_list: List[List[tuple]], k: int) -> List[List[tuple]]:
+        """批量檢索的 MMR 多樣化 - 所有查詢缺少的向量以單次請求補取"""
+        vectors_list = [self._pop_child_vectors(child_docs) for child_docs in child_docs_list]
+        try:
+            missing = list({doc_id for vectors in vectors_list for doc_id, vector in vectors.items() if vector is None})
+            fetched = self._fetch_child_vectors(missing)
+        except Exception as e:
+            logger.warning(f"補取子段落向量失敗: {e}")
+            fetched = {}
+        return [self._rerank_with(child_docs, vectors, fetched, k) for child_docs, vectors in zip(child_docs_list, vectors_list)]
+
+    async def _adiversify_many(self, child_docs_list: List[List[tuple]], k: int) -> List[List[tuple]]:
+        """_diversify_many 的非同步版本"""
+        vectors_list = [self._pop_child_vectors(child_docs) for child_docs in child_docs_list]
+        try:
+            missing = list({doc_id for vectors in vectors_list for doc_id, vector in vectors.items() if vector is None})
+            fetched = await self._afetch_child_vectors(missing)
+        except Exception as e:
+            logger.warning(f"補取子段落向量失敗: {e}")
+            fetched = {}
+        return await asyncio.to_thread(
+            lambda: [self._rerank_with(child_docs, vectors, fetched, k)
+                     for child_docs, vectors in zip(child_docs_list, vectors_list)]
+        )
+
+    def _rerank_with(self, child_docs: List[tuple], vectors: Dict[str, Any], fetched: Dict[str, Any],
+                     k: int) -> List[tuple]:
+        try:
+            vectors = {doc_id: vector if vector is not None else fetched.get(doc_id) for doc_id, vector in vectors.items()}
+            return self._mmr_rerank(child_docs, vectors, k)
+        except Exception as e:
+            logger.warning(f"MMR多樣化失敗，使用原排序: {e}")
+            return child_docs[:k]
+
     def _explain_relevance(self, query: str, doc: Document, score: float) -> str:
         """生成相關性解釋"""
         reasons = []
@@ -454,68 +1525,36 @@ class LangChainParentChildRAG:
         return "; ".join(reasons)
     
     def has_vector_data(self) -> bool:
-        """檢查是否有向量數據"""
-        try:
-            collections = self.qdrant_client.get_collections().collections
-            collection_names = [col.name for col in collections]
-            
-            if self.child_collection_name in collection_names:
-                child_info = self.qdrant_client.get_collection(self.child_collection_name)
-                child_count = child_info.vectors_count or child_info.points_count or 0
-                return child_count > 0
-            
-            return False
-        except Exception as e:
-            logger.warning(f"檢查向量數據時發生錯誤: {e}")
-            return False
+        """檢查是否有向量數據（讀取集合狀態快取，不呼叫 Qdrant）"""
+        return self.collection_monitor.has_data(self.child_collection_name)
+
+    def get_chunks_count(self) -> int:
+        """子段落數量（讀取集合狀態快取）"""
+        return self.collection_monitor.get(self.child_collection_name).points_count
     
-    def generate_answer(self, query: str, top_k: int = 10) -> Dict[str, Any]:
-        """生成回答 - 兼容原有 API"""
+    def generate_answer(self, query: str, top_k: int = 10,
+                        filters: Optional[RetrievalFilter] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """生成回答 - 兼容原有 API（use_cache=False 時略過語意回答快取）"""
         try:
+            cache_context = None
+            if self.answer_cache is not None and use_cache:
+                query_vector = self.vectorstore.embeddings.embed_query(query)
+                cache_context, cached = self._lookup_answer_cache(query, query_vector, top_k, filters)
+                if cached is not None:
+                    return cached
+            elif self.answer_cache is not None:
+                self.answer_cache.record_bypass()
+
             # 檢索相關段落
-            retrieval_results = self.retrieve_relevant_chunks(query, top_k)
+            retrieval_results = self.retrieve_relevant_chunks(query, top_k, filters=filters)
 
             if not retrieval_results:
-                return {
-                    "answer": "抱歉，我無法在知識庫中找到相關資訊來回答您的問題。",
-                    "sources": [],
-                    "query": query
-                }
-
-            # 準備上下文
-            context_parts = []
-            sources = []
-
-            for result in retrieval_results:
-                # 使用父段落作為上下文
-                context_parts.append(result.parent_content)
-
-                # 構建來源資訊
-                source_info = {
-                    "has_images": result.document.metadata.get('has_images', False),
-                    "image_paths": [result.document.metadata.get('image_path', '')] if result.document.metadata.get('image_path') else [],
-                    "page_num": result.document.metadata.get('page_num', 0),
-                    "topic": result.document.metadata.get('topic', ''),
-                    "content": result.child_content,
-                    "similarity_score": result.similarity_score
-                }
-                sources.append(source_info)
+                return self._no_result_answer(query)
 
-            # 使用 OpenAI 生成回答
-            from openai import OpenAI
-            client = OpenAI(api_key=Config.OPENAI_API_KEY)
-
-            context = "\n\n".join(context_parts[:5])  # 限制上下文長度
-
-            prompt = f"""基於以下教材內容回答問題：
+            prompt, sources, packed = self._prepare_answer(query, retrieval_results)
 
-{context}
-
-問題：{query}
-
-請根據教材內容提供準確、詳細的回答。"""
-
-            completion = client.chat.completions.create(
+            # 使用 OpenAI 生成回答（共用客戶端與連線池）
+            completion = get_openai_client().chat.completions.create(
                 model=Config.OPENAI_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=Config.MAX_TOKENS,
@@ -524,20 +1563,174 @@ class LangChainParentChildRAG:
 
             answer = completion.choices[0].message.content
 
-            return {
+            response = {
                 "answer": answer,
                 "sources": sources,
                 "query": query,
-                "retrieval_count": len(retrieval_results)
+                "retrieval_count": len(retrieval_results),
+                "context_tokens": packed.token_count
             }
+            self._store_answer_cache(cache_context, query, response)
+            return response
 
         except Exception as e:
             logger.error(f"生成回答失敗: {e}")
-            return {
-                "answer": f"抱歉，處理您的問題時發生錯誤：{str(e)}",
-                "sources": [],
-                "query": query
+            return self._error_answer(query, e)
+
+    async def agenerate_answer(self, query: str, top_k: int = 10,
+                               filters: Optional[RetrievalFilter] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """非同步生成回答 - 檢索與 LLM 呼叫都不阻塞事件迴圈"""
+        try:
+            cache_context = None
+            query_vector = None
+            if self.answer_cache is not None and use_cache:
+                query_vector = await self.vectorstore.embeddings.aembed_query(query)
+                # 讀取集合資料版本檔案與相似度計算在執行緒中進行
+                cache_context, cached = await asyncio.to_thread(
+                    self._lookup_answer_cache, query, query_vector, top_k, filters
+                )
+                if cached is not None:
+                    return cached
+            elif self.answer_cache is not None:
+                self.answer_cache.record_bypass()
+
+            retrieval_results = await self.aretrieve_relevant_chunks(query, top_k, filters=filters,
+                                                                     query_vector=query_vector)
+            response = await self._agenerate_from_results(query, retrieval_results)
+            if retrieval_results:
+                self._store_answer_cache(cache_context, query, response)
+            return response
+        except Exception as e:
+            logger.error(f"非同步生成回答失敗: {e}")
+            return self._error_answer(query, e)
+
+    async def agenerate_many(self, queries: List[str], top_k: int = 10, max_concurrency: int = 4,
+                             filters: Optional[RetrievalFilter] = None) -> List[Dict[str, Any]]:
+        """
+        批量生成回答 - 以 aretrieve_many 一次完成檢索，LLM 呼叫在並發上限內同時進行
+
+        Args:
+            queries: 問題列表
+            top_k: 每個問題的檢索數量
+            max_concurrency: 同時進行的 LLM 呼叫上限
+            filters: 所有問題共用的檢索過濾條件
+        """
+        retrieval_results_list = await self.aretrieve_many(queries, top_k, filters=filters)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def generate(query: str, retrieval_results: List[LangChainRetrievalResult]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self._agenerate_from_results(query, retrieval_results)
+                except Exception as e:
+                    logger.error(f"批量生成回答失敗 ({query}): {e}")
+                    return self._error_answer(query, e)
+
+        return await asyncio.gather(*[
+            generate(query, retrieval_results)
+            for query, retrieval_results in zip(queries, retrieval_results_list)
+        ])
+
+    async def _agenerate_from_results(self, query: str,
+                                      retrieval_results: List[LangChainRetrievalResult]) -> Dict[str, Any]:
+        """以已檢索的段落呼叫 LLM 生成回答"""
+        if not retrieval_results:
+            return self._no_result_answer(query)
+
+        # 上下文打包需要分詞計算 token 數，不在事件迴圈中執行
+        prompt, sources, packed = await asyncio.to_thread(self._prepare_answer, query, retrieval_results)
+
+        completion = await self.async_openai_client.chat.completions.create(
+            model=Config.OPENAI_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=Config.MAX_TOKENS,
+            temperature=Config.TEMPERATURE
+        )
+
+        return {
+            "answer": completion.choices[0].message.content,
+            "sources": sources,
+            "query": query,
+            "retrieval_count": len(retrieval_results),
+            "context_tokens": packed.token_count
+        }
+
+    def _lookup_answer_cache(self, query: str, query_vector: List[float], top_k: int,
+                             filters: Optional[RetrievalFilter], collection_names: Optional[List[str]] = None):
+        """
+        查找語意回答快取，返回 (cache_context, cached_answer)
+        分組包含參與檢索的集合、LLM 模型、top_k 與過濾條件；任一集合的資料版本不符的條目視為失效
+
+        Args:
+            collection_names: 參與檢索的集合（聯合檢索時），None 為目前集合
+        """
+        filters = self._normalize_filters(filters)
+        collection_names = tuple(sorted(collection_names or [self.collection_name]))
+        group = (collection_names, Config.OPENAI_MODEL, top_k, filters.cache_key() if filters else "")
+        generation = tuple(get_collection_generation(name) for name in collection_names)
+        cached = self.answer_cache.lookup(group, query, query_vector, generation)
+        if cached is not None:
+            logger.info(f"⚡ 語意回答快取命中 (相似度 {cached['cache_hit']['similarity']:.3f}): "
+                        f"{cached['cache_hit']['cached_query']}")
+        return (group, query_vector, generation), cached
+
+    def _store_answer_cache(self, cache_context, query: str, response: Dict[str, Any]) -> None:
+        if cache_context is None:
+            return
+        group, query_vector, generation = cache_context
+        try:
+            self.answer_cache.store(group, query, query_vector, generation, response)
+        except Exception as e:
+            logger.warning(f"寫入語意回答快取失敗: {e}")
+
+    def pack_context(self, retrieval_results: List[LangChainRetrievalResult], header=None, footer=None) -> PackedContext:
+        """在 CONTEXT_TOKEN_BUDGET 內依相關性打包父段落（所有回答路徑共用）"""
+        return self.context_packer.pack(retrieval_results, header=header, footer=footer)
+
+    def _prepare_answer(self, query: str, retrieval_results: List[LangChainRetrievalResult]):
+        """準備回答用的提示詞與來源資訊，返回 (prompt, sources, packed_context)"""
+        # 使用父段落作為上下文，以 token 預算限制長度；來源只列出實際放入提示詞的段落
+        packed = self.pack_context(retrieval_results)
+        context = packed.text
+
+        sources = []
+        for result in packed.results:
+            # 構建來源資訊
+            source_info = {
+                "has_images": result.document.metadata.get('has_images', False),
+                "image_paths": [result.document.metadata.get('image_path', '')] if result.document.metadata.get('image_path') else [],
+                "page_num": result.document.metadata.get('page_num', 0),
+                "topic": result.document.metadata.get('topic', ''),
+                "content": result.child_content,
+                "similarity_score": result.similarity_score
             }
+            sources.append(source_info)
+
+        prompt = f"""基於以下教材內容回答問題：
+
+{context}
+
+問題：{query}
+
+請根據教材內容提供準確、詳細的回答。"""
+
+        return prompt, sources, packed
+
+    @staticmethod
+    def _no_result_answer(query: str) -> Dict[str, Any]:
+        return {
+            "answer": "抱歉，我無法在知識庫中找到相關資訊來回答您的問題。",
+            "sources": [],
+            "query": query
+        }
+
+    @staticmethod
+    def _error_answer(query: str, error: Exception) -> Dict[str, Any]:
+        return {
+            "answer": f"抱歉，處理您的問題時發生錯誤：{str(error)}",
+            "sources": [],
+            "query": query
+        }
 
     def get_system_info(self) -> Dict[str, Any]:
         """獲取系統資訊"""
@@ -547,8 +1740,204 @@ class LangChainParentChildRAG:
             "child_collection": self.child_collection_name,
             "parent_collection": self.parent_collection_name,
             "embedding_model": Config.OPENAI_EMBEDDING_MODEL,
+            "embedding_dimension": self.embedding_dimension,
+            "two_stage_rescore": self.two_stage_rescore,
+            "mmr_enabled": self.mmr_enabled,
             "llm_model": Config.OPENAI_MODEL,
             "chunking_strategy": "langchain_parent_child",
             "parent_chunk_size": 1500,
-            "child_chunk_size": 400
+            "child_chunk_size": 400,
+            "parent_cache": self.docstore.cache_stats(),
+            "query_embedding_cache": self.query_embedding_cache.stats(),
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else {"enabled": False},
+            "embedding_batcher": self.embedding_batcher.stats() if self.embedding_batcher else {"enabled": False},
+            "document_embedding_cache": self.document_embedding_cache.stats() if self.document_embedding_cache else {"enabled": False},
+            "local_vector_index": self.local_index.stats() if self.local_index else {"ready": False},
+            "collection_state": self.collection_monitor.stats()
+        }
+
+
+# 進程內共用的客戶端與 RAG 實例
+_shared_lock = threading.Lock()
+_qdrant_clients: Dict[str, QdrantClient] = {}
+_async_qdrant_clients: Dict[str, AsyncQdrantClient] = {}
+_embedding_clients: Dict[tuple, OpenAIEmbeddings] = {}
+_openai_clients: Dict[str, Any] = {}
+_rag_systems: Dict[str, LangChainParentChildRAG] = {}
+_rag_last_used: Dict[str, float] = {}
+
+
+def _connection_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.QDRANT_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.QDRANT_MAX_CONNECTIONS
+    )
+
+
+def get_qdrant_client(url: str) -> QdrantClient:
+    """獲取（或建立）指定 Qdrant 服務的共用客戶端（保持連線的連線池）"""
+    with _shared_lock:
+        if url not in _qdrant_clients:
+            _qdrant_clients[url] = QdrantClient(url=url, limits=_connection_limits())
+        return _qdrant_clients[url]
+
+
+def get_async_qdrant_client(url: str) -> AsyncQdrantClient:
+    """獲取（或建立）指定 Qdrant 服務的共用非同步客戶端"""
+    with _shared_lock:
+        if url not in _async_qdrant_clients:
+            _async_qdrant_clients[url] = AsyncQdrantClient(url=url, limits=_connection_limits())
+        return _async_qdrant_clients[url]
+
+
+def get_shared_embeddings(model: str, dimension: int, native_dimension: int) -> OpenAIEmbeddings:
+    """獲取（或建立）指定模型與維度的共用嵌入客戶端"""
+    key = (model, dimension)
+    with _shared_lock:
+        if key not in _embedding_clients:
+            embedding_kwargs = {}
+            if dimension < native_dimension:
+                embedding_kwargs["dimensions"] = dimension
+            _embedding_clients[key] = OpenAIEmbeddings(
+                openai_api_key=Config.OPENAI_API_KEY,
+                model=model,
+                **embedding_kwargs
+            )
+        return _embedding_clients[key]
+
+
+def get_openai_client():
+    """共用的同步 OpenAI 客戶端"""
+    with _shared_lock:
+        if "sync" not in _openai_clients:
+            from openai import OpenAI
+            _openai_clients["sync"] = OpenAI(api_key=Config.OPENAI_API_KEY)
+        return _openai_clients["sync"]
+
+
+def get_async_openai_client():
+    """共用的非同步 OpenAI 客戶端"""
+    with _shared_lock:
+        if "async" not in _openai_clients:
+            from openai import AsyncOpenAI
+            _openai_clients["async"] = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+        return _openai_clients["async"]
+
+
+_rag_registry_lock = threading.Lock()
+# 建立中的實例 - 每個集合一把鎖，建立實例時不持有全域鎖，其他集合的請求不必等待
+_rag_creation_locks: Dict[str, threading.Lock] = {}
+
+
+def get_rag_system(collection_name: str) -> LangChainParentChildRAG:
+    """
+    獲取（或建立）指定集合的共用 RAG 實例
+    同一集合的所有請求、上傳與聯合檢索共用同一實例（快取、BM25 索引與本地向量副本也隨之共用）
+    """
+    with _rag_registry_lock:
+        rag = _rag_systems.get(collection_name)
+        if rag is not None:
+            now = time.monotonic()
+            evicted = _evict_rag_systems(now, collection_name)
+            _rag_last_used[collection_name] = now
+        else:
+            creation_lock = _rag_creation_locks.setdefault(collection_name, threading.Lock())
+
+    if rag is None:
+        with creation_lock:
+            with _rag_registry_lock:
+                rag = _rag_systems.get(collection_name)
+            try:
+                # 同一集合同時只建立一次，等待中的請求取得已建立的實例
+                if rag is None:
+                    rag = LangChainParentChildRAG(collection_name)
+                with _rag_registry_lock:
+                    now = time.monotonic()
+                    evicted = _evict_rag_systems(now, collection_name)
+                    rag = _rag_systems.setdefault(collection_name, rag)
+                    _rag_last_used[collection_name] = now
+            finally:
+                with _rag_registry_lock:
+                    if _rag_creation_locks.get(collection_name) is creation_lock:
+                        del _rag_creation_locks[collection_name]
+
+    for evicted_rag in evicted:
+        _unwatch_collections(evicted_rag)
+    return rag
+
+
+def _unwatch_collections(rag: LangChainParentChildRAG) -> None:
+    """停止追蹤已釋放實例的集合狀態"""
+    try:
+        rag.collection_monitor.unwatch([rag.child_collection_name, rag.docstore.collection_name])
+    except Exception as e:
+        logger.warning(f"停止追蹤集合狀態失敗: {e}")
+
+
+def release_collection(collection_name: str) -> None:
+    """
+    Qdrant 集合刪除後清除依附於該集合的本地狀態：
+    共用實例的 BM25 索引與本地向量副本（沒有對應實例時直接刪除檔案），
+    沒有實例使用的集合停止追蹤狀態
+    """
+    with _rag_registry_lock:
+        systems = [rag for rag in _rag_systems.values() if rag.child_collection_name == collection_name]
+        in_use = any(collection_name in (rag.child_collection_name, rag.docstore.collection_name)
+                     for rag in _rag_systems.values())
+        monitors = {id(rag.collection_monitor): rag.collection_monitor for rag in _rag_systems.values()}
+    if not in_use:
+        for monitor in monitors.values():
+            monitor.unwatch([collection_name])
+    for rag in systems:
+        rag.reset_bm25_index()
+
+    local_indexes = [rag.local_index for rag in systems if rag.local_index is not None]
+    if not local_indexes and os.path.exists(os.path.join(Config.LOCAL_VECTOR_INDEX_DIR, f"{collection_name}.meta.json")):
+        local_indexes = [LocalVectorIndex(Config.LOCAL_VECTOR_INDEX_DIR, collection_name)]
+    for local_index in local_indexes:
+        try:
+            local_index.drop()
+        except Exception as e:
+            logger.warning(f"刪除本地向量索引失敗: {e}")
+
+    bm25_path = os.path.join(Config.BM25_INDEX_DIR, f"{collection_name}.json")
+    try:
+        os.remove(bm25_path)
+        logger.info(f"🔄 已刪除BM25索引檔案: {bm25_path}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"刪除BM25索引檔案失敗: {e}")
+
+
+def _evict_rag_systems(now: float, requested: str) -> List[LangChainParentChildRAG]:
+    """
+    釋放閒置超過 TTL 的實例，新增實例會超過數量上限時再釋放最久未使用的實例
+    （主要集合與本次請求的集合不釋放）- 需持有 _rag_registry_lock，返回被釋放的實例
+    """
+    evictable = sorted((last_used, name) for name, last_used in _rag_last_used.items()
+                       if name not in (Config.QDRANT_COLLECTION_NAME, requested))
+    overflow = len(_rag_systems) + (requested not in _rag_systems) - max(1, Config.RAG_REGISTRY_MAX_SYSTEMS)
+    evicted = []
+    for index, (last_used, name) in enumerate(evictable):
+        if now - last_used <= Config.RAG_REGISTRY_TTL and index >= overflow:
+            break
+        rag = _rag_systems.pop(name, None)
+        _rag_last_used.pop(name, None)
+        if rag is not None:
+            evicted.append(rag)
+        logger.info(f"🔄 釋放閒置的 RAG 實例: {name}")
+    return evicted
+
+
+def get_rag_registry_stats() -> Dict[str, Any]:
+    """共用實例與客戶端的統計"""
+    with _rag_registry_lock, _shared_lock:
+        return {
+            "rag_systems": list(_rag_systems),
+            "rag_system_idle_seconds": {name: round(time.monotonic() - last_used, 1)
+                                        for name, last_used in _rag_last_used.items()},
+            "qdrant_clients": list(_qdrant_clients),
+            "async_qdrant_clients": list(_async_qdrant_clients),
+            "embedding_clients": [f"{model}:{dimension}" for model, dimension in _embedding_clients]
         }
@@ -0,0 +1,537 @@
+"""
+子段落向量的本地副本
+以記憶體映射的 float32 矩陣（已正規化）加上 JSON payload 檔案保存，
+多個 uvicorn worker 可共用同一份 mmap；Qdrant 仍是資料來源與備援。
+每次同步寫入帶版本號的新矩陣檔案，最後才替換 payload 檔案（記錄版本號），
+載入時確認兩者版本與大小一致，讀取中的 worker 不會看到不一致的矩陣與 payload。
+寫入新資料後只向 Qdrant 取回剛寫入的點，不重新掃描整個集合。
+同步（讀取目前版本、合併、寫入新版本）持有集合的檔案鎖，多個進程同時寫入不會遺失彼此的點；
+舊版本保留一段時間才刪除，其他進程在替換 payload 檔案前讀到的版本仍可載入。
+啟用量化時先在 int8 / binary 矩陣上過採樣候選，再以原始向量重新評分。
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from qdrant_client import QdrantClient
+
+from src.core.quantization import normalize_mode, quantize_int8, pack_binary, hamming_distances
+from src.core.retrieval_filters import PAYLOAD_INDEXES, RetrievalFilter
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只保留進程內的鎖
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadColumns:
+    """過濾欄位的欄式索引 - 載入時預先計算，過濾時以 NumPy 比對而不逐一檢查 payload"""
+
+    def __init__(self, payloads: List[Dict[str, Any]]):
+        self.count = len(payloads)
+        self.codes: Dict[str, np.ndarray] = {}  # 欄位 -> 每列的值代碼（-1 為缺少）
+        self.vocab: Dict[str, Dict[Any, int]] = {}  # 欄位 -> {值: 代碼}
+        for name in PAYLOAD_INDEXES:
+            vocab: Dict[Any, int] = {}
+            codes = np.full(self.count, -1, dtype=np.int32)
+            for row, payload in enumerate(payloads):
+                value = (payload.get("metadata") or {}).get(name)
+                if value is not None and not isinstance(value, (list, dict)):
+                    codes[row] = vocab.setdefault(value, len(vocab))
+            self.codes[name], self.vocab[name] = codes, vocab
+
+        pages = np.full(self.count, np.iinfo(np.int64).min, dtype=np.int64)
+        for value, code in self.vocab["page_num"].items():
+            if isinstance(value, int):
+                pages[self.codes["page_num"] == code] = value
+        self.pages = pages
+
+    def mask(self, filters: RetrievalFilter) -> np.ndarray:
+        """符合過濾條件的列（同一欄位內為 OR，不同欄位之間為 AND）"""
+        mask = np.ones(self.count, dtype=bool)
+        for name, values in filters.keyword_conditions().items():
+            if values:
+                wanted = [self.vocab[name][value] for value in values if value in self.vocab[name]]
+                mask &= np.isin(self.codes[name], wanted)
+        has_page = self.pages != np.iinfo(np.int64).min
+        if filters.page_min is not None:
+            mask &= has_page & (self.pages >= filters.page_min)
+        if filters.page_max is not None:
+            mask &= has_page & (self.pages <= filters.page_max)
+        return mask
+
+
+class LocalVectorIndex:
+    """本地 NumPy 向量索引 - 矩陣向量乘法取 top-k"""
+
+    # 量化矩陣分塊計算，避免每次查詢配置整個矩陣大小的暫存陣列
+    BLOCK_ROWS = 4096
+    # 舊版本檔案至少保留的秒數（前一個版本一律保留），讓正在載入的其他進程仍可映射
+    OLD_VERSION_GRACE_SECONDS = 300
+
+    def __init__(self, directory: str, collection_name: str, quantization: str = "none",
+                 oversampling: float = 2.0):
+        self.collection_name = collection_name
+        self.quantization = normalize_mode(quantization)
+        self.oversampling = max(1.0, oversampling)
+        self.directory = directory
+        self.meta_path = os.path.join(directory, f"{collection_name}.meta.json")
+        self.lock_path = os.path.join(directory, f"{collection_name}.lock")
+
+        self._lock = threading.RLock()
+        self._file_lock_depth = 0
+        self.matrix: Optional[np.ndarray] = None
+        self.quantized: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self._rows_by_id: Dict[str, int] = {}
+        self.payloads: List[Dict[str, Any]] = []
+        self.columns: Optional[PayloadColumns] = None
+        self.dimension = 0
+        self.version: Optional[int] = None
+        self.synced_at = 0.0
+        self._loaded_mtime = None
+
+        if self.synced:
+            try:
+                self.load()
+            except Exception as e:
+                logger.warning(f"載入本地向量索引失敗: {e}")
+
+    @property
+    def ready(self) -> bool:
+        return self.matrix is not None and len(self.ids) > 0
+
+    @property
+    def synced(self) -> bool:
+        """是否曾經同步過（空集合同步後也會有 payload 檔案）"""
+        return os.path.exists(self.meta_path)
+
+    def _matrix_path(self, version: Optional[int]) -> str:
+        # 舊版檔案沒有版本號
+        suffix = f".{version}" if version is not None else ""
+        return os.path.join(self.directory, f"{self.collection_name}{suffix}.f32")
+
+    def _quantized_path(self, version: Optional[int]) -> str:
+        suffix = f".{version}" if version is not None else ""
+        return os.path.join(self.directory, f"{self.collection_name}{suffix}.{self.quantization}")
+
+    @staticmethod
+    def _check_size(path: str, expected: int) -> None:
+        size = os.path.getsize(path) if os.path.exists(path) else -1
+        if size != expected:
+            raise ValueError(f"本地向量檔案與 payload 版本不符: {path} ({size} != {expected} bytes)")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @contextmanager
+    def _file_lock(self):
+        """集合的跨進程排他鎖（同一實例可重入，需持有 self._lock）"""
+        if fcntl is None or self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reset(self) -> None:
+        """清空記憶體中的索引（不再映射任何版本）"""
+        self.matrix, self.quantized, self.scales = None, None, None
+        self.ids = []
+        self._rows_by_id = {}
+        self.payloads = []
+        self.columns = None
+        self.dimension = 0
+        self.version = None
+        self.synced_at = 0.0
+        self._loaded_mtime = None
+
+    def load(self) -> None:
+        """以唯讀 mmap 載入矩陣與 payload（版本或大小不一致時拋出例外，保留目前已載入的版本）"""
+        with self._lock:
+            mtime = os.path.getmtime(self.meta_path)
+            meta = self._read_meta()
+
+            count, dimension, version = meta["count"], meta["dimension"], meta.get("version")
+            matrix_path = self._matrix_path(version)
+            self._check_size(matrix_path, count * dimension * 4)
+            matrix = np.memmap(matrix_path, dtype=np.float32, mode="r", shape=(count, dimension)) if count else None
+
+            # 量化矩陣不存在（例如剛切換量化模式）時從原始矩陣建立
+            quantized, scales = None, None
+            if count and self.quantization != "none":
+                if meta.get("quantization") != self.quantization or not os.path.exists(self._quantized_path(version)):
+                    scales = self._write_quantized(np.asarray(matrix), version)
+                    mtime = os.path.getmtime(self.meta_path)
+                else:
+                    scales = meta.get("scales")
+                quantized, scales = self._load_quantized(count, dimension, version, scales)
+
+            self.matrix, self.quantized, self.scales = matrix, quantized, scales
+            self.ids = meta["ids"]
+            self._rows_by_id = {point_id: row for row, point_id in enumerate(self.ids)}
+            self.payloads = meta["payloads"]
+            self.columns = PayloadColumns(self.payloads)
+            self.dimension = dimension
+            self.version = version
+            self.synced_at = meta.get("synced_at", 0.0)
+            self._loaded_mtime = mtime
+            logger.info(f"✅ 載入本地向量索引: {self.collection_name} ({count} x {dimension}, 版本 {version})")
+
+    def _read_meta(self) -> Dict[str, Any]:
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_quantized(self, matrix: np.ndarray, version: Optional[int]) -> Optional[List[float]]:
+        """
+        寫入與原始矩陣相同版本的量化矩陣，返回縮放係數；
+        payload 檔案仍是同一版本時記錄量化模式與縮放係數（其他進程已寫入新版本時不覆蓋）
+        """
+        quantized_path = self._quantized_path(version)
+        temp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        scales = None
+        if self.quantization == "int8":
+            quantized, scales = quantize_int8(matrix)
+            scales = scales.tolist()
+        else:
+            quantized = pack_binary(matrix)
+        quantized.tofile(temp_path)
+        os.replace(temp_path, quantized_path)
+
+        with self._file_lock():
+            meta = self._read_meta()
+            if meta.get("version") == version:
+                meta["quantization"] = self.quantization
+                meta["scales"] = scales
+                self._write_meta(meta)
+        return scales
+
+    def _load_quantized(self, count: int, dimension: int, version: Optional[int], scales) -> tuple:
+        quantized_path = self._quantized_path(version)
+        if self.quantization == "int8":
+            self._check_size(quantized_path, count * dimension)
+            return (np.memmap(quantized_path, dtype=np.int8, mode="r", shape=(count, dimension)),
+                    np.asarray(scales, dtype=np.float32))
+        self._check_size(quantized_path, count * math.ceil(dimension / 8))
+        return np.memmap(quantized_path, dtype=np.uint8, mode="r", shape=(count, math.ceil(dimension / 8))), None
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        temp_meta_path = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(temp_meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_meta_path, self.meta_path)
+
+    def reload_if_changed(self) -> None:
+        """其他進程重新同步後載入新的檔案（索引已被其他進程刪除時清空）"""
+        try:
+            if not os.path.exists(self.meta_path):
+                if self._loaded_mtime is not None:
+                    with self._lock:
+                        self._reset()
+                    logger.info(f"🔄 本地向量索引已刪除: {self.collection_name}")
+            elif os.path.getmtime(self.meta_path) != self._loaded_mtime:
+                self.load()
+        except Exception as e:
+            logger.warning(f"重新載入本地向量索引失敗: {e}")
+
+    @staticmethod
+    def _point_vector(point):
+        vector = point.vector
+        if isinstance(vector, dict):  # 具名向量時取第一個
+            vector = next(iter(vector.values()), None)
+        return vector
+
+    @staticmethod
+    def _normalized(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def sync(self, qdrant_client: QdrantClient, point_ids: Optional[Iterable[str]] = None,
+             removed_ids: Optional[Iterable[str]] = None, batch_size: int = 512) -> int:
+        """
+        同步 Qdrant 集合到本地檔案，返回索引中的點數
+
+        Args:
+            point_ids: 剛寫入（新增或覆蓋）的點ID，提供時只取回這些點；None 或尚未同步過時掃描整個集合
+            removed_ids: 已從集合刪除的點ID
+        """
+        with self._lock, self._file_lock():
+            # 持有檔案鎖後才讀取最新版本，合併結果不會覆蓋其他進程剛寫入的點
+            self.reload_if_changed()
+            if point_ids is not None and self.synced and self.version is not None:
+                return self._sync_points(qdrant_client, list(point_ids), list(removed_ids or []), batch_size)
+            return self._sync_all(qdrant_client, batch_size)
+
+    def _sync_points(self, qdrant_client: QdrantClient, point_ids: List[str], removed_ids: List[str],
+                     batch_size: int) -> int:
+        """以點ID取回新寫入的點，與目前的矩陣合併後寫入新版本"""
+        start_time = time.time()
+        fetched = {}
+        for start in range(0, len(point_ids), batch_size):
+            for point in qdrant_client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids[start:start + batch_size],
+                with_payload=True,
+                with_vectors=True
+            ):
+                vector = self._point_vector(point)
+                if vector is not None:
+                    fetched[str(point.id)] = (point.payload or {}, vector)
+
+        if fetched and self.dimension and len(next(iter(fetched.values()))[1]) != self.dimension:
+            logger.info("本地向量索引維度變更，重新掃描整個集合")
+            return self._sync_all(qdrant_client, batch_size)
+
+        removed = set(removed_ids) | (set(point_ids) - set(fetched))
+        removed_count = sum(1 for point_id in removed if point_id in self._rows_by_id)
+        keep = [row for row, point_id in enumerate(self.ids) if point_id not in removed and point_id not in fetched]
+        ids = [self.ids[row] for row in keep] + list(fetched)
+        payloads = [self.payloads[row] for row in keep] + [payload for payload, _ in fetched.values()]
+        parts = []
+        if keep and self.matrix is not None:
+            parts.append(np.asarray(self.matrix[keep]))
+        if fetched:
+            parts.append(self._normalized([vector for _, vector in fetched.values()]))
+        matrix = np.concatenate(parts) if parts else None
+
+        self._write(ids, payloads, matrix)
+        logger.info(f"✅ 本地向量索引增量同步完成: 更新 {len(fetched)} 個點，移除 "
+                    f"{removed_count} 個點，共 {len(ids)} 個點，耗時 {time.time() - start_time:.2f}秒")
+        return len(ids)
+
+    def _sync_all(self, qdrant_client: QdrantClient, batch_size: int) -> int:
+        """掃描整個集合的向量並寫入本地檔案"""
+        start_time = time.time()
+        ids, payloads, vectors = [], [], []
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for point in points:
+                vector = self._point_vector(point)
+                if vector is None:
+                    continue
+                ids.append(str(point.id))
+                payloads.append(point.payload or {})
+                vectors.append(vector)
+            if offset is None:
+                break
+
+        self._write(ids, payloads, self._normalized(vectors) if vectors else None)
+        logger.info(f"✅ 本地向量索引同步完成: {len(ids)} 個點，耗時 {time.time() - start_time:.2f}秒")
+        return len(ids)
+
+    def _write(self, ids: List[str], payloads: List[Dict[str, Any]], matrix: Optional[np.ndarray]) -> None:
+        """
+        寫入新版本：先寫帶版本號的矩陣（與量化矩陣），最後替換 payload 檔案；
+        讀取中的 worker 仍持有舊版本的 mmap，載入時只會看到版本一致的檔案
+        """
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        version = max(time.time_ns(), (self.version or 0) + 1)
+        dimension = int(matrix.shape[1]) if matrix is not None else 0
+
+        matrix_path = self._matrix_path(version)
+        temp_matrix_path = f"{matrix_path}.{os.getpid()}.tmp"
+        if matrix is not None:
+            np.ascontiguousarray(matrix, dtype=np.float32).tofile(temp_matrix_path)
+        else:
+            open(temp_matrix_path, "wb").close()
+        os.replace(temp_matrix_path, matrix_path)
+
+        scales = None
+        if matrix is not None and self.quantization != "none":
+            quantized_path = self._quantized_path(version)
+            if self.quantization == "int8":
+                quantized, scales = quantize_int8(matrix)
+                scales = scales.tolist()
+            else:
+                quantized = pack_binary(matrix)
+            quantized.tofile(f"{quantized_path}.{os.getpid()}.tmp")
+            os.replace(f"{quantized_path}.{os.getpid()}.tmp", quantized_path)
+
+        self._write_meta({
+            "version": version,
+            "count": len(ids),
+            "dimension": dimension,
+            "quantization": self.quantization,
+            "scales": scales,
+            "ids": ids,
+            "payloads": payloads,
+            "synced_at": time.time()
+        })
+        self.load()
+        self._remove_old_versions(version)
+
+    def _version_files(self) -> List[Tuple[Optional[int], str]]:
+        """集合的矩陣與量化矩陣檔案 [(版本, 路徑)]（舊版無版本號的檔案版本為 None）"""
+        prefix = f"{self.collection_name}."
+        pattern = os.path.join(glob.escape(self.directory), f"{glob.escape(self.collection_name)}.*")
+        files = []
+        for path in glob.glob(pattern):
+            if path in (self.meta_path, self.lock_path) or path.endswith(".tmp"):
+                continue
+            head = os.path.basename(path)[len(prefix):].split(".", 1)[0]
+            files.append((int(head) if head.isdigit() else None, path))
+        return files
+
+    def _remove_old_versions(self, version: int) -> None:
+        """
+        刪除舊版本的矩陣檔案（需持有檔案鎖）- 目前與前一個版本一律保留，
+        更舊的版本超過 OLD_VERSION_GRACE_SECONDS 才刪除，其他進程讀到舊 payload 後仍來得及映射
+        """
+        files = self._version_files()
+        older = sorted({file_version for file_version, _ in files
+                        if file_version is not None and file_version < version})
+        keep = {version} | set(older[-1:])
+        now = time.time()
+        for file_version, path in files:
+            if file_version in keep:
+                continue
+            try:
+                if now - os.path.getmtime(path) > self.OLD_VERSION_GRACE_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def drop(self) -> None:
+        """集合刪除後清空索引並刪除所有版本與 payload 檔案（其他進程下次讀取時一併清空）"""
+        with self._lock, self._file_lock():
+            self._reset()
+            for path in [self.meta_path] + [path for _, path in self._version_files()]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"刪除本地向量檔案失敗: {path} ({e})")
+        logger.info(f"🔄 已刪除本地向量索引: {self.collection_name}")
+
+    def search(self, query_vector: List[float], k: int = 10, exact: bool = False,
+               filters: Optional[RetrievalFilter] = None) -> List[Tuple[int, float]]:
+        """
+        餘弦相似度 top-k，返回 [(列索引, 分數)]（分數由高到低）
+
+        Args:
+            query_vector: 查詢向量
+            k: 返回數量
+            exact: True 時略過量化，直接以原始向量計算
+            filters: 子段落 metadata 過濾條件（以預先計算的欄式索引選出列，符合的列以原始向量精確計算）
+        """
+        with self._lock:
+            if not self.ready:
+                return []
+            query = np.array(query_vector, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+
+            if filters is not None:
+                rows = np.flatnonzero(self.columns.mask(filters))
+                if not rows.size:
+                    return []
+                return self._top_k(rows, self.matrix[rows] @ query, min(k, rows.size))
+
+            k = min(k, len(self.ids))
+
+            if self.quantized is None or exact:
+                scores = self.matrix @ query
+                return self._top_k(np.arange(scores.shape[0]), scores, k)
+
+            # 在量化矩陣上過採樣候選，再以原始向量重新評分（只讀取候選列）
+            candidates = self._quantized_candidates(query, min(len(self.ids), math.ceil(k * self.oversampling)))
+            scores = self.matrix[np.sort(candidates)] @ query
+            return self._top_k(np.sort(candidates), scores, k)
+
+    def _quantized_candidates(self, query: np.ndarray, count: int) -> np.ndarray:
+        """以量化向量估計相似度並返回前 count 個列索引"""
+        rows = self.quantized.shape[0]
+        if self.quantization == "int8":
+            scaled_query = query * self.scales
+            approx = np.empty(rows, dtype=np.float32)
+            for start in range(0, rows, self.BLOCK_ROWS):
+                block = self.quantized[start:start + self.BLOCK_ROWS]
+                approx[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        else:
+            packed_query = pack_binary(query)
+            approx = np.empty(rows, dtype=np.float32)
+            for start in range(0, rows, self.BLOCK_ROWS):
+                block = self.quantized[start:start + self.BLOCK_ROWS]
+                approx[start:start + len(block)] = -hamming_distances(block, packed_query).astype(np.float32)
+
+        if count >= rows:
+            return np.arange(rows)
+        return np.argpartition(-approx, count - 1)[:count]
+
+    @staticmethod
+    def _top_k(indices: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(indices[i]), float(scores[i])) for i in top]
+
+    def document(self, index: int) -> Document:
+        """以與 langchain Qdrant 相同的格式還原子段落 Document"""
+        payload = self.payloads[index]
+        metadata = dict(payload.get("metadata") or {})
+        metadata["_id"] = self.ids[index]
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+    def similarity_search_with_score(self, query_vector: List[float], k: int = 10,
+                                     filters: Optional[RetrievalFilter] = None,
+                                     with_vectors: bool = False) -> List[Tuple[Document, float]]:
+        """與 vectorstore.similarity_search_with_score 相同格式的結果（with_vectors 時於 metadata["_vector"] 附上向量）"""
+        with self._lock:
+            results = []
+            for index, score in self.search(query_vector, k, filters=filters):
+                document = self.document(index)
+                if with_vectors:
+                    document.metadata["_vector"] = np.array(self.matrix[index])
+                results.append((document, score))
+            return results
+
+    def vectors_for(self, point_ids: List[str]) -> Dict[str, np.ndarray]:
+        """依點ID取得（已正規化的）向量，不在索引中的ID略過"""
+        with self._lock:
+            return {point_id: np.array(self.matrix[self._rows_by_id[point_id]])
+                    for point_id in point_ids if point_id in self._rows_by_id}
+
+    def stats(self) -> Dict[str, Any]:
+        """獲取索引統計"""
+        return {
+            "ready": self.ready,
+            "points": len(self.ids),
+            "dimension": self.dimension,
+            "quantization": self.quantization,
+            "bytes": int(self.matrix.nbytes) if self.matrix is not None else 0,
+            "quantized_bytes": int(self.quantized.nbytes) if self.quantized is not None else 0,
+            "version": self.version,
+            "synced_at": self.synced_at
+        }
@@ -0,0 +1,70 @@
+"""
+最大邊際相關性（MMR）重新排序
+以矩陣運算計算候選子段落之間的相似度，逐步挑選「與查詢相關、與已選結果不重複」的段落，
+並可限制同一檔案、同一頁面的段落數量，避免重複範本頁面佔滿上下文
+"""
+
+from typing import Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def mmr_select(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.7,
+               file_keys: Optional[Sequence[Hashable]] = None, page_keys: Optional[Sequence[Hashable]] = None,
+               max_per_file: int = 0, max_per_page: int = 0) -> List[int]:
+    """
+    MMR 挑選，返回依挑選順序排列的候選索引
+
+    Args:
+        relevance: 各候選與查詢的相關性分數 (n,)
+        vectors: 候選向量 (n, d)，函數內會正規化
+        k: 挑選數量
+        lambda_mult: 1 為只看相關性，0 為只看多樣性
+        file_keys / page_keys: 各候選所屬的檔案、頁面
+        max_per_file / max_per_page: 同一檔案、同一頁面最多挑選的數量（0 為不限制）
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    # 以整數編碼分組，方便用遮罩一次排除已達上限的候選
+    file_ids = _encode(file_keys, count) if max_per_file > 0 else None
+    page_ids = _encode(page_keys, count) if max_per_page > 0 else None
+    file_counts = np.zeros(count, dtype=np.int32)
+    page_counts = np.zeros(count, dtype=np.int32)
+
+    available = np.ones(count, dtype=bool)
+    max_similarity = np.zeros(count, dtype=np.float32)
+    selected = []
+
+    while len(selected) < k and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        max_similarity = np.maximum(max_similarity, similarity[pick])
+
+        if file_ids is not None:
+            file_counts[file_ids[pick]] += 1
+            if file_counts[file_ids[pick]] >= max_per_file:
+                available &= file_ids != file_ids[pick]
+        if page_ids is not None:
+            page_counts[page_ids[pick]] += 1
+            if page_counts[page_ids[pick]] >= max_per_page:
+                available &= page_ids != page_ids[pick]
+
+    return selected
+
+
+def _encode(keys: Optional[Sequence[Hashable]], count: int) -> np.ndarray:
+    """將分組鍵值轉為 0..m-1 的整數編號（未提供時每個候選自成一組）"""
+    if keys is None:
+        return np.arange(count)
+    codes = {}
+    return np.fromiter((codes.setdefault(key, len(codes)) for key in keys), dtype=np.int64, count=count)
@@ -0,0 +1,69 @@
+"""
+向量量化設定
+Qdrant 集合的量化配置與搜尋參數，以及本地向量副本使用的 int8 / binary 量化
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+)
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# 每個位元組的 1 位元數量，用於計算漢明距離
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def normalize_mode(mode: Optional[str]) -> str:
+    """檢查量化模式名稱"""
+    mode = (mode or "none").lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"不支援的量化模式: {mode}，可用: {', '.join(QUANTIZATION_MODES)}")
+    return mode
+
+
+def build_quantization_config(mode: str):
+    """Qdrant 集合的量化配置（量化向量常駐記憶體，原始向量可放在磁碟）"""
+    mode = normalize_mode(mode)
+    if mode == "int8":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def build_search_params(mode: str, oversampling: float, ignore: bool = False) -> Optional[SearchParams]:
+    """量化集合的搜尋參數：在量化向量上過採樣，再以原始向量重新評分"""
+    if normalize_mode(mode) == "none" and not ignore:
+        return None
+    return SearchParams(
+        quantization=QuantizationSearchParams(ignore=ignore, rescore=True, oversampling=oversampling)
+    )
+
+
+def quantize_int8(matrix: np.ndarray, quantile: float = 0.99) -> Tuple[np.ndarray, np.ndarray]:
+    """逐維度對稱 int8 量化，返回 (int8 矩陣, 各維度縮放係數)"""
+    bounds = np.quantile(np.abs(matrix), quantile, axis=0).astype(np.float32)
+    scales = np.maximum(bounds, 1e-12) / 127.0
+    quantized = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+    return quantized, scales
+
+
+def pack_binary(matrix: np.ndarray) -> np.ndarray:
+    """以正負號量化為位元並打包"""
+    return np.packbits(matrix > 0, axis=-1)
+
+
+def hamming_distances(packed_matrix: np.ndarray, packed_query: np.ndarray) -> np.ndarray:
+    """打包位元矩陣與查詢之間的漢明距離"""
+    return _POPCOUNT_TABLE[np.bitwise_xor(packed_matrix, packed_query)].sum(axis=1, dtype=np.uint32)
@@ -0,0 +1,80 @@
+"""
+檢索過濾條件
+子段落 payload（langchain Qdrant 的 metadata 欄位）上的索引與過濾：
+來源檔名、來源文件哈希、主題、內容類型為 keyword 索引，頁碼為 integer 索引
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from qdrant_client.models import FieldCondition, Filter, MatchAny, PayloadSchemaType, Range
+
+# langchain Qdrant 將 Document.metadata 存放在此 payload 欄位下
+METADATA_PAYLOAD_KEY = "metadata"
+
+# 子段落集合建立的 payload 索引
+PAYLOAD_INDEXES = {
+    "source_filename": PayloadSchemaType.KEYWORD,
+    "source_file_hash": PayloadSchemaType.KEYWORD,  # 重新處理文件時找出舊的點
+    "topic": PayloadSchemaType.KEYWORD,
+    "content_type": PayloadSchemaType.KEYWORD,
+    "page_num": PayloadSchemaType.INTEGER,
+}
+
+
+def payload_field(name: str) -> str:
+    return f"{METADATA_PAYLOAD_KEY}.{name}"
+
+
+@dataclass
+class RetrievalFilter:
+    """檢索過濾條件（同一欄位內為 OR，不同欄位之間為 AND）"""
+    source_filenames: List[str] = field(default_factory=list)
+    topics: List[str] = field(default_factory=list)
+    content_types: List[str] = field(default_factory=list)
+    page_nums: List[int] = field(default_factory=list)
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.source_filenames or self.topics or self.content_types or self.page_nums
+                    or self.page_min is not None or self.page_max is not None)
+
+    def keyword_conditions(self) -> Dict[str, List[Any]]:
+        """欄位 -> 允許的值（空列表為不限制）"""
+        return {
+            "source_filename": self.source_filenames,
+            "topic": self.topics,
+            "content_type": self.content_types,
+            "page_num": self.page_nums,
+        }
+
+    def to_qdrant(self) -> Optional[Filter]:
+        """轉換為 Qdrant 過濾條件，沒有條件時返回 None"""
+        if self.is_empty:
+            return None
+        must = [
+            FieldCondition(key=payload_field(name), match=MatchAny(any=list(values)))
+            for name, values in self.keyword_conditions().items() if values
+        ]
+        if self.page_min is not None or self.page_max is not None:
+            must.append(FieldCondition(key=payload_field("page_num"), range=Range(gte=self.page_min, lte=self.page_max)))
+        return Filter(must=must)
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """以子段落 metadata 判斷是否符合條件（本地向量副本與 BM25 索引使用）"""
+        for name, values in self.keyword_conditions().items():
+            if values and metadata.get(name) not in values:
+                return False
+        page_num = metadata.get("page_num")
+        if self.page_min is not None and (page_num is None or page_num < self.page_min):
+            return False
+        if self.page_max is not None and (page_num is None or page_num > self.page_max):
+            return False
+        return True
+
+    def cache_key(self) -> str:
+        """供快取鍵值使用的穩定字串"""
+        return repr((sorted(self.source_filenames), sorted(self.topics), sorted(self.content_types),
+                     sorted(self.page_nums), self.page_min, self.page_max))
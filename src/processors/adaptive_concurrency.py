@@ -0,0 +1,179 @@
+"""
+視覺模型呼叫的自適應並發控制（AIMD）
+延遲與錯誤率正常時逐步增加同時進行的頁面請求（加法增加），
+遇到 429 / 節流例外時立即減半（乘法減少），並記錄並發上限的變化軌跡
+"""
+
+import asyncio
+import fnmatch
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 例外名稱或訊息中出現以下字樣視為節流（OpenAI RateLimitError、Bedrock ThrottlingException 等）
+THROTTLING_MARKERS = ("429", "ratelimit", "rate limit", "rate_limit", "throttl", "too many requests",
+                      "quota", "serviceunavailable", "overloaded")
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """判斷例外是否為 API 節流"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in THROTTLING_MARKERS)
+
+
+def parse_model_limits(value: str) -> Dict[str, int]:
+    """解析 `模型=上限` 的逗號分隔設定（模型名稱可使用 * 萬用字元），例如 gpt-4o=16,bedrock/*=8"""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        pattern, limit = item.split("=", 1)
+        try:
+            limits[pattern.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"忽略無效的並發上限設定: {item}")
+    return limits
+
+
+def limit_for_model(model: str, limits: Dict[str, int], default: int) -> int:
+    """依模型名稱查詢並發上限（完全相符優先，其次為萬用字元）"""
+    if model in limits:
+        return limits[model]
+    for pattern, limit in limits.items():
+        if fnmatch.fnmatchcase(model, pattern):
+            return limit
+    return default
+
+
+class AdaptiveConcurrencyController:
+    """AIMD 並發控制器 - 以 acquire() / release() 包住每個頁面請求"""
+
+    def __init__(self, initial: int = 2, minimum: int = 1, maximum: int = 8, latency_target: float = 30.0,
+                 backoff: float = 0.5, max_error_rate: float = 0.1, window: int = 20):
+        """
+        Args:
+            initial: 起始並發數
+            minimum / maximum: 並發數上下限
+            latency_target: 單頁請求延遲超過此秒數時不再增加並發
+            backoff: 節流時的乘法減少係數
+            max_error_rate: 最近請求的錯誤率超過此值時不再增加並發
+            window: 計算錯誤率的最近請求數
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_error_rate = max_error_rate
+        self.window = window
+
+        self._condition = asyncio.Condition()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.errors = 0
+        self._recent: List[bool] = []  # 最近請求是否失敗
+        self._last_backoff = 0.0
+        self._start_time = time.monotonic()
+        self.trace: List[Dict[str, Any]] = []
+        self._record("start")
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def _record(self, event: str) -> None:
+        self.trace.append({
+            "t": round(time.monotonic() - self._start_time, 3),
+            "limit": self.current_limit,
+            "in_flight": self.in_flight,
+            "event": event
+        })
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def release(self, latency: float, error: Optional[BaseException] = None) -> None:
+        """
+        結束一個請求並調整並發上限
+
+        Args:
+            latency: 請求耗時（秒）
+            error: 請求失敗時的例外
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            self._recent = (self._recent + [error is not None])[-self.window:]
+            previous = self.current_limit
+
+            if error is not None and is_throttling_error(error):
+                self.throttled += 1
+                # 同一批在途請求的節流只減少一次，避免連續減半到最低值
+                now = time.monotonic()
+                if now - self._last_backoff > latency:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_backoff = now
+            elif error is not None:
+                self.errors += 1
+            else:
+                self.completed += 1
+                error_rate = sum(self._recent) / len(self._recent)
+                if latency <= self.latency_target and error_rate <= self.max_error_rate:
+                    # 每完成約一個並發上限數量的請求增加 1
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            if self.current_limit != previous:
+                self._record("decrease" if self.current_limit < previous else "increase")
+                logger.info(f"⚡ 視覺模型並發上限 {previous} -> {self.current_limit} "
+                            f"(在途 {self.in_flight}，節流 {self.throttled} 次)")
+            self._condition.notify_all()
+
+    async def run(self, coro_factory, retries: int = 3) -> Tuple[Any, int]:
+        """
+        在並發控制下執行請求，節流時以退避時間重試
+
+        Args:
+            coro_factory: 每次呼叫返回新 coroutine 的函數
+            retries: 節流時的最大重試次數
+
+        Returns:
+            (結果, 重試次數)
+        """
+        attempt = 0
+        while True:
+            await self.acquire()
+            start_time = time.monotonic()
+            try:
+                result = await coro_factory()
+            except Exception as e:
+                await self.release(time.monotonic() - start_time, e)
+                if not is_throttling_error(e) or attempt >= retries:
+                    raise
+                attempt += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+            await self.release(time.monotonic() - start_time)
+            return result, attempt
+
+    def report(self, pages: int) -> Dict[str, Any]:
+        """並發統計與軌跡（寫入處理報告）"""
+        elapsed = time.monotonic() - self._start_time
+        self._record("end")
+        return {
+            "pages_per_minute": pages / elapsed * 60 if elapsed > 0 else 0.0,
+            "final_limit": self.current_limit,
+            "peak_in_flight": self.peak_in_flight,
+            "min_limit": self.minimum,
+            "max_limit": self.maximum,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "trace": self.trace
+        }
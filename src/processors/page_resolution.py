@@ -0,0 +1,182 @@
+"""
+視覺請求的自適應頁面解析度
+依頁面掃描結果估計內容密度，為每頁選擇送給視覺模型的圖片高度（決定 OpenAI 的 512px 圖塊數與 Claude 的像素數）：
+稀疏的標題頁使用低解析度，密集的線位圖維持高解析度。
+可選擇「先低解析度、輸出信心不足時再提高」模式。頁面圖片依規劃的高度實際渲染後直接送出，
+以實際圖片尺寸估算每份文件節省的圖片 tokens，並記錄模型回報的實際輸入 tokens
+"""
+
+import math
+import re
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from src.processors.pdf_page_scan import PageProfile
+
+LEVEL_LOW = "low"
+LEVEL_MEDIUM = "medium"
+LEVEL_HIGH = "high"
+LEVEL_NAMES = (LEVEL_LOW, LEVEL_MEDIUM, LEVEL_HIGH)
+
+# 視覺模型表示看不清楚的字樣
+LOW_CONFIDENCE_PATTERN = re.compile(
+    r"unreadable|illegible|not legible|cannot (?:be )?read|too small|blurr|low resolution|"
+    r"無法辨識|無法辨認|看不清|不清楚|模糊|解析度(?:太|過)低",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class ResolutionPlan:
+    """單頁解析度規劃"""
+    page_num: int
+    level: str  # low / medium / high
+    image_height: int  # 送給視覺模型的圖片高度（px）
+    density: float
+    tiles: int  # OpenAI 高細節模式的 512px 圖塊數
+    image_tokens: int  # 估計的圖片 tokens
+    baseline_tokens: int  # 固定解析度時估計的圖片 tokens
+    escalated: bool = False  # 低解析度輸出信心不足，已以較高解析度重新處理
+    escalation_tokens: int = 0  # 重新處理前低解析度請求花費的圖片 tokens
+    image_width: int = 0  # 實際送出的圖片尺寸（px），渲染後才有值
+    rendered_height: int = 0
+    input_tokens: int = 0  # 模型回報的實際輸入 tokens（含重新處理的請求）
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def parse_levels(value: str) -> List[int]:
+    """解析低 / 中 / 高三個圖片高度設定，例如 512,768,1056"""
+    heights = sorted(int(item) for item in (value or "").split(",") if item.strip())
+    if len(heights) != len(LEVEL_NAMES):
+        raise ValueError(f"解析度設定需要 {len(LEVEL_NAMES)} 個圖片高度: {value}")
+    return heights
+
+
+def image_size(profile: Optional[PageProfile], image_height: int) -> tuple:
+    """依頁面長寬比計算指定高度的圖片尺寸"""
+    if profile is None or not profile.width or not profile.height:
+        return round(image_height / math.sqrt(2)), image_height  # 未知尺寸時假設 A4 直式
+    return max(1, round(image_height * profile.width / profile.height)), image_height
+
+
+def estimate_image_tokens(width: int, height: int, model: str) -> tuple:
+    """
+    估計單張圖片的輸入 tokens，返回 (tokens, 圖塊數)
+
+    OpenAI: 縮放到 2048 以內、短邊 768 後，每個 512px 圖塊 170 tokens + 基本 85 tokens
+    Claude: 長邊縮放到 1568 以內後約每 750 像素 1 token
+    """
+    if "claude" in model.lower() or "bedrock" in model.lower():
+        scale = min(1.0, 1568 / max(width, height))
+        width, height = width * scale, height * scale
+        return math.ceil(width * height / 750), 0
+
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles, tiles
+
+
+def content_density(profile: Optional[PageProfile]) -> float:
+    """
+    頁面內容密度 (0-1)
+    渲染過的頁面（無文字層，通常是掃描圖）以非白色像素比例估計，其餘以向量繪圖、圖片面積與文字量估計
+    """
+    if profile is None:
+        return 1.0
+    if profile.white_ratio is not None:
+        # 掃描頁面約 20% 非白色像素已相當密集
+        return min(1.0, (1.0 - profile.white_ratio) * 5)
+    return min(1.0, max(profile.drawing_ratio, profile.image_ratio, profile.text_chars / 2000))
+
+
+def plan_page_resolution(page_num: int, profile: Optional[PageProfile], model: str, heights: List[int],
+                         baseline_height: int, low_density: float = 0.15, high_density: float = 0.5) -> ResolutionPlan:
+    """
+    依內容密度選擇解析度等級
+
+    Args:
+        heights: 低 / 中 / 高三個圖片高度（px）
+        baseline_height: 固定解析度時的圖片高度，用於估算節省的 tokens
+        low_density / high_density: 低於 low_density 使用低解析度，達到 high_density 使用高解析度
+    """
+    density = content_density(profile)
+    if density < low_density:
+        index = 0
+    elif density < high_density:
+        index = 1
+    else:
+        index = 2
+
+    image_tokens, tiles = estimate_image_tokens(*image_size(profile, heights[index]), model)
+    baseline_tokens, _ = estimate_image_tokens(*image_size(profile, baseline_height), model)
+    return ResolutionPlan(page_num, LEVEL_NAMES[index], heights[index], round(density, 3), tiles,
+                          image_tokens, baseline_tokens)
+
+
+def start_low(plan: ResolutionPlan, profile: Optional[PageProfile], model: str, heights: List[int]) -> int:
+    """將規劃改為先以低解析度處理，返回信心不足時重新處理使用的圖片高度"""
+    escalation_height = plan.image_height if plan.level != LEVEL_LOW else heights[1]
+    plan.level = LEVEL_LOW
+    plan.image_height = heights[0]
+    plan.image_tokens, plan.tiles = estimate_image_tokens(*image_size(profile, heights[0]), model)
+    return escalation_height
+
+
+def escalate(plan: ResolutionPlan, profile: Optional[PageProfile], model: str, heights: List[int],
+             image_height: int) -> None:
+    """記錄以較高解析度重新處理 - 先前低解析度的請求計為額外花費"""
+    plan.escalated = True
+    plan.escalation_tokens += plan.image_tokens
+    plan.level = LEVEL_NAMES[heights.index(image_height)] if image_height in heights else LEVEL_HIGH
+    plan.image_height = image_height
+    plan.image_tokens, plan.tiles = estimate_image_tokens(*image_size(profile, image_height), model)
+
+
+def record_image(plan: ResolutionPlan, width: int, height: int, model: str, baseline_height: int) -> None:
+    """以實際渲染的圖片尺寸更新圖片 tokens 估計（基準尺寸依實際頁面比例換算）"""
+    plan.image_width, plan.rendered_height = width, height
+    plan.image_tokens, plan.tiles = estimate_image_tokens(width, height, model)
+    plan.baseline_tokens, _ = estimate_image_tokens(max(1, round(width * baseline_height / height)),
+                                                    baseline_height, model)
+
+
+def is_low_confidence(content: str, profile: Optional[PageProfile], min_chars: int = 40) -> bool:
+    """判斷低解析度的輸出是否需要以較高解析度重新處理"""
+    text = (content or "").strip()
+    if len(text) < min_chars:
+        return True
+    if LOW_CONFIDENCE_PATTERN.search(text):
+        return True
+    # 有文字層的頁面，輸出明顯少於文字層內容時視為漏讀
+    return bool(profile and profile.has_text and len(text) < profile.text_chars * 0.5)
+
+
+def summarize_resolution(plans: List[ResolutionPlan], text_layer_profiles: List[Optional[PageProfile]],
+                         model: str, baseline_height: int) -> Dict[str, Any]:
+    """彙總解析度規劃與估計節省的圖片 tokens（含文字層快速路徑省下的頁面）"""
+    baseline_tokens = sum(plan.baseline_tokens for plan in plans)
+    image_tokens = sum(plan.image_tokens for plan in plans)
+    escalation_tokens = sum(plan.escalation_tokens for plan in plans)
+    text_layer_tokens = sum(estimate_image_tokens(*image_size(profile, baseline_height), model)[0]
+                            for profile in text_layer_profiles)
+    resolution_saved = baseline_tokens - image_tokens - escalation_tokens
+    rendered = [plan for plan in plans if plan.rendered_height]
+    return {
+        "baseline_height": baseline_height,
+        "levels": {level: sum(1 for plan in plans if plan.level == level) for level in LEVEL_NAMES},
+        "escalated_pages": [plan.page_num for plan in plans if plan.escalated],
+        "baseline_image_tokens": baseline_tokens,
+        "planned_image_tokens": image_tokens,
+        "escalation_tokens": escalation_tokens,
+        "resolution_tokens_saved": resolution_saved,
+        "text_layer_tokens_saved": text_layer_tokens,
+        "estimated_tokens_saved": resolution_saved + text_layer_tokens,
+        "rendered_pages": len(rendered),
+        "actual_input_tokens": sum(plan.input_tokens for plan in plans),
+        "pages": [plan.to_dict() for plan in plans]
+    }
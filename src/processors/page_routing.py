@@ -0,0 +1,136 @@
+"""
+頁面路由 - 文字層快速路徑
+依頁面掃描結果（文字量、圖片與向量繪圖面積）與 pdfplumber 表格偵測為每頁評分：
+以文字為主的頁面直接由文字層轉為 markdown（含表格），只有圖面為主的頁面（線位圖、圖面符號等）才送視覺模型
+"""
+
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from src.processors.pdf_page_scan import PageProfile
+
+logger = logging.getLogger(__name__)
+
+ROUTE_TEXT_LAYER = "text_layer"
+ROUTE_VISION = "vision"
+
+
+@dataclass
+class PageRoute:
+    """單頁路由結果"""
+    page_num: int
+    route: str  # text_layer / vision
+    reason: str
+    text_chars: int = 0
+    visual_ratio: float = 0.0  # 圖片與向量繪圖（不含表格框線）的面積比例
+    table_count: int = 0
+    markdown: str = ""  # text_layer 頁面的轉換結果
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("markdown")
+        return data
+
+
+def _cell_text(cell) -> str:
+    return " ".join(str(cell).split()).replace("|", "\\|") if cell is not None else ""
+
+
+def table_to_markdown(rows: List[List[Optional[str]]]) -> str:
+    """pdfplumber 表格轉為 markdown 表格（第一列作為表頭）"""
+    rows = [row for row in rows if row and any(cell not in (None, "") for cell in row)]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    lines = []
+    for index, row in enumerate(rows):
+        cells = [_cell_text(cell) for cell in row] + [""] * (width - len(row))
+        lines.append("| " + " | ".join(cells) + " |")
+        if index == 0:
+            lines.append("|" + " --- |" * width)
+    return "\n".join(lines)
+
+
+def page_to_markdown(page, tables=None) -> str:
+    """
+    將 pdfplumber 頁面轉為 markdown：表格以外的文字逐行輸出，表格轉為 markdown 表格，依頁面上的位置排序
+    """
+    tables = page.find_tables() if tables is None else tables
+    text_page = page
+    for table in tables:
+        text_page = text_page.outside_bbox(table.bbox)
+
+    blocks = [(line["top"], line["text"]) for line in text_page.extract_text_lines() if line["text"].strip()]
+    for table in tables:
+        markdown = table_to_markdown(table.extract())
+        if markdown:
+            blocks.append((table.bbox[1], f"\n{markdown}\n"))
+    blocks.sort(key=lambda block: block[0])
+    return "\n".join(text for _, text in blocks).strip()
+
+
+def route_pages(pdf_path: str, profiles: Dict[int, PageProfile], pages: List[int], min_text_chars: int = 200,
+                max_visual_ratio: float = 0.15) -> Dict[int, PageRoute]:
+    """
+    為頁面選擇處理路徑，文字層頁面同時完成 markdown 轉換
+
+    Args:
+        pdf_path: PDF文件路徑
+        profiles: 頁面掃描結果
+        pages: 要處理的頁碼（已排除空白頁）
+        min_text_chars: 文字層字元數達到此值才考慮快速路徑
+        max_visual_ratio: 圖片與向量繪圖（扣除表格區域）的面積比例上限
+    """
+    import pdfplumber
+
+    start_time = time.perf_counter()
+    routes: Dict[int, PageRoute] = {}
+    candidates = []
+    for page_num in pages:
+        profile = profiles.get(page_num)
+        if profile is None or not profile.has_text:
+            routes[page_num] = PageRoute(page_num, ROUTE_VISION, "無文字層")
+        elif profile.text_chars < min_text_chars:
+            routes[page_num] = PageRoute(page_num, ROUTE_VISION, "文字量不足", profile.text_chars,
+                                         profile.visual_ratio)
+        elif profile.image_ratio > max_visual_ratio:
+            routes[page_num] = PageRoute(page_num, ROUTE_VISION, "圖片為主", profile.text_chars,
+                                         profile.visual_ratio)
+        else:
+            candidates.append(profile)
+
+    if candidates:
+        with pdfplumber.open(pdf_path) as pdf:
+            for profile in candidates:
+                page_num = profile.page_num
+                try:
+                    page = pdf.pages[page_num - 1]
+                    tables = page.find_tables()
+                    # 表格框線也是向量繪圖，扣除表格區域後才是圖面
+                    page_area = float(page.width * page.height) or 1.0
+                    table_ratio = sum((table.bbox[2] - table.bbox[0]) * (table.bbox[3] - table.bbox[1])
+                                      for table in tables) / page_area
+                    visual_ratio = profile.image_ratio + max(0.0, profile.drawing_ratio - table_ratio)
+                    if visual_ratio > max_visual_ratio:
+                        routes[page_num] = PageRoute(page_num, ROUTE_VISION, "圖面為主", profile.text_chars,
+                                                     visual_ratio, len(tables))
+                        continue
+
+                    markdown = page_to_markdown(page, tables)
+                    if len(markdown) < min_text_chars // 2:
+                        routes[page_num] = PageRoute(page_num, ROUTE_VISION, "文字層轉換結果過少",
+                                                     profile.text_chars, visual_ratio, len(tables))
+                        continue
+                    routes[page_num] = PageRoute(page_num, ROUTE_TEXT_LAYER, "文字為主", profile.text_chars,
+                                                 visual_ratio, len(tables), markdown)
+                except Exception as e:
+                    logger.warning(f"頁面 {page_num} 文字層轉換失敗，改用視覺模型: {e}")
+                    routes[page_num] = PageRoute(page_num, ROUTE_VISION, "文字層轉換失敗", profile.text_chars,
+                                                 profile.visual_ratio)
+
+    text_layer_pages = sorted(page_num for page_num, route in routes.items() if route.route == ROUTE_TEXT_LAYER)
+    logger.info(f"🔀 頁面路由: 文字層 {len(text_layer_pages)} 頁，視覺模型 {len(routes) - len(text_layer_pages)} 頁 "
+                f"({time.perf_counter() - start_time:.2f}秒)")
+    return dict(sorted(routes.items()))
@@ -0,0 +1,253 @@
+"""
+PDF 頁面圖片渲染
+在進程池中渲染頁面圖片（每組連續頁面只開啟一次文件），不佔用事件循環；
+頁面選擇確定後即可開始，與視覺模型呼叫同時進行。每頁記錄渲染時間與寫入的位元組數。
+送給視覺模型的圖片也在進程池中依指定高度渲染，直接返回 PNG，不寫入暫存檔；
+需要保存頁面圖片時只點陣化一次：以顯示倍率寫入圖片檔，再縮放為送給模型的高度
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PageRenderResult:
+    """單頁渲染結果"""
+    page_num: int
+    image_path: str
+    render_ms: float = 0.0
+    bytes_written: int = 0
+    skipped: bool = False  # 圖片已存在
+    error: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def page_image_path(output_dir: str, pdf_name: str, page_num: int) -> str:
+    return os.path.join(output_dir, f"{pdf_name}_page_{page_num}.png")
+
+
+def _render_page_range(pdf_path: str, page_nums: List[int], output_dir: str, pdf_name: str,
+                       zoom: float) -> List[PageRenderResult]:
+    """渲染一組頁面 - 在工作進程中執行"""
+    import fitz  # PyMuPDF
+
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_nums:
+            image_path = page_image_path(output_dir, pdf_name, page_num)
+            if os.path.exists(image_path):
+                results.append(PageRenderResult(page_num, image_path, skipped=True))
+                continue
+
+            start_time = time.perf_counter()
+            try:
+                pix = doc[page_num - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom))  # PyMuPDF uses 0-based indexing
+                # 先寫入暫存檔再改名，避免讀取到寫入一半的圖片
+                tmp_path = f"{image_path}.{os.getpid()}.tmp"
+                pix.save(tmp_path, output="png")
+                os.replace(tmp_path, image_path)
+                results.append(PageRenderResult(
+                    page_num,
+                    image_path,
+                    render_ms=(time.perf_counter() - start_time) * 1000,
+                    bytes_written=os.path.getsize(image_path)
+                ))
+            except Exception as e:
+                results.append(PageRenderResult(page_num, image_path, error=str(e)))
+    return results
+
+
+async def arender_pdf_pages(pdf_path: str, output_dir: str, page_nums: List[int], pdf_name: Optional[str] = None,
+                            zoom: float = 2.0, workers: int = 2, pages_per_task: int = 8) -> List[PageRenderResult]:
+    """
+    以進程池渲染頁面圖片，返回依頁碼排序的渲染結果
+
+    Args:
+        pdf_path: PDF文件路徑
+        output_dir: 圖片輸出目錄
+        page_nums: 要渲染的頁碼 (1-based)，呼叫端需確認在文件範圍內
+        pdf_name: 圖片檔名前綴（預設為 PDF 檔名）
+        zoom: 渲染倍率
+        workers: 同時渲染的進程數上限
+        pages_per_task: 每個工作單位的頁數（同一單位只開啟一次文件）
+    """
+    if not page_nums:
+        return []
+
+    pdf_name = pdf_name or os.path.splitext(os.path.basename(pdf_path))[0]
+    chunks = [page_nums[i:i + pages_per_task] for i in range(0, len(page_nums), pages_per_task)]
+    workers = max(1, min(workers, len(chunks)))
+    loop = asyncio.get_running_loop()
+
+    results: List[PageRenderResult] = []
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        chunk_results = await asyncio.gather(*[
+            loop.run_in_executor(executor, _render_page_range, pdf_path, chunk, output_dir, pdf_name, zoom)
+            for chunk in chunks
+        ])
+        for chunk_result in chunk_results:
+            results.extend(chunk_result)
+    except asyncio.CancelledError:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    except Exception as e:
+        # 進程池無法使用時改在執行緒中渲染，仍不阻塞事件循環
+        logger.warning(f"多進程頁面渲染失敗，改為單執行緒渲染: {e}")
+        results = await asyncio.to_thread(_render_page_range, pdf_path, page_nums, output_dir, pdf_name, zoom)
+    finally:
+        executor.shutdown(wait=False)
+
+    return sorted(results, key=lambda result: result.page_num)
+
+
+# 工作進程內開啟的文件（以路徑與修改時間為鍵），同一進程渲染多頁時不重複開啟
+_worker_documents: Dict[tuple, Any] = {}
+# PyMuPDF 不支援多執行緒同時操作，改在執行緒中渲染時依序進行
+_worker_lock = threading.Lock()
+
+
+def _open_document(pdf_path: str):
+    """開啟（或沿用工作進程已開啟的）文件 - 需持有 _worker_lock"""
+    import fitz  # PyMuPDF
+
+    key = (pdf_path, os.path.getmtime(pdf_path))
+    doc = _worker_documents.get(key)
+    if doc is None:
+        _close_documents(pdf_path)
+        doc = _worker_documents[key] = fitz.open(pdf_path)
+    return doc
+
+
+def render_page_png(pdf_path: str, page_num: int, image_height: int) -> Tuple[bytes, int, int]:
+    """
+    依指定高度渲染頁面為 PNG（寬度依頁面比例） - 在工作進程中執行
+
+    Returns:
+        (PNG 圖片, 寬度, 高度)
+    """
+    import fitz  # PyMuPDF
+
+    with _worker_lock:
+        page = _open_document(pdf_path)[page_num - 1]  # PyMuPDF uses 0-based indexing
+        zoom = image_height / page.rect.height
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pix.tobytes("png"), pix.width, pix.height
+
+
+def render_and_save_page(pdf_path: str, page_num: int, image_height: int, image_path: str,
+                         zoom: float = 2.0) -> Tuple[bytes, int, int, PageRenderResult]:
+    """
+    渲染送給視覺模型的圖片並同時保存頁面圖片，頁面只點陣化一次 - 在工作進程中執行
+    以顯示倍率點陣化後寫入 image_path，再縮放為指定高度送給模型；
+    圖片已存在或模型需要比顯示倍率更高的解析度時，直接依指定高度渲染
+
+    Returns:
+        (PNG 圖片, 寬度, 高度, 頁面圖片的渲染結果)
+    """
+    import fitz  # PyMuPDF
+
+    if os.path.exists(image_path):
+        return (*render_page_png(pdf_path, page_num, image_height),
+                PageRenderResult(page_num, image_path, skipped=True))
+
+    with _worker_lock:
+        page = _open_document(pdf_path)[page_num - 1]  # PyMuPDF uses 0-based indexing
+        start_time = time.perf_counter()
+        try:
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            # 先寫入暫存檔再改名，避免讀取到寫入一半的圖片
+            tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            pix.save(tmp_path, output="png")
+            os.replace(tmp_path, image_path)
+            saved = PageRenderResult(
+                page_num,
+                image_path,
+                render_ms=(time.perf_counter() - start_time) * 1000,
+                bytes_written=os.path.getsize(image_path)
+            )
+        except Exception as e:
+            pix = None
+            saved = PageRenderResult(page_num, image_path, error=str(e))
+
+        if pix is None or pix.height < image_height:
+            model_zoom = image_height / page.rect.height
+            pix = page.get_pixmap(matrix=fitz.Matrix(model_zoom, model_zoom), alpha=False)
+        elif pix.height != image_height:
+            pix = fitz.Pixmap(pix, round(pix.width * image_height / pix.height), image_height)
+        return pix.tobytes("png"), pix.width, pix.height, saved
+
+
+def _close_documents(pdf_path: str) -> None:
+    for key in [key for key in _worker_documents if key[0] == pdf_path]:
+        _worker_documents.pop(key).close()
+
+
+class PageImageRenderer:
+    """
+    以進程池渲染送給視覺模型的頁面圖片，進程池無法使用時改在執行緒中渲染；
+    指定 output_dir 時同一次渲染也寫入頁面圖片檔（記錄在 page_renders），不需要另外渲染
+    """
+
+    def __init__(self, pdf_path: str, workers: int = 2, output_dir: Optional[str] = None,
+                 pdf_name: Optional[str] = None, zoom: float = 2.0):
+        self.pdf_path = pdf_path
+        self.output_dir = output_dir
+        self.pdf_name = pdf_name or os.path.splitext(os.path.basename(pdf_path))[0]
+        self.zoom = zoom
+        self.page_renders: Dict[int, PageRenderResult] = {}  # 已保存的頁面圖片
+        self._executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=max(1, workers))
+
+    async def render(self, page_num: int, image_height: int) -> Tuple[bytes, int, int]:
+        """渲染送給模型的圖片；頁面圖片尚未保存時同時寫入（每頁只寫入一次）"""
+        saving = self.output_dir is not None and page_num not in self.page_renders
+        if saving:
+            args = (render_and_save_page, self.pdf_path, page_num, image_height,
+                    page_image_path(self.output_dir, self.pdf_name, page_num), self.zoom)
+        else:
+            args = (render_page_png, self.pdf_path, page_num, image_height)
+
+        result = None
+        if self._executor is not None:
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, *args)
+            except BrokenProcessPool as e:
+                logger.warning(f"多進程頁面渲染失敗，改為單執行緒渲染: {e}")
+                self.close()
+        if result is None:
+            result = await asyncio.to_thread(*args)
+
+        if saving:
+            image, width, height, self.page_renders[page_num] = result
+            return image, width, height
+        return result
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        with _worker_lock:
+            _close_documents(self.pdf_path)
+
+
+def summarize_renders(results: List[PageRenderResult]) -> Dict[str, Any]:
+    """彙總渲染結果"""
+    rendered = [result for result in results if not result.skipped and not result.error]
+    return {
+        "rendered": len(rendered),
+        "skipped": sum(1 for result in results if result.skipped),
+        "failed": sum(1 for result in results if result.error),
+        "render_ms": sum(result.render_ms for result in rendered),
+        "bytes_written": sum(result.bytes_written for result in rendered)
+    }
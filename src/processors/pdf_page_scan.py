@@ -0,0 +1,182 @@
+"""
+PDF 頁面掃描
+每個工作進程只開啟一次文件，先讀取所有頁面的文字層；只有沒有文字的頁面才渲染成灰階像素
+（直接從 pixmap 樣本轉為 NumPy 陣列，不經過 PNG 編解碼）判斷是否空白。
+掃描結果為每頁的 blank / text / image 概況與圖片、向量繪圖的面積比例，後續的頁面選擇、路由與圖片生成可直接沿用。
+面積比例（get_image_info 與 cluster_drawings）成本較高，只為文字量達到門檻的文字頁面計算
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PAGE_KIND_BLANK = "blank"
+PAGE_KIND_TEXT = "text"
+PAGE_KIND_IMAGE = "image"
+
+# 文字層超過此字元數視為有文字的頁面（不需渲染）
+MIN_TEXT_CHARS = 10
+# 灰階值高於此值的像素視為白色
+WHITE_LEVEL = 240
+
+
+@dataclass
+class PageProfile:
+    """單頁掃描結果"""
+    page_num: int  # 1-based
+    kind: str  # blank / text / image
+    text_chars: int = 0
+    image_count: int = 0
+    white_ratio: Optional[float] = None  # 只有渲染過的頁面才有值
+    image_ratio: float = 0.0  # 嵌入圖片佔頁面面積的比例
+    drawing_ratio: float = 0.0  # 向量繪圖（線位圖、符號等）佔頁面面積的比例
+    width: float = 0.0  # 頁面尺寸（pt）
+    height: float = 0.0
+
+    @property
+    def visual_ratio(self) -> float:
+        """圖片與向量繪圖合計的面積比例"""
+        return min(1.0, self.image_ratio + self.drawing_ratio)
+
+    @property
+    def is_blank(self) -> bool:
+        return self.kind == PAGE_KIND_BLANK
+
+    @property
+    def has_text(self) -> bool:
+        return self.kind == PAGE_KIND_TEXT
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def white_ratio_of(page, scale: float = 1.0) -> float:
+    """以灰階 pixmap 的樣本直接計算白色像素比例"""
+    import fitz  # PyMuPDF
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+    if not pix.width or not pix.height:
+        return 1.0
+    # 每列可能有對齊填充，依 stride 重塑後只取實際寬度
+    pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return float(np.count_nonzero(pixels > WHITE_LEVEL)) / pixels.size
+
+
+def _area_ratio(rects, page_rect) -> float:
+    """矩形（裁切到頁面範圍內）的面積總和佔頁面面積的比例，上限 1.0"""
+    page_area = abs(page_rect)
+    if not page_area:
+        return 0.0
+    covered = sum(abs(rect & page_rect) for rect in rects)
+    return min(1.0, covered / page_area)
+
+
+def visual_ratios(page) -> tuple:
+    """嵌入圖片與向量繪圖的面積比例（繪圖以相鄰路徑合併後的區塊計算）"""
+    import fitz  # PyMuPDF
+
+    rect = page.rect
+    try:
+        image_ratio = _area_ratio([fitz.Rect(info["bbox"]) for info in page.get_image_info()], rect)
+    except Exception:
+        image_ratio = 0.0
+    try:
+        drawing_ratio = _area_ratio(page.cluster_drawings(), rect)
+    except Exception:
+        drawing_ratio = 0.0
+    return image_ratio, drawing_ratio
+
+
+def _scan_page_range(pdf_path: str, page_nums: List[int], threshold: float, scale: float,
+                     visual_min_chars: Optional[int] = None) -> List[PageProfile]:
+    """掃描一組頁面 - 在工作進程中執行，整組頁面只開啟一次文件"""
+    import fitz  # PyMuPDF
+
+    profiles = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_nums:
+            page = doc[page_num - 1]  # PyMuPDF uses 0-based indexing
+            rect = page.rect
+            text_chars = len(page.get_text().strip())
+            image_count = len(page.get_images(full=False))
+
+            if text_chars > MIN_TEXT_CHARS:
+                image_ratio, drawing_ratio = 0.0, 0.0
+                if visual_min_chars is not None and text_chars >= visual_min_chars:
+                    image_ratio, drawing_ratio = visual_ratios(page)
+                profiles.append(PageProfile(page_num, PAGE_KIND_TEXT, text_chars, image_count,
+                                            image_ratio=image_ratio, drawing_ratio=drawing_ratio,
+                                            width=rect.width, height=rect.height))
+                continue
+
+            # 無文字層的頁面以渲染像素判斷，密度也以白色像素比例估計，不需要面積比例
+            white_ratio = white_ratio_of(page, scale)
+            kind = PAGE_KIND_BLANK if white_ratio > threshold else PAGE_KIND_IMAGE
+            profiles.append(PageProfile(page_num, kind, text_chars, image_count, white_ratio,
+                                        width=rect.width, height=rect.height))
+    return profiles
+
+
+def _split(page_nums: List[int], parts: int) -> List[List[int]]:
+    """切成連續的頁面區段，相鄰頁面在同一進程內共用字型與資源快取"""
+    size = -(-len(page_nums) // parts)
+    return [page_nums[i:i + size] for i in range(0, len(page_nums), size)]
+
+
+def scan_pdf_pages(pdf_path: str, pages: Optional[Iterable[int]] = None, threshold: float = 0.95,
+                   workers: int = 0, min_pages_per_worker: int = 16, scale: float = 1.0,
+                   visual_min_chars: Optional[int] = None) -> Dict[int, PageProfile]:
+    """
+    掃描 PDF 頁面，返回 {頁碼: PageProfile}（依頁碼排序，超出文件範圍的頁碼略過）
+
+    Args:
+        pdf_path: PDF文件路徑
+        pages: 要掃描的頁碼 (1-based)，None 為全部頁面
+        threshold: 空白像素比例閾值 (0.95 = 95%空白認為是空白頁)
+        workers: 進程數（0 為 CPU 核心數）
+        min_pages_per_worker: 每個進程至少分配的頁數，頁數較少時直接在目前進程掃描
+        scale: 空白檢測的渲染倍率
+        visual_min_chars: 文字字元數達到此值的文字頁面才計算圖片與向量繪圖的面積比例（None 為都不計算）
+    """
+    import fitz  # PyMuPDF
+
+    start_time = time.perf_counter()
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    page_nums = sorted({page_num for page_num in (pages or range(1, page_count + 1)) if 1 <= page_num <= page_count})
+    if not page_nums:
+        return {}
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(page_nums) // max(1, min_pages_per_worker)))
+
+    profiles: List[PageProfile] = []
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_scan_page_range, pdf_path, chunk, threshold, scale, visual_min_chars)
+                           for chunk in _split(page_nums, workers)]
+                for future in futures:
+                    profiles.extend(future.result())
+        except Exception as e:
+            logger.warning(f"多進程頁面掃描失敗，改為單進程掃描: {e}")
+            profiles = []
+            workers = 1
+    if not profiles:
+        profiles = _scan_page_range(pdf_path, page_nums, threshold, scale, visual_min_chars)
+
+    result = {profile.page_num: profile for profile in profiles}
+    counts = {kind: sum(1 for profile in profiles if profile.kind == kind)
+              for kind in (PAGE_KIND_TEXT, PAGE_KIND_IMAGE, PAGE_KIND_BLANK)}
+    rendered = sum(1 for profile in profiles if profile.white_ratio is not None)
+    logger.info(f"🔍 頁面掃描完成: {len(profiles)} 頁 (文字 {counts[PAGE_KIND_TEXT]}，圖片 {counts[PAGE_KIND_IMAGE]}，"
+                f"空白 {counts[PAGE_KIND_BLANK]}；渲染 {rendered} 頁，{workers} 個進程，"
+                f"{time.perf_counter() - start_time:.2f}秒)")
+    return result
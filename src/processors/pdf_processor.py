@@ -48,6 +48,8 @@ class PDFProcessor:
             enable_vision_analysis: 是否啟用視覺分析
         """
         self.enable_vision_analysis = enable_vision_analysis
+        # 最近一次處理中失敗、未包含在段落中的頁碼
+        self.failed_pages: List[int] = []
         logger.info(f"PDFProcessor 初始化完成 - 視覺分析: {enable_vision_analysis}")
     
     def process_pdf(self, pdf_path: str, output_path: str = None) -> List[DocumentChunk]:
@@ -61,6 +63,7 @@ class PDFProcessor:
         Returns:
             List[DocumentChunk]: 文檔段落列表
         """
+        self.failed_pages = []
         try:
             logger.info(f"開始處理 PDF: {pdf_path}")
             
@@ -84,6 +87,9 @@ class PDFProcessor:
             
             # 運行異步處理
             chunks = asyncio.run(_process())
+            self.failed_pages = list(zerox_processor.failed_pages)
+            if self.failed_pages:
+                logger.warning(f"{len(self.failed_pages)} 個頁面處理失敗，未包含在段落中: {self.failed_pages}")
             
             # 轉換為 DocumentChunk 格式
             document_chunks = []
@@ -30,6 +30,8 @@ class ProductionPDFProcessor:
         """
         self.enable_vision = enable_vision
         self.max_pages = max_pages
+        # 各文件處理失敗、未包含在段落中的頁碼
+        self.failed_pages: Dict[str, List[int]] = {}
         
         # 初始化子處理器
         self.zerox_processor = ZeroxPDFProcessor(max_pages=max_pages)
@@ -80,6 +82,11 @@ class ProductionPDFProcessor:
             if not result:
                 logger.error(f"PDF 處理失敗: {pdf_path}")
                 return []
+
+            self.failed_pages[str(file_path)] = list(result.failed_pages)
+            if result.failed_pages:
+                logger.warning(f"{file_path.name}: {len(result.failed_pages)} 個頁面處理失敗，"
+                               f"未包含在段落中: {result.failed_pages}")
             
             # 轉換為段落格式
             chunks = await self.zerox_processor.convert_zerox_to_chunks(result, pdf_path)
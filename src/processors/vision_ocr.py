@@ -0,0 +1,78 @@
+"""
+單頁視覺模型 OCR
+以 LiteLLM 直接呼叫視覺模型將頁面圖片轉為 markdown：
+每頁只有一次實際的 API 請求（不重建 PDF、不重新驗證金鑰），429 / 節流例外原樣拋出，
+由自適應並發控制器處理；空白的輸出視為失敗，而不是成功的空白頁
+"""
+
+import base64
+import re
+from dataclasses import dataclass
+
+import litellm
+
+# 頁面轉 markdown 的系統提示詞
+DEFAULT_SYSTEM_PROMPT = """Convert the following document page to markdown.
+Return only the markdown with no explanation text. Do not wrap the output in code fences such as ```markdown or ```html.
+
+RULES:
+- Include all information on the page. Do not exclude headers, footers, or subtext.
+- Return tables in HTML format.
+- Interpret charts and infographics as markdown, preferring tables where applicable.
+- Wrap logos in tags. Ex: <logo>Coca-Cola<logo>
+- Wrap watermarks in tags. Ex: <watermark>OFFICIAL COPY<watermark>
+- Wrap page numbers in tags. Ex: <page_number>14<page_number> or <page_number>9/22<page_number>
+- Use ☐ and ☑ for check boxes."""
+
+# 模型仍以程式碼區塊包住整頁輸出時移除外層的圍欄
+CODE_FENCE_PATTERN = re.compile(r"^\s*```[\w-]*\s*\n(.*?)\n?```\s*$", re.DOTALL)
+
+
+def strip_code_fence(text: str) -> str:
+    """移除包住整頁 markdown 的程式碼圍欄（內文中的程式碼區塊保留）"""
+    match = CODE_FENCE_PATTERN.match(text)
+    return match.group(1) if match else text
+
+
+class EmptyPageOutputError(Exception):
+    """視覺模型沒有返回內容"""
+
+
+@dataclass
+class VisionPageResult:
+    """單頁辨識結果"""
+    content: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+async def recognize_page_image(model: str, image: bytes, system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+                               **kwargs) -> VisionPageResult:
+    """
+    以視覺模型將頁面圖片轉為 markdown
+
+    Args:
+        model: LiteLLM 格式的模型名稱（Bedrock 為 bedrock/...）
+        image: PNG 圖片
+        system_prompt: 系統提示詞
+        kwargs: 傳給 litellm.acompletion 的其他參數
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/png;base64,{base64.b64encode(image).decode('ascii')}"},
+                },
+            ],
+        },
+    ]
+    response = await litellm.acompletion(model=model, messages=messages, **kwargs)
+
+    content = strip_code_fence(response["choices"][0]["message"]["content"] or "").strip()
+    if not content:
+        raise EmptyPageOutputError("視覺模型返回空白內容")
+    usage = response["usage"]
+    return VisionPageResult(content, usage["prompt_tokens"], usage["completion_tokens"])
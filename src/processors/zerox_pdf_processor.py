@@ -9,12 +9,22 @@ import os
 import uuid
 import time
 import asyncio
+import hashlib
 from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
 
+from src.processors.adaptive_concurrency import AdaptiveConcurrencyController, limit_for_model, parse_model_limits
+from src.processors.pdf_page_render import PageImageRenderer, PageRenderResult, arender_pdf_pages, summarize_renders
+from src.processors.page_resolution import (
+    ResolutionPlan, escalate, is_low_confidence, parse_levels, plan_page_resolution, record_image, start_low,
+    summarize_resolution
+)
+from src.processors.page_routing import ROUTE_TEXT_LAYER, ROUTE_VISION, PageRoute, route_pages
+from src.processors.pdf_page_scan import PageProfile, scan_pdf_pages
+
 # 載入環境變量
 load_dotenv()
 
@@ -39,6 +49,7 @@ class ZeroxDocumentChunk:
     image_path: str = ""  # 頁面圖片路徑
     image_analysis: str = ""  # AI圖片分析結果
     technical_symbols: List[str] = None
+    source_file_hash: str = ""  # 來源PDF的SHA-256，用於生成穩定的向量點ID
     
     # 成本追蹤字段
     input_tokens: int = 0
@@ -61,6 +72,14 @@ class ProcessingCostReport:
     processing_time: float
     cost_per_page: float
     estimated_full_document_cost: float = 0.0
+    render_summary: Dict[str, Any] = field(default_factory=dict)  # 頁面圖片渲染彙總
+    page_renders: List[Dict[str, Any]] = field(default_factory=list)  # 每頁渲染時間與寫入位元組數
+    pages_per_minute: float = 0.0  # 視覺模型處理速度
+    concurrency: Dict[str, Any] = field(default_factory=dict)  # 自適應並發統計與上限變化軌跡
+    text_layer_pages: int = 0  # 由文字層直接轉換、未送視覺模型的頁數
+    estimated_tokens_saved: int = 0  # 自適應解析度與文字層快速路徑估計節省的圖片 tokens
+    resolution: Dict[str, Any] = field(default_factory=dict)  # 每頁解析度規劃與節省明細
+    failed_pages: List[int] = field(default_factory=list)  # 視覺模型處理失敗、未包含在結果中的頁碼
     
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -133,70 +152,114 @@ class ZeroxPDFProcessor:
         self.total_input_tokens = 0
         self.total_output_tokens = 0
         self.processing_start_time = None
+        # 最近一次處理中視覺模型失敗的頁碼（這些頁面不在結果中，呼叫端需回報）
+        self.failed_pages: List[int] = []
+
+        # 頁面掃描結果 {頁碼: PageProfile}，後續的頁面選擇與圖片生成沿用
+        self.page_profiles: Dict[int, PageProfile] = {}
+        self.page_scan_workers = Config.PAGE_SCAN_WORKERS
+        self.blank_page_threshold = Config.BLANK_PAGE_THRESHOLD
+
+        # 頁面圖片渲染結果
+        self.page_renders: List[PageRenderResult] = []
+        self.page_render_workers = Config.PAGE_RENDER_WORKERS
+
+        # Zerox 自適應並發 - 上限可依模型設定
+        self.concurrency_initial = Config.ZEROX_CONCURRENCY_INITIAL
+        self.concurrency_min = Config.ZEROX_CONCURRENCY_MIN
+        self.concurrency_max = limit_for_model(
+            self.model, parse_model_limits(Config.ZEROX_CONCURRENCY_LIMITS), Config.ZEROX_CONCURRENCY_MAX
+        )
+        self.latency_target = Config.ZEROX_LATENCY_TARGET
+        self.zerox_max_retries = Config.ZEROX_MAX_RETRIES
+        self.concurrency_report: Dict[str, Any] = {}
+
+        # 文字層快速路徑 - 文字為主的頁面不送視覺模型
+        self.text_fast_path_enabled = Config.TEXT_FAST_PATH_ENABLED
+        self.text_fast_path_min_chars = Config.TEXT_FAST_PATH_MIN_CHARS
+        self.text_fast_path_max_visual_ratio = Config.TEXT_FAST_PATH_MAX_VISUAL_RATIO
+        self.page_routes: Dict[int, PageRoute] = {}
+
+        # 自適應頁面解析度 - 依內容密度選擇送給視覺模型的圖片高度
+        self.adaptive_resolution = Config.PAGE_RESOLUTION_ADAPTIVE
+        self.resolution_heights = parse_levels(Config.PAGE_RESOLUTION_HEIGHTS)
+        self.resolution_baseline = Config.PAGE_RESOLUTION_BASELINE
+        self.resolution_low_density = Config.PAGE_RESOLUTION_LOW_DENSITY
+        self.resolution_high_density = Config.PAGE_RESOLUTION_HIGH_DENSITY
+        self.resolution_low_first = Config.PAGE_RESOLUTION_LOW_FIRST
+        self.resolution_plans: Dict[int, ResolutionPlan] = {}
         
         logger.info(f"ZeroxPDFProcessor 初始化完成 - 模型: {model}")
         if max_pages:
             logger.info(f"設置最大處理頁數: {max_pages}")
 
-    def is_blank_page(self, pdf_path: str, page_num: int, threshold: float = 0.95) -> bool:
+    def scan_pages(self, pdf_path: str, pages: Optional[List[int]] = None) -> Dict[int, PageProfile]:
         """
-        檢測PDF頁面是否為空白頁
+        掃描頁面並記錄每頁的 blank / text / image 概況
 
         Args:
             pdf_path: PDF文件路徑
-            page_num: 頁面編號 (1-based)
-            threshold: 空白像素比例閾值 (0.95 = 95%空白認為是空白頁)
+            pages: 要掃描的頁碼 (1-based)，None 為全部頁面
 
         Returns:
-            bool: True表示是空白頁
+            Dict[int, PageProfile]: 頁碼 -> 掃描結果（超出文件範圍的頁碼不包含在內）
         """
         try:
-            import fitz  # PyMuPDF
-            import numpy as np
-            from PIL import Image
-            import io
-
-            doc = fitz.open(pdf_path)
-            if page_num > len(doc):
-                doc.close()
-                return True
-
-            page = doc[page_num - 1]  # PyMuPDF uses 0-based indexing
-
-            # 方法1: 檢查文字內容
-            text_content = page.get_text().strip()
-            if len(text_content) > 10:  # 如果有超過10個字符，不是空白頁
-                doc.close()
-                return False
-
-            # 方法2: 檢查圖像內容
-            pix = page.get_pixmap(matrix=fitz.Matrix(1.0, 1.0))  # 低解析度快速檢測
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-
-            # 轉換為灰度圖像
-            gray_img = img.convert('L')
-            img_array = np.array(gray_img)
+            self.page_profiles = scan_pdf_pages(
+                pdf_path,
+                pages,
+                threshold=self.blank_page_threshold,
+                workers=self.page_scan_workers,
+                visual_min_chars=self._visual_min_chars()
+            )
+        except ImportError:
+            logger.warning("PyMuPDF 未安裝，無法檢測空白頁")
+            self.page_profiles = {}
+        except Exception as e:
+            logger.warning(f"頁面掃描失敗: {e}")
+            self.page_profiles = {}
+        return self.page_profiles
 
-            # 計算空白像素比例 (接近白色的像素)
-            white_pixels = np.sum(img_array > 240)  # 240以上認為是白色
-            total_pixels = img_array.size
-            white_ratio = white_pixels / total_pixels
+    def _visual_min_chars(self) -> Optional[int]:
+        """
+        需要圖片與向量繪圖面積比例的最少文字量：自適應解析度以面積比例估計所有文字頁面的密度，
+        只啟用文字層快速路徑時只有文字量足夠的候選頁面需要；兩者皆關閉時不計算
+        """
+        if self.adaptive_resolution:
+            return 0
+        if self.text_fast_path_enabled:
+            return self.text_fast_path_min_chars
+        return None
 
-            doc.close()
+    def is_blank_page(self, pdf_path: str, page_num: int, threshold: float = None) -> bool:
+        """
+        檢測PDF頁面是否為空白頁 - 已掃描過的頁面直接使用掃描結果
 
-            is_blank = white_ratio > threshold
-            if is_blank:
-                logger.info(f"檢測到空白頁 {page_num}: 空白比例 {white_ratio:.2%}")
+        Args:
+            pdf_path: PDF文件路徑
+            page_num: 頁面編號 (1-based)
+            threshold: 空白像素比例閾值 (None時使用Config.BLANK_PAGE_THRESHOLD)
 
-            return is_blank
+        Returns:
+            bool: True表示是空白頁
+        """
+        profile = self.page_profiles.get(page_num) if threshold is None else None
+        if profile is None:
+            try:
+                profile = scan_pdf_pages(pdf_path, [page_num], threshold=threshold or self.blank_page_threshold,
+                                         workers=1).get(page_num)
+            except ImportError:
+                logger.warning("PyMuPDF 未安裝，無法檢測空白頁")
+                return False
+            except Exception as e:
+                logger.warning(f"檢測空白頁失敗: {e}")
+                return False
+            if profile is None:  # 超出文件頁數
+                return True
 
-        except ImportError:
-            logger.warning("PyMuPDF 或 PIL 未安裝，無法檢測空白頁")
-            return False
-        except Exception as e:
-            logger.warning(f"檢測空白頁失敗: {e}")
-            return False
+        if profile.is_blank:
+            logger.info(f"檢測到空白頁 {page_num}: 空白比例 {profile.white_ratio:.2%}")
+        return profile.is_blank
 
     def calculate_cost(self, input_tokens: int, output_tokens: int, model: str) -> float:
         """計算API調用成本"""
@@ -211,12 +274,13 @@ class ZeroxPDFProcessor:
         return input_cost + output_cost
 
     async def process_pdf_with_zerox(self, pdf_path: str, output_dir: str = "outputs/images/zerox_output") -> Dict[str, Any]:
-        """使用 Zerox 處理PDF文件"""
+        """以視覺模型（LiteLLM）與文字層處理PDF文件"""
         try:
-            from pyzerox import zerox
+            from src.processors.vision_ocr import recognize_page_image
 
-            logger.info(f"開始使用 Zerox 處理PDF: {pdf_path}")
+            logger.info(f"開始使用視覺模型處理PDF: {pdf_path}")
             self.processing_start_time = time.time()
+            self.failed_pages = []
 
             # 確保輸出目錄存在
             os.makedirs(output_dir, exist_ok=True)
@@ -226,13 +290,13 @@ class ZeroxPDFProcessor:
             expected_md_file = os.path.join(output_dir, f"{pdf_name}.md")
 
             if os.path.exists(expected_md_file):
-                logger.info(f"發現已存在的 markdown 文件，跳過 Zerox 處理: {expected_md_file}")
+                logger.info(f"發現已存在的 markdown 文件，跳過視覺模型處理: {expected_md_file}")
 
                 # 讀取現有的 markdown 文件並構造結果
                 with open(expected_md_file, 'r', encoding='utf-8') as f:
                     markdown_content = f.read()
 
-                # 構造模擬的 Zerox 結果結構
+                # 構造與視覺模型處理相同的結果結構
                 from types import SimpleNamespace
 
                 # 分析 markdown 內容來估算頁數和 token 數
@@ -259,82 +323,83 @@ class ZeroxPDFProcessor:
                 result.pages = pages
                 result.input_tokens = int(estimated_input_tokens)
                 result.output_tokens = int(estimated_output_tokens)
+                result.failed_pages = []
 
                 logger.info(f"從現有 markdown 文件載入: {len(pages)} 頁")
                 return result
 
-            # 設置處理頁數並過濾空白頁
+            # 設置處理頁數並過濾空白頁 - 單次掃描所有頁面（文件只開啟一次，有文字的頁面不渲染）
             select_pages = None
-            if self.max_pages:
-                all_pages = list(range(1, self.max_pages + 1))
-            else:
-                # 獲取PDF總頁數
-                try:
-                    import fitz
-                    doc = fitz.open(pdf_path)
-                    total_pages = len(doc)
-                    doc.close()
-                    all_pages = list(range(1, total_pages + 1))
-                except:
-                    all_pages = None
+            all_pages = list(range(1, self.max_pages + 1)) if self.max_pages else None
+            profiles = await asyncio.to_thread(self.scan_pages, pdf_path, all_pages)
 
             # 過濾空白頁
-            if all_pages:
-                non_blank_pages = []
-                blank_pages = []
-
-                logger.info(f"開始檢測空白頁，總頁數: {len(all_pages)}")
+            if profiles:
+                blank_pages = [page_num for page_num, profile in profiles.items() if profile.is_blank]
+                non_blank_pages = [page_num for page_num, profile in profiles.items() if not profile.is_blank]
 
-                for page_num in all_pages:
-                    if self.is_blank_page(pdf_path, page_num):
-                        blank_pages.append(page_num)
-                    else:
-                        non_blank_pages.append(page_num)
+                logger.info(f"頁面掃描完成，總頁數: {len(profiles)}")
 
                 if blank_pages:
                     logger.info(f"發現 {len(blank_pages)} 個空白頁，將跳過: {blank_pages}")
 
                 select_pages = non_blank_pages if non_blank_pages else None
                 logger.info(f"實際處理頁數: {len(non_blank_pages) if non_blank_pages else 0}")
+            elif all_pages:
+                # 無法掃描時不過濾空白頁
+                select_pages = all_pages
 
             if not select_pages:
                 logger.warning("沒有找到非空白頁面，跳過處理")
                 return None
 
-            # 使用 Zerox 處理PDF (只處理非空白頁)
-            if 'bedrock' in self.model.lower():
-                # 使用 Bedrock Claude - 按照 LiteLLM 格式
-                # 設置 AWS 環境變量供 LiteLLM 使用
-                os.environ['AWS_ACCESS_KEY_ID'] = self.aws_access_key
-                os.environ['AWS_SECRET_ACCESS_KEY'] = self.aws_secret_key
-                os.environ['AWS_REGION'] = self.aws_region
-
-                logger.info(f"使用 Bedrock Claude 模型: {self.model}")
-
-                result = await zerox(
-                    file_path=pdf_path,
-                    model=self.model,  # 使用 LiteLLM 格式
-                    output_dir=output_dir,
-                    select_pages=select_pages,
-                    concurrency=2,  # 控制並發數以避免API限制
-                    cleanup=False,  # 保留臨時文件
-                    maintain_format=False  # 避免與 select_pages 衝突
-                    # 使用 Zerox 預設系統提示詞，不指定 custom_system_prompt
-                )
-            else:
-                # 使用 OpenAI
-                result = await zerox(
-                    file_path=pdf_path,
-                    model=self.model,
-                    output_dir=output_dir,
-                    select_pages=select_pages,
-                    concurrency=2,  # 控制並發數以避免API限制
-                    cleanup=False,  # 保留臨時文件
-                    maintain_format=False  # 避免與 select_pages 衝突
-                )
-            
+            # 只處理非空白頁；文字為主的頁面由文字層轉換，其餘頁面送視覺模型
+            render_task = None
+            try:
+                vision_pages = await self.route_selected_pages(pdf_path, select_pages)
+
+                # 送視覺模型的頁面在渲染模型圖片時一併保存頁面圖片（每頁只點陣化一次）；
+                # 文字層頁面的圖片另外渲染，與視覺模型呼叫同時進行
+                vision_page_set = set(vision_pages)
+                render_task = asyncio.create_task(self.generate_pdf_images(
+                    pdf_path, output_dir, [page_num for page_num in select_pages if page_num not in vision_page_set]
+                ))
+
+                if not vision_pages:
+                    from types import SimpleNamespace
+                    result = SimpleNamespace(pages=[], input_tokens=0, output_tokens=0, failed_pages=[],
+                                             page_renders=[])
+                else:
+                    if 'bedrock' in self.model.lower():
+                        # 使用 Bedrock Claude - 按照 LiteLLM 格式
+                        # 設置 AWS 環境變量供 LiteLLM 使用
+                        os.environ['AWS_ACCESS_KEY_ID'] = self.aws_access_key
+                        os.environ['AWS_SECRET_ACCESS_KEY'] = self.aws_secret_key
+                        os.environ['AWS_REGION'] = self.aws_region
+
+                        logger.info(f"使用 Bedrock Claude 模型: {self.model}")
+
+                    # 逐頁直接呼叫視覺模型，同時進行的頁面數由自適應並發控制
+                    result = await self.run_vision_adaptive(recognize_page_image, pdf_path, vision_pages, output_dir)
+            except BaseException:
+                if render_task is not None:
+                    render_task.cancel()
+                raise
+
             if not result:
-                raise Exception("Zerox 處理失敗，未返回結果")
+                raise Exception("視覺模型處理失敗，未返回結果")
+
+            # 合併文字層頁面，依頁碼排序
+            result.pages = sorted(result.pages + self.text_layer_pages(), key=lambda page: page.page)
+
+            # 合併後寫入 markdown 輸出；有失敗頁面時不保留，下次重新處理
+            self.failed_pages = list(result.failed_pages)
+            if result.failed_pages:
+                if os.path.exists(expected_md_file):
+                    os.remove(expected_md_file)
+            else:
+                with open(expected_md_file, 'w', encoding='utf-8') as f:
+                    f.write("\n\n".join(page.content for page in result.pages))
             
             # 更新成本統計
             self.total_input_tokens += result.input_tokens
@@ -345,65 +410,229 @@ class ZeroxPDFProcessor:
                 self.model
             )
             
-            logger.info(f"Zerox 處理完成:")
-            logger.info(f"  - 處理頁數: {len(result.pages)}")
+            logger.info(f"PDF頁面處理完成:")
+            logger.info(f"  - 處理頁數: {len(result.pages)} (文字層 {len(self.text_layer_pages())})")
             logger.info(f"  - 輸入tokens: {result.input_tokens:,}")
             logger.info(f"  - 輸出tokens: {result.output_tokens:,}")
             logger.info(f"  - 成本: ${self.total_cost:.4f} USD")
+            if self.failed_pages:
+                logger.warning(f"  - 失敗頁面（未包含在結果中）: {self.failed_pages}")
             
-            # 手動生成PDF頁面圖片
-            await self.generate_pdf_images(pdf_path, output_dir, select_pages)
+            # 等待文字層頁面的圖片渲染完成，與視覺模型頁面保存的圖片合併
+            text_layer_renders = await render_task
+            self.page_renders = sorted(text_layer_renders + result.page_renders, key=lambda render: render.page_num)
 
             return result
 
-        except ImportError:
-            raise Exception("請先安裝 py-zerox: pip install py-zerox")
+        except ImportError as e:
+            logger.error(f"視覺模型處理所需的套件未安裝（需要 litellm）: {e}")
+            raise
         except Exception as e:
-            logger.error(f"Zerox 處理失敗: {e}")
+            logger.error(f"視覺模型處理失敗: {e}")
             raise
 
-    async def generate_pdf_images(self, pdf_path: str, output_dir: str, select_pages: List[int] = None):
-        """手動生成PDF頁面圖片 - 避免重複生成"""
+    async def run_vision_adaptive(self, recognize_page_image, pdf_path: str, select_pages: List[int],
+                                  output_dir: Optional[str] = None):
+        """
+        逐頁渲染頁面圖片並直接呼叫視覺模型，以 AIMD 控制同時進行的頁面請求，合併為 pages / input_tokens / output_tokens 結構的結果
+
+        每頁只有一次實際的模型請求（不重建 PDF、不重新驗證 API Key），並發控制器包住每次請求，
+        延遲與錯誤率正常時逐步提高並發，遇到 429 / 節流時減半並重試該頁；
+        其他錯誤或空白輸出的頁面記為失敗，所有頁面都失敗時才拋出例外；
+        指定 output_dir 時送給模型的同一次渲染也保存為頁面圖片（記錄在結果的 page_renders）
+        """
+        from types import SimpleNamespace
+
+        controller = AdaptiveConcurrencyController(
+            initial=self.concurrency_initial,
+            minimum=self.concurrency_min,
+            maximum=self.concurrency_max,
+            latency_target=self.latency_target
+        )
+        logger.info(f"視覺模型自適應並發: 起始 {controller.current_limit}，"
+                    f"範圍 {controller.minimum}-{controller.maximum}，共 {len(select_pages)} 頁")
+
+        escalation_heights = self.plan_resolutions(select_pages)
+        renderer = PageImageRenderer(pdf_path, workers=self.page_render_workers, output_dir=output_dir)
+        # 限制已渲染、等待送出的圖片數量，避免大型文件的圖片全部留在記憶體
+        image_slots = asyncio.Semaphore(controller.maximum + self.page_render_workers)
+
+        async def recognize(page_num: int, image_height: int):
+            # 依規劃的高度渲染頁面圖片並直接送出，返回結果與實際圖片尺寸
+            async with image_slots:
+                image, width, height = await renderer.render(page_num, image_height)
+                output, retries = await controller.run(
+                    lambda: recognize_page_image(self.model, image),  # Bedrock 使用 LiteLLM 格式
+                    retries=self.zerox_max_retries
+                )
+            if retries:
+                logger.info(f"頁面 {page_num} 節流重試 {retries} 次後完成")
+            return output, width, height
+
+        async def process_page(page_num: int):
+            plan = self.resolution_plans[page_num]
+            try:
+                output, width, height = await recognize(page_num, plan.image_height)
+            except Exception as e:
+                logger.error(f"視覺模型處理頁面 {page_num} 失敗: {e}")
+                return page_num, None
+            record_image(plan, width, height, self.model, self.resolution_baseline)
+            plan.input_tokens = output.input_tokens
+
+            # 先低解析度模式: 輸出信心不足時以較高解析度重新渲染並處理
+            escalation_height = escalation_heights.get(page_num)
+            profile = self.page_profiles.get(page_num)
+            if escalation_height and is_low_confidence(output.content, profile):
+                logger.info(f"頁面 {page_num} 低解析度輸出信心不足，改以 {escalation_height}px 重新處理")
+                try:
+                    retry_output, width, height = await recognize(page_num, escalation_height)
+                    escalate(plan, profile, self.model, self.resolution_heights, escalation_height)
+                    record_image(plan, width, height, self.model, self.resolution_baseline)
+                    retry_output.input_tokens += output.input_tokens
+                    plan.input_tokens = retry_output.input_tokens
+                    retry_output.output_tokens += output.output_tokens
+                    output = retry_output
+                except Exception as e:
+                    logger.warning(f"頁面 {page_num} 重新處理失敗，使用低解析度結果: {e}")
+            return page_num, output
+
         try:
-            import fitz  # PyMuPDF
+            outputs = await asyncio.gather(*[process_page(page_num) for page_num in select_pages])
+        finally:
+            renderer.close()
+
+        pages = [SimpleNamespace(page=page_num, content=output.content) for page_num, output in outputs if output]
+        failed_pages = [page_num for page_num, output in outputs if output is None]
+
+        self.concurrency_report = controller.report(len(pages))
+        logger.info(f"視覺模型處理速度: {self.concurrency_report['pages_per_minute']:.1f} 頁/分鐘 "
+                    f"(最高並發 {controller.peak_in_flight}，節流 {controller.throttled} 次)")
+
+        if not pages:
+            raise Exception("視覺模型處理失敗，所有頁面都未返回結果")
+        if failed_pages:
+            logger.warning(f"{len(failed_pages)} 個頁面處理失敗，已略過: {failed_pages}")
+
+        result = SimpleNamespace()
+        result.pages = pages
+        result.failed_pages = failed_pages
+        result.page_renders = sorted(renderer.page_renders.values(), key=lambda render: render.page_num)
+        for render in result.page_renders:
+            if render.error:
+                logger.warning(f"保存頁面圖片失敗 {render.image_path}: {render.error}")
+        result.input_tokens = sum(output.input_tokens for _, output in outputs if output)
+        result.output_tokens = sum(output.output_tokens for _, output in outputs if output)
+        return result
+
+    def plan_resolutions(self, select_pages: List[int]) -> Dict[int, int]:
+        """
+        為送視覺模型的頁面規劃圖片解析度
 
-            pdf_name = Path(pdf_path).stem
-            doc = fitz.open(pdf_path)
+        Returns:
+            Dict[int, int]: 先低解析度模式下，信心不足時重新處理使用的圖片高度
+        """
+        heights = self.resolution_heights if self.adaptive_resolution else [self.resolution_baseline] * 3
+        self.resolution_plans = {}
+        escalation_heights = {}
+        for page_num in select_pages:
+            profile = self.page_profiles.get(page_num)
+            plan = plan_page_resolution(
+                page_num, profile, self.model, heights, self.resolution_baseline,
+                low_density=self.resolution_low_density,
+                high_density=self.resolution_high_density
+            )
+            if self.adaptive_resolution and self.resolution_low_first:
+                escalation_heights[page_num] = start_low(plan, profile, self.model, heights)
+            self.resolution_plans[page_num] = plan
+
+        if self.adaptive_resolution:
+            levels = [plan.level for plan in self.resolution_plans.values()]
+            logger.info(f"自適應解析度: 低 {levels.count('low')} 頁，中 {levels.count('medium')} 頁，"
+                        f"高 {levels.count('high')} 頁" + ("（先低解析度模式）" if self.resolution_low_first else ""))
+        return escalation_heights
+
+    def resolution_summary(self) -> Dict[str, Any]:
+        """解析度規劃與估計節省的圖片 tokens"""
+        text_layer_profiles = [self.page_profiles.get(page.page) for page in self.text_layer_pages()]
+        return summarize_resolution(list(self.resolution_plans.values()), text_layer_profiles,
+                                    self.model, self.resolution_baseline)
+
+    async def route_selected_pages(self, pdf_path: str, select_pages: List[int]) -> List[int]:
+        """
+        頁面路由 - 依掃描結果與表格偵測決定每頁的處理方式，文字為主的頁面直接轉為 markdown
+
+        Returns:
+            List[int]: 需要送視覺模型的頁碼
+        """
+        self.page_routes = {}
+        if not self.text_fast_path_enabled or not self.page_profiles:
+            return select_pages
 
-            pages_to_process = select_pages if select_pages else range(1, len(doc) + 1)
-            generated_count = 0
-            skipped_count = 0
+        try:
+            self.page_routes = await asyncio.to_thread(
+                route_pages,
+                pdf_path,
+                self.page_profiles,
+                select_pages,
+                min_text_chars=self.text_fast_path_min_chars,
+                max_visual_ratio=self.text_fast_path_max_visual_ratio
+            )
+        except ImportError:
+            logger.warning("pdfplumber 未安裝，所有頁面使用視覺模型處理")
+            return select_pages
+        except Exception as e:
+            logger.warning(f"頁面路由失敗，所有頁面使用視覺模型處理: {e}")
+            return select_pages
 
-            for page_num in pages_to_process:
-                if page_num <= len(doc):
-                    # 檢查圖片是否已存在
-                    image_filename = f"{pdf_name}_page_{page_num}.png"
-                    image_path = os.path.join(output_dir, image_filename)
+        return [page_num for page_num in select_pages
+                if page_num not in self.page_routes or self.page_routes[page_num].route == ROUTE_VISION]
 
-                    if os.path.exists(image_path):
-                        logger.info(f"頁面圖片已存在，跳過: {image_path}")
-                        skipped_count += 1
-                        continue
+    def text_layer_pages(self) -> List[Any]:
+        """文字層轉換的頁面（與視覺模型頁面結構相同）"""
+        from types import SimpleNamespace
 
-                    page = doc[page_num - 1]  # PyMuPDF uses 0-based indexing
+        return [SimpleNamespace(page=route.page_num, content=route.markdown, route=ROUTE_TEXT_LAYER)
+                for route in self.page_routes.values() if route.route == ROUTE_TEXT_LAYER]
 
-                    # 生成高解析度圖片
-                    mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better quality
-                    pix = page.get_pixmap(matrix=mat)
+    async def generate_pdf_images(self, pdf_path: str, output_dir: str, select_pages: List[int] = None) -> List[PageRenderResult]:
+        """生成PDF頁面圖片 - 在進程池中渲染，不阻塞事件循環；已存在的圖片跳過"""
+        try:
+            import fitz  # PyMuPDF
 
-                    # 保存圖片
-                    pix.save(image_path)
-                    generated_count += 1
+            with fitz.open(pdf_path) as doc:
+                page_count = len(doc)
+            pages_to_process = [page_num for page_num in (select_pages if select_pages is not None
+                                                          else range(1, page_count + 1))
+                                if page_num <= page_count]
+
+            start_time = time.perf_counter()
+            self.page_renders = await arender_pdf_pages(
+                pdf_path,
+                output_dir,
+                pages_to_process,
+                pdf_name=Path(pdf_path).stem,
+                workers=self.page_render_workers
+            )
 
-                    logger.info(f"生成頁面圖片: {image_path}")
+            for render in self.page_renders:
+                if render.error:
+                    logger.warning(f"生成頁面圖片失敗 {render.image_path}: {render.error}")
+                elif not render.skipped:
+                    logger.info(f"生成頁面圖片: {render.image_path} "
+                                f"({render.render_ms:.0f}ms, {render.bytes_written / 1024:.1f}KB)")
 
-            doc.close()
-            logger.info(f"完成PDF圖片生成，共 {len(pages_to_process)} 頁 (新生成: {generated_count}, 跳過: {skipped_count})")
+            summary = summarize_renders(self.page_renders)
+            logger.info(f"完成PDF圖片生成，共 {len(pages_to_process)} 頁 (新生成: {summary['rendered']}, "
+                        f"跳過: {summary['skipped']}, 失敗: {summary['failed']}, "
+                        f"寫入 {summary['bytes_written'] / 1024 / 1024:.1f}MB, "
+                        f"耗時 {time.perf_counter() - start_time:.2f}秒)")
+            return self.page_renders
 
         except ImportError:
             logger.warning("PyMuPDF 未安裝，無法生成PDF圖片。請安裝: pip install PyMuPDF")
         except Exception as e:
             logger.error(f"生成PDF圖片失敗: {e}")
+        return []
 
     def identify_topic(self, text: str) -> str:
         """識別文字內容的主題分類"""
@@ -466,6 +695,11 @@ class ZeroxPDFProcessor:
         chunks = []
         
         pdf_name = Path(pdf_path).stem
+        source_file_hash = self.compute_file_hash(pdf_path)
+
+        # 文字層頁面沒有視覺模型成本，tokens 只分攤到送視覺模型的頁面
+        vision_page_count = sum(1 for page in zerox_result.pages
+                                if getattr(page, 'route', ROUTE_VISION) == ROUTE_VISION) or 1
 
         for page in zerox_result.pages:
             # 使用整頁內容作為一個chunk（一頁一個chunk）
@@ -487,11 +721,10 @@ class ZeroxPDFProcessor:
             sub_topic = metadata.get('sub_topic', self.generate_sub_topic(page_content, topic))
 
             # 計算該頁面的成本分攤
-            page_cost = self.calculate_cost(
-                zerox_result.input_tokens // len(zerox_result.pages),
-                zerox_result.output_tokens // len(zerox_result.pages),
-                self.model
-            )
+            is_vision_page = getattr(page, 'route', ROUTE_VISION) == ROUTE_VISION
+            page_input_tokens = zerox_result.input_tokens // vision_page_count if is_vision_page else 0
+            page_output_tokens = zerox_result.output_tokens // vision_page_count if is_vision_page else 0
+            page_cost = self.calculate_cost(page_input_tokens, page_output_tokens, self.model)
 
             # 構建圖片路徑 - 使用相對路徑便於Web訪問
             image_filename = f"{pdf_name}_page_{page.page}.png"
@@ -510,10 +743,11 @@ class ZeroxPDFProcessor:
                 image_path=image_path,  # 完整的圖片路徑
                 image_analysis=page_content,  # Zerox的分析結果就是頁面內容
                 technical_symbols=metadata.get('technical_symbols', self.extract_technical_symbols(page_content)),
-                input_tokens=zerox_result.input_tokens // len(zerox_result.pages),
-                output_tokens=zerox_result.output_tokens // len(zerox_result.pages),
+                source_file_hash=source_file_hash,
+                input_tokens=page_input_tokens,
+                output_tokens=page_output_tokens,
                 processing_cost=page_cost,
-                model_used=self.model
+                model_used=self.model if is_vision_page else ROUTE_TEXT_LAYER
             )
             
             # 添加檔案名稱資訊
@@ -532,6 +766,18 @@ class ZeroxPDFProcessor:
         
         return chunks
 
+    def compute_file_hash(self, file_path: str) -> str:
+        """計算文件的SHA-256哈希值，同一文件重新處理時保持不變"""
+        try:
+            hash_sha256 = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    hash_sha256.update(block)
+            return hash_sha256.hexdigest()
+        except Exception as e:
+            logger.warning(f"計算文件哈希失敗: {e}")
+            return ""
+
     def generate_sub_topic(self, content: str, topic: str) -> str:
         """生成子主題"""
         # 提取內容的前50個字符作為子主題
@@ -563,6 +809,7 @@ class ZeroxPDFProcessor:
         
         # 估算處理整個文檔的成本
         estimated_full_cost = cost_per_page * total_pages_in_pdf
+        resolution = self.resolution_summary()
         
         return ProcessingCostReport(
             total_pages=pages_processed,
@@ -572,7 +819,15 @@ class ZeroxPDFProcessor:
             model_used=self.model,
             processing_time=processing_time,
             cost_per_page=cost_per_page,
-            estimated_full_document_cost=estimated_full_cost
+            estimated_full_document_cost=estimated_full_cost,
+            render_summary=summarize_renders(self.page_renders),
+            page_renders=[render.to_dict() for render in self.page_renders],
+            pages_per_minute=self.concurrency_report.get("pages_per_minute", 0.0),
+            concurrency=self.concurrency_report,
+            text_layer_pages=len(self.text_layer_pages()),
+            estimated_tokens_saved=resolution["estimated_tokens_saved"],
+            resolution=resolution,
+            failed_pages=list(self.failed_pages)
         )
 
     def save_chunks(self, chunks: List[ZeroxDocumentChunk], output_path: str):
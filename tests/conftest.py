@@ -0,0 +1,8 @@
+"""pytest 共用設定 - 讓測試可直接匯入專案根目錄的 config 與 src 套件"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
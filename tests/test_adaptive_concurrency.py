@@ -0,0 +1,146 @@
+"""視覺模型呼叫 AIMD 並發控制的測試"""
+
+import asyncio
+
+import pytest
+
+from src.processors import adaptive_concurrency
+from src.processors.adaptive_concurrency import (
+    AdaptiveConcurrencyController, is_throttling_error, limit_for_model, parse_model_limits
+)
+
+
+class RateLimitError(Exception):
+    """模擬 OpenAI 的 429 例外"""
+    status_code = 429
+
+
+class ThrottlingException(Exception):
+    """模擬 Bedrock 的節流例外"""
+
+
+@pytest.fixture
+def no_backoff_sleep(monkeypatch):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(seconds, *args, **kwargs):
+        sleeps.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(adaptive_concurrency.asyncio, "sleep", fake_sleep)
+    return sleeps
+
+
+def test_throttling_errors_are_recognised():
+    assert is_throttling_error(RateLimitError("slow down"))
+    assert is_throttling_error(ThrottlingException("Rate exceeded"))
+    assert is_throttling_error(RuntimeError("Error code: 429 - Too Many Requests"))
+    assert not is_throttling_error(ValueError("invalid image"))
+
+
+def test_model_limits():
+    limits = parse_model_limits("gpt-4o=16, bedrock/*=8, broken, bad=x")
+    assert limits == {"gpt-4o": 16, "bedrock/*": 8}
+    assert limit_for_model("gpt-4o", limits, 4) == 16
+    assert limit_for_model("bedrock/anthropic.claude-3", limits, 4) == 8
+    assert limit_for_model("gpt-4o-mini", limits, 4) == 4
+
+
+def test_throttled_request_is_retried_and_limit_halved(no_backoff_sleep):
+    controller = AdaptiveConcurrencyController(initial=8, minimum=1, maximum=8)
+    calls = []
+
+    async def request():
+        calls.append(controller.current_limit)
+        if len(calls) <= 2:
+            raise RateLimitError("429")
+        return "page"
+
+    result, retries = asyncio.run(controller.run(request, retries=3))
+    assert (result, retries) == ("page", 2)
+    assert controller.throttled == 2
+    assert controller.current_limit < 8
+    assert no_backoff_sleep == [2, 4]
+    assert any(event["event"] == "decrease" for event in controller.trace)
+
+
+def test_throttling_beyond_retries_is_raised(no_backoff_sleep):
+    controller = AdaptiveConcurrencyController(initial=4)
+
+    async def request():
+        raise ThrottlingException("Rate exceeded")
+
+    with pytest.raises(ThrottlingException):
+        asyncio.run(controller.run(request, retries=2))
+    assert controller.throttled == 3
+    assert controller.in_flight == 0
+
+
+def test_other_errors_are_not_retried(no_backoff_sleep):
+    controller = AdaptiveConcurrencyController(initial=4)
+
+    async def request():
+        raise ValueError("bad page")
+
+    with pytest.raises(ValueError):
+        asyncio.run(controller.run(request))
+    assert controller.errors == 1
+    assert controller.throttled == 0
+    assert controller.current_limit == 4
+    assert no_backoff_sleep == []
+
+
+def test_simultaneous_throttles_halve_once(no_backoff_sleep):
+    controller = AdaptiveConcurrencyController(initial=8, minimum=1, maximum=8)
+
+    async def main():
+        attempts = {}
+
+        async def request(page):
+            attempts[page] = attempts.get(page, 0) + 1
+            await asyncio.sleep(0)
+            if attempts[page] == 1:
+                raise RateLimitError("429")
+            return page
+
+        return await asyncio.gather(*[controller.run(lambda page=page: request(page)) for page in range(8)])
+
+    results = asyncio.run(main())
+    assert [result for result, _ in results] == list(range(8))
+    assert controller.throttled == 8
+    assert controller.current_limit >= 4
+
+
+def test_successes_increase_limit_up_to_maximum():
+    controller = AdaptiveConcurrencyController(initial=1, minimum=1, maximum=3, latency_target=60)
+
+    async def request():
+        return "ok"
+
+    async def main():
+        for _ in range(20):
+            await controller.run(request)
+
+    asyncio.run(main())
+    assert controller.current_limit == 3
+    assert controller.completed == 20
+
+
+def test_in_flight_never_exceeds_limit():
+    controller = AdaptiveConcurrencyController(initial=2, minimum=1, maximum=2)
+    active = []
+
+    async def request():
+        active.append(controller.in_flight)
+        await asyncio.sleep(0.001)
+        return "ok"
+
+    async def main():
+        await asyncio.gather(*[controller.run(request) for _ in range(10)])
+
+    asyncio.run(main())
+    assert max(active) <= 2
+    assert controller.peak_in_flight == 2
+    report = controller.report(pages=10)
+    assert report["throttled"] == 0 and report["trace"][-1]["event"] == "end"
@@ -0,0 +1,83 @@
+"""集合資料版本與父段落快取失效的測試"""
+
+import types
+
+import pytest
+
+from config.config import Config
+from src.core import cache
+from src.core.cache import bump_collection_generation, get_collection_generation
+from src.core.langchain_rag_system import QdrantDocStore
+
+
+@pytest.fixture(autouse=True)
+def generation_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_GENERATION_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "CACHE_GENERATION_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(cache, "_collection_generations", {})
+    return tmp_path
+
+
+class FakeQdrantClient:
+    """只記錄 retrieve 次數的 Qdrant 客戶端"""
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.retrieve_calls = 0
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        self.retrieve_calls += 1
+        return [types.SimpleNamespace(payload={"doc_id": key, "content": content})
+                for key, content in self.contents.items()]
+
+    def scroll(self, **kwargs):
+        return [], None
+
+
+def test_unknown_collection_starts_at_zero():
+    assert get_collection_generation("manuals") == 0
+
+
+def test_bump_is_strictly_increasing_and_persisted(generation_dir):
+    generations = [bump_collection_generation("manuals") for _ in range(5)]
+    assert generations == sorted(set(generations))
+    assert (generation_dir / "manuals.generation").read_text() == str(generations[-1])
+    assert get_collection_generation("manuals") == generations[-1]
+
+
+def test_generations_are_per_collection():
+    bump_collection_generation("manuals")
+    assert get_collection_generation("drawings") == 0
+
+
+def test_write_from_another_process_is_seen_after_check_interval(generation_dir, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_GENERATION_CHECK_INTERVAL", 3600)
+    assert get_collection_generation("manuals") == 0
+
+    # 其他進程只會改寫共用檔案
+    (generation_dir / "manuals.generation").write_text("42")
+    assert get_collection_generation("manuals") == 0
+
+    monkeypatch.setattr(Config, "CACHE_GENERATION_CHECK_INTERVAL", 0)
+    assert get_collection_generation("manuals") == 42
+
+
+def test_unreadable_generation_keeps_current_value(generation_dir):
+    generation = bump_collection_generation("manuals")
+    (generation_dir / "manuals.generation").write_text("not a number")
+    assert get_collection_generation("manuals") == generation
+
+
+def test_bump_in_one_docstore_invalidates_another():
+    client = FakeQdrantClient({"parent-1": "old content"})
+    reader = QdrantDocStore(client, "manuals")
+    writer = QdrantDocStore(client, "manuals")
+
+    assert reader.mget(["parent-1"]) == ["old content"]
+    assert reader.mget(["parent-1"]) == ["old content"]
+    assert client.retrieve_calls == 1
+
+    client.contents["parent-1"] = "new content"
+    writer.bump_generation()
+    assert reader.mget(["parent-1"]) == ["new content"]
+    assert client.retrieve_calls == 2
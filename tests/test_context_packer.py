@@ -0,0 +1,83 @@
+"""上下文 token 預算打包的測試"""
+
+import types
+
+import pytest
+
+from src.core import context_packer
+from src.core.context_packer import ContextPacker, count_tokens, truncate_tokens
+
+MODEL = "test-model"
+
+
+@pytest.fixture(autouse=True)
+def character_tokens(monkeypatch):
+    # 以字元數計算 token 數，結果不依賴 tiktoken 編碼檔
+    monkeypatch.setitem(context_packer._encodings, MODEL, None)
+
+
+def result(text, token_count=None):
+    return types.SimpleNamespace(parent_content=text, parent_token_count=token_count)
+
+
+def paragraph(seed, length):
+    return "".join(chr(0x4E00 + (seed * 997 + i * 31) % 20000) for i in range(length))
+
+
+def test_count_and_truncate_tokens():
+    assert count_tokens("", MODEL) == 0
+    assert count_tokens("abcdef", MODEL) == 6
+    assert truncate_tokens("abcdef", MODEL, 4) == "abcd"
+    assert truncate_tokens("abcdef", MODEL, 10) == "abcdef"
+    assert truncate_tokens("abcdef", MODEL, 0) == ""
+
+
+def test_packs_in_order_until_budget_and_skips_to_shorter_results():
+    packer = ContextPacker(MODEL, budget=100, separator="\n\n")
+    results = [result(paragraph(1, 60)), result(paragraph(2, 50)), result(paragraph(3, 30))]
+    packed = packer.pack(results)
+
+    assert packed.results == [results[0], results[2]]
+    assert packed.dropped_budget == 1
+    assert packed.token_count == 60 + 2 + 30
+    assert packed.token_count <= packed.budget
+    assert count_tokens(packed.text, MODEL) == packed.token_count
+
+
+def test_header_and_footer_count_against_budget():
+    packer = ContextPacker(MODEL, budget=70)
+    packed = packer.pack([result(paragraph(1, 50))], header=lambda r: "## 標題\n", footer=lambda r: "\n[圖]")
+    assert packed.token_count == count_tokens(packed.text, MODEL) == 50 + 6 + 4
+
+
+def test_precomputed_token_count_is_used():
+    packer = ContextPacker(MODEL, budget=100)
+    packed = packer.pack([result(paragraph(1, 10), token_count=95), result(paragraph(2, 10))])
+    assert len(packed.results) == 1
+    assert packed.token_count == 95
+
+
+def test_overlapping_parent_is_skipped():
+    text = paragraph(1, 80)
+    packer = ContextPacker(MODEL, budget=0)
+    packed = packer.pack([result(text), result(text[:70]), result(paragraph(2, 40))])
+    assert len(packed.results) == 2
+    assert packed.dropped_overlap == 1
+
+
+def test_oversize_first_parent_is_truncated_to_budget():
+    packer = ContextPacker(MODEL, budget=50)
+    packed = packer.pack([result(paragraph(1, 200)), result(paragraph(2, 80))],
+                         header=lambda r: "# ", footer=lambda r: "")
+    assert packed.truncated == 1
+    assert packed.token_count == 50
+    assert packed.parts[0] == "# " + paragraph(1, 200)[:48]
+    assert packed.dropped_budget == 1
+    assert packed.summary()["truncated"] == 1
+
+
+def test_zero_budget_is_unlimited():
+    packer = ContextPacker(MODEL, budget=0)
+    packed = packer.pack([result(paragraph(seed, 500)) for seed in range(5)])
+    assert len(packed.results) == 5
+    assert packed.dropped_budget == 0
@@ -0,0 +1,101 @@
+"""查詢向量微批次的測試：合併、取消與錯誤傳遞"""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.core.embedding_batcher import EmbeddingBatcher
+
+
+class RecordingEmbeddings:
+    """記錄每次批量呼叫的嵌入模型替身（gate 未設定前阻塞呼叫）"""
+
+    def __init__(self, error=None, gate=None):
+        self.calls = []
+        self.error = error
+        self.gate = gate
+
+    def embed_documents(self, texts):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_concurrent_queries_share_one_call():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, window_ms=50)
+
+    futures = [batcher.submit(text) for text in ("a", "bb", "a", "ccc")]
+    assert [future.result(5) for future in futures] == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    # 相同的查詢只送出一次
+    assert embeddings.calls == [["a", "bb", "ccc"]]
+
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["items"] == 4
+
+
+def test_max_items_splits_batches():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, window_ms=50, max_items=2)
+
+    futures = [batcher.submit(str(i)) for i in range(5)]
+    for future in futures:
+        future.result(5)
+    assert all(len(call) <= 2 for call in embeddings.calls)
+    assert sorted(text for call in embeddings.calls for text in call) == ["0", "1", "2", "3", "4"]
+
+
+def test_cancelled_caller_does_not_block_the_rest_of_the_batch():
+    gate = threading.Event()
+    embeddings = RecordingEmbeddings(gate=gate)
+    batcher = EmbeddingBatcher(embeddings, window_ms=50)
+
+    cancelled = batcher.submit("a")
+    others = [batcher.submit("b"), batcher.submit("c")]
+    # 嵌入API呼叫進行中時取消
+    assert cancelled.cancel()
+    gate.set()
+
+    assert [future.result(5) for future in others] == [[1.0, 1.0], [1.0, 1.0]]
+    assert cancelled.cancelled()
+
+
+def test_batch_of_only_cancelled_callers_skips_the_api_call():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, window_ms=50)
+
+    future = batcher.submit("a")
+    future.cancel()
+    # 下一個批次仍正常完成
+    assert batcher.submit("b").result(5) == [1.0, 1.0]
+    assert ["a"] not in embeddings.calls
+
+
+def test_errors_reach_every_caller():
+    embeddings = RecordingEmbeddings(error=RuntimeError("rate limited"))
+    batcher = EmbeddingBatcher(embeddings, window_ms=50)
+
+    futures = [batcher.submit(text) for text in ("a", "b")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="rate limited"):
+            future.result(5)
+    assert batcher.stats()["errors"] == 1
+
+
+def test_async_callers_and_cancellation():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, window_ms=50)
+
+    async def run():
+        task = asyncio.ensure_future(batcher.aembed("a"))
+        kept = asyncio.ensure_future(batcher.aembed("bb"))
+        await asyncio.sleep(0)
+        task.cancel()
+        return await kept
+
+    assert asyncio.run(run()) == [2.0, 1.0]
@@ -0,0 +1,142 @@
+"""查詢向量與文件向量快取的測試"""
+
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from src.core.embedding_cache import (
+    CachedEmbeddings, DocumentEmbeddingCache, QueryEmbeddingCache, SQLiteVectorStore, normalize_query,
+    shorten_vector
+)
+
+
+class CountingEmbeddings(Embeddings):
+    """以文字長度生成向量並記錄 API 呼叫的嵌入模型"""
+
+    def __init__(self, dimension=4):
+        self.dimension = dimension
+        self.query_calls = []
+        self.document_calls = []
+
+    def _vector(self, text):
+        return [float(len(text) + i) for i in range(self.dimension)]
+
+    def embed_query(self, text):
+        self.query_calls.append(text)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def test_normalize_query_and_shorten_vector():
+    assert normalize_query("  ＡＢ－１２３４  規格？ ") == normalize_query("ab-1234 規格?")
+    vector = shorten_vector(np.array([3.0, 4.0, 12.0]), 2)
+    assert vector.tolist() == pytest.approx([0.6, 0.8])
+    assert shorten_vector(np.array([1.0, 2.0]), None).tolist() == [1.0, 2.0]
+
+
+def test_query_cache_hit_and_miss():
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4))
+
+    first = cached.embed_query("配電盤規格")
+    second = cached.embed_query("  配電盤規格 ")
+    assert first == second
+    assert embeddings.query_calls == ["配電盤規格"]
+    stats = cached.query_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_query_cache_is_keyed_by_model_and_dimension():
+    assert QueryEmbeddingCache("model-a", 4)._key("q") != QueryEmbeddingCache("model-b", 4)._key("q")
+    assert QueryEmbeddingCache("model-a", 4)._key("q") != QueryEmbeddingCache("model-a", 8)._key("q")
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache("model-a", 4, max_entries=2)
+    for query in ("a", "b"):
+        cache.set(query, [1.0, 0.0, 0.0, 0.0])
+    cache.get("a")
+    cache.set("c", [0.0, 1.0, 0.0, 0.0])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.memory.stats()["evictions"] == 1
+
+
+def test_query_disk_tier_persists_across_instances(tmp_path):
+    path = str(tmp_path / "queries.db")
+    QueryEmbeddingCache("model-a", 4, disk_path=path).set("配電盤", [1.0, 2.0, 3.0, 4.0])
+
+    reopened = QueryEmbeddingCache("model-a", 4, disk_path=path)
+    assert reopened.get("配電盤").tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert reopened.disk_hits == 1
+    assert QueryEmbeddingCache("model-b", 4, disk_path=path).get("配電盤") is None
+
+
+def test_async_query_uses_disk_tier(tmp_path):
+    path = str(tmp_path / "queries.db")
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4, disk_path=path))
+    asyncio.run(cached.aembed_query("接線"))
+
+    reopened = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4, disk_path=path))
+    assert asyncio.run(reopened.aembed_queries(["接線", "接線 ", "配電"])) == [
+        embeddings._vector("接線"), embeddings._vector("接線"), embeddings._vector("配電")
+    ]
+    assert embeddings.query_calls == ["接線"]
+    assert embeddings.document_calls == [["配電"]]
+
+
+def test_document_cache_embeds_only_new_chunks(tmp_path):
+    path = str(tmp_path / "documents.db")
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4),
+                              DocumentEmbeddingCache("model-a", 4, path), batch_size=2)
+
+    cached.embed_documents(["a", "bb", "a", "ccc"])
+    assert embeddings.document_calls == [["a", "bb"], ["ccc"]]
+
+    embeddings.document_calls.clear()
+    reopened = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4),
+                                DocumentEmbeddingCache("model-a", 4, path))
+    vectors = reopened.embed_documents(["bb", "dddd"])
+    assert embeddings.document_calls == [["dddd"]]
+    assert vectors[0] == embeddings._vector("bb")
+    assert (reopened.document_cache.hits, reopened.document_cache.misses) == (1, 1)
+
+
+def test_document_cache_is_keyed_by_model_and_dimension(tmp_path):
+    path = str(tmp_path / "documents.db")
+    assert DocumentEmbeddingCache("model-a", 4, path).key("x") != DocumentEmbeddingCache("model-b", 4, path).key("x")
+    assert DocumentEmbeddingCache("model-a", 4, path).key("x") != DocumentEmbeddingCache("model-a", 8, path).key("x")
+
+
+def test_output_dimension_returns_short_vectors_and_keeps_full_ones(tmp_path):
+    embeddings = CountingEmbeddings(dimension=4)
+    cached = CachedEmbeddings(embeddings, QueryEmbeddingCache("model-a", 4),
+                              DocumentEmbeddingCache("model-a", 4, str(tmp_path / "documents.db")),
+                              output_dimension=2)
+    assert len(cached.embed_query("abc")) == 2
+    assert len(cached.full_query_vector("abc")) == 4
+    assert len(cached.embed_documents(["abc"])[0]) == 2
+    assert len(cached.full_document_vectors(["abc", "missing"])[0]) == 4
+    assert cached.full_document_vectors(["missing"]) == [None]
+
+
+def test_sqlite_vector_store_round_trip(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "vectors.db"))
+    store.set_many({f"k{i}": np.full(3, i, dtype=np.float32) for i in range(600)})
+    found = store.get_many([f"k{i}" for i in range(0, 600, 7)] + ["missing"])
+    assert len(found) == len(range(0, 600, 7))
+    assert found["k14"].tolist() == [14.0, 14.0, 14.0]
+    assert store.count() == 600
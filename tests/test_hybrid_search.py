@@ -0,0 +1,163 @@
+"""BM25 索引與倒數排名融合（RRF）的測試"""
+
+import os
+import threading
+import time
+import types
+
+import pytest
+from langchain.schema import Document
+
+from src.core.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from src.core.langchain_rag_system import LangChainParentChildRAG
+
+
+def test_rrf_scores_follow_the_formula():
+    fused = dict(reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60))
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["c"] == pytest.approx(1 / 62)
+
+
+def test_rrf_rewards_documents_found_by_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "b"]], k=60)
+    ranked = [doc_id for doc_id, _ in fused]
+    assert set(ranked[:2]) == {"b", "c"}
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
+
+
+def test_rrf_single_ranking_keeps_order():
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
+
+
+def test_rrf_empty():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_tokenize_keeps_part_numbers_whole():
+    assert "ab-1234" in tokenize("請查詢料號 AB-1234 的規格")
+
+
+def test_bm25_finds_exact_part_number_and_honours_filter():
+    index = BM25Index()
+    index.add_documents(
+        ["1", "2", "3"],
+        ["料號 AB-1234 的安裝說明", "料號 CD-5678 的安裝說明", "AB-1234 配線圖"],
+        [{"page_num": 1}, {"page_num": 2}, {"page_num": 3}]
+    )
+    assert {doc_id for doc_id, _ in index.search("AB-1234")} == {"1", "3"}
+    assert [doc_id for doc_id, _ in index.search("AB-1234", metadata_filter=lambda m: m["page_num"] == 3)] == ["3"]
+
+    index.remove_documents(["3"])
+    assert [doc_id for doc_id, _ in index.search("AB-1234")] == ["1"]
+
+
+def test_bm25_persists_and_reloads(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = BM25Index(path)
+    index.add_documents(["1"], ["配電盤接線"], [{"source_filename": "a.pdf"}])
+    index.save()
+
+    reloaded = BM25Index(path)
+    assert len(reloaded) == 1
+    assert reloaded.search("配電盤")[0][0] == "1"
+
+
+def test_hybrid_fuse_orders_by_rrf_and_records_fused_score():
+    bm25_index = BM25Index()
+    bm25_index.add_documents(["d2", "b1"], ["AB-1234 規格", "AB-1234 配線"], [{}, {}])
+    rag = types.SimpleNamespace(bm25_index=bm25_index, _ensure_bm25_index=lambda: True)
+
+    dense = [(Document(page_content=f"dense {doc_id}", metadata={"_id": doc_id}), score)
+             for doc_id, score in (("d1", 0.9), ("d2", 0.8))]
+    fused = LangChainParentChildRAG._hybrid_fuse(rag, "AB-1234", dense, k=10)
+
+    ids = [doc.metadata["_id"] for doc, _ in fused]
+    assert ids[0] == "d2"  # 兩種檢索都找到
+    assert set(ids) == {"d1", "d2", "b1"}
+    scores = [doc.metadata["_fused_score"] for doc, _ in fused]
+    assert scores == sorted(scores, reverse=True)
+    # 只由 BM25 找到的子段落使用候選中最低的向量分數
+    assert dict((doc.metadata["_id"], score) for doc, score in fused)["b1"] == 0.8
+
+
+class ScrollingQdrant:
+    """只實作 scroll 的 Qdrant 替身；gate 控制何時返回，用來觀察建立中的狀態"""
+
+    def __init__(self, texts, gate=None):
+        self.points = [types.SimpleNamespace(id=str(i), payload={"page_content": text, "metadata": {}})
+                       for i, text in enumerate(texts)]
+        self.gate = gate
+
+    def scroll(self, collection_name, limit, offset=None, with_payload=True, with_vectors=False):
+        if self.gate is not None:
+            self.gate.wait(5)
+        start = offset or 0
+        end = start + limit
+        return self.points[start:end], (end if end < len(self.points) else None)
+
+
+def make_rag_with_bm25(path, qdrant_client):
+    rag = LangChainParentChildRAG.__new__(LangChainParentChildRAG)
+    rag.child_collection_name = "demo_langchain_children"
+    rag.qdrant_client = qdrant_client
+    rag.bm25_index = BM25Index(str(path))
+    rag._bm25_lock = threading.Lock()
+    rag._bm25_building = False
+    rag._bm25_generation = 0
+    rag._bm25_ready = threading.Event()
+    return rag
+
+
+def test_bm25_index_builds_in_background_and_falls_back_to_dense(tmp_path):
+    gate = threading.Event()
+    rag = make_rag_with_bm25(tmp_path / "bm25.json", ScrollingQdrant(["AB-1234 規格", "配電盤"], gate))
+    dense = [(Document(page_content="dense", metadata={"_id": "x"}), 0.9)]
+
+    # 建立完成前不阻塞查詢，只返回向量檢索結果
+    assert rag._hybrid_fuse("AB-1234", dense, k=5) == dense
+    assert rag._bm25_building
+
+    gate.set()
+    assert rag._bm25_ready.wait(5)
+    assert (tmp_path / "bm25.json").exists()
+    ids = [doc.metadata["_id"] for doc, _ in rag._hybrid_fuse("AB-1234", dense, k=5)]
+    assert "0" in ids
+
+
+def test_reset_bm25_index_removes_file_and_stops_build(tmp_path):
+    path = tmp_path / "bm25.json"
+    rag = make_rag_with_bm25(path, ScrollingQdrant(["配電盤"]))
+    rag._ensure_bm25_index()
+    assert rag._bm25_ready.wait(5)
+    assert path.exists()
+
+    rag.reset_bm25_index()
+    assert not path.exists()
+    assert len(rag.bm25_index) == 0
+    assert not rag._bm25_ready.is_set()
+
+    # 重設前開始的建立不會把舊資料寫回
+    gate = threading.Event()
+    rag.qdrant_client = ScrollingQdrant(["舊資料"], gate)
+    rag._ensure_bm25_index()
+    rag.reset_bm25_index()
+    gate.set()
+    time.sleep(0.1)
+    assert len(rag.bm25_index) == 0
+    assert not path.exists()
+
+
+def test_bm25_save_uses_per_writer_temp_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "bm25.json")
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: (replaced.append(src), real_replace(src, dst)))
+
+    index = BM25Index(path)
+    index.add_documents(["1"], ["配電盤"])
+    index.save()
+
+    assert replaced[0] != f"{path}.tmp"
+    assert str(os.getpid()) in replaced[0]
@@ -0,0 +1,168 @@
+"""本地向量副本的建立、增量同步、版本清理與刪除測試"""
+
+import os
+import threading
+import types
+
+import numpy as np
+import pytest
+
+from src.core.local_vector_index import LocalVectorIndex
+from src.core.retrieval_filters import RetrievalFilter
+
+COLLECTION = "demo_langchain_children"
+
+
+class FakeQdrantClient:
+    """以字典保存點的 Qdrant 客戶端（scroll 與 retrieve）"""
+
+    def __init__(self, vectors=None):
+        self.points = {}
+        for row, vector in enumerate(vectors if vectors is not None else []):
+            self.put(f"p{row}", vector, source=f"{row % 3}.pdf", page=row % 10 + 1)
+
+    def put(self, point_id, vector, source="a.pdf", page=1):
+        self.points[point_id] = types.SimpleNamespace(
+            id=point_id,
+            vector=list(map(float, vector)),
+            payload={"page_content": f"chunk {point_id}",
+                     "metadata": {"source_filename": source, "page_num": page}}
+        )
+
+    def scroll(self, collection_name, limit, offset, with_payload, with_vectors):
+        points = list(self.points.values())
+        start = offset or 0
+        end = start + limit
+        return points[start:end], (end if end < len(points) else None)
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        return [self.points[point_id] for point_id in ids if point_id in self.points]
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(7).normal(size=(200, 32)).astype(np.float32)
+
+
+def brute_force(client, query, k, rows=None):
+    ids = [point_id for point_id in client.points if rows is None or point_id in rows]
+    matrix = np.array([client.points[point_id].vector for point_id in ids], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    scores = matrix @ (query / np.linalg.norm(query))
+    order = np.argsort(-scores)[:k]
+    return [ids[i] for i in order], scores[order]
+
+
+def search_ids(index, query, k, **kwargs):
+    results = index.search(query.tolist(), k, **kwargs)
+    return [index.ids[row] for row, _ in results], np.array([score for _, score in results])
+
+
+def test_build_and_search_match_brute_force(tmp_path, vectors):
+    client = FakeQdrantClient(vectors)
+    index = LocalVectorIndex(str(tmp_path), COLLECTION)
+    assert not index.synced
+    assert index.sync(client) == len(vectors)
+    assert index.ready
+
+    query = np.random.default_rng(1).normal(size=32).astype(np.float32)
+    expected_ids, expected_scores = brute_force(client, query, 10)
+    ids, scores = search_ids(index, query, 10)
+    assert ids == expected_ids
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    # 過濾條件只在符合的列中精確計算
+    rows = {point_id for point_id, point in client.points.items()
+            if point.payload["metadata"]["source_filename"] == "1.pdf"}
+    ids, _ = search_ids(index, query, 5, filters=RetrievalFilter(source_filenames=["1.pdf"]))
+    assert ids == brute_force(client, query, 5, rows)[0]
+
+
+def test_incremental_sync_updates_and_removes_points(tmp_path, vectors):
+    client = FakeQdrantClient(vectors[:50])
+    index = LocalVectorIndex(str(tmp_path), COLLECTION)
+    index.sync(client)
+    first_version = index.version
+
+    client.put("new", vectors[100])
+    client.put("p0", vectors[101])  # 覆蓋既有的點
+    del client.points["p1"]
+    assert index.sync(client, point_ids=["new", "p0"], removed_ids=["p1"]) == 50
+    assert index.version > first_version
+
+    assert set(index.ids) == set(client.points)
+    found = index.vectors_for(["new", "p0", "p1"])
+    assert set(found) == {"new", "p0"}
+    np.testing.assert_allclose(found["p0"], vectors[101] / np.linalg.norm(vectors[101]), rtol=1e-5)
+
+    # 重新開啟時載入同一版本
+    reopened = LocalVectorIndex(str(tmp_path), COLLECTION)
+    assert reopened.version == index.version
+    assert reopened.ids == index.ids
+
+
+def test_concurrent_writers_keep_each_others_points(tmp_path, vectors):
+    client = FakeQdrantClient(vectors[:20])
+    LocalVectorIndex(str(tmp_path), COLLECTION).sync(client)
+    # 兩個實例模擬兩個進程，各自持有載入時的版本
+    writers = [LocalVectorIndex(str(tmp_path), COLLECTION) for _ in range(2)]
+
+    def ingest(writer, names):
+        for name in names:
+            client.put(name, vectors[len(client.points) % len(vectors)])
+            writer.sync(client, point_ids=[name])
+
+    threads = [threading.Thread(target=ingest, args=(writer, [f"w{n}-{i}" for i in range(5)]))
+               for n, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    final = LocalVectorIndex(str(tmp_path), COLLECTION)
+    assert set(final.ids) == set(client.points)
+    assert len(final) == 30
+
+
+def test_old_versions_are_kept_for_readers_then_removed(tmp_path, vectors, monkeypatch):
+    client = FakeQdrantClient(vectors[:10])
+    index = LocalVectorIndex(str(tmp_path), COLLECTION)
+    versions = []
+    for row in range(3):
+        client.put(f"n{row}", vectors[50 + row])
+        index.sync(client, point_ids=[f"n{row}"] if versions else None)
+        versions.append(index.version)
+
+    def files_for(version):
+        return [path for file_version, path in index._version_files() if file_version == version]
+
+    # 寬限期內舊版本都保留
+    assert all(files_for(version) for version in versions)
+
+    monkeypatch.setattr(LocalVectorIndex, "OLD_VERSION_GRACE_SECONDS", 0)
+    client.put("n3", vectors[60])
+    index.sync(client, point_ids=["n3"])
+    # 目前與前一個版本保留，更舊的版本刪除
+    assert files_for(index.version)
+    assert files_for(versions[-1])
+    assert not files_for(versions[0]) and not files_for(versions[1])
+
+
+def test_drop_removes_files_and_other_instances_stop_answering(tmp_path, vectors):
+    client = FakeQdrantClient(vectors[:10])
+    index = LocalVectorIndex(str(tmp_path), COLLECTION)
+    index.sync(client)
+    other = LocalVectorIndex(str(tmp_path), COLLECTION)
+    assert other.ready
+
+    index.drop()
+    assert not index.ready and not index.synced
+    assert index.search(vectors[0].tolist(), 5) == []
+    assert not [name for name in os.listdir(tmp_path) if not name.endswith(".lock")]
+
+    other.reload_if_changed()
+    assert not other.ready
+    assert other.search(vectors[0].tolist(), 5) == []
+
+    # 重新建立集合後從頭同步
+    assert index.sync(client, point_ids=["p0"]) == 10
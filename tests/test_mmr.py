@@ -0,0 +1,71 @@
+"""最大邊際相關性（MMR）重新排序的測試"""
+
+import numpy as np
+from langchain.schema import Document
+
+from config.config import Config
+from src.core.langchain_rag_system import LangChainParentChildRAG
+from src.core.mmr import mmr_select
+
+
+def test_relevance_only_keeps_relevance_order():
+    relevance = np.array([0.2, 0.9, 0.5])
+    assert mmr_select(relevance, np.eye(3), k=3, lambda_mult=1.0) == [1, 2, 0]
+
+
+def test_near_duplicate_is_pushed_down():
+    vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]])
+    relevance = np.array([0.9, 0.89, 0.7])
+    assert mmr_select(relevance, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_per_file_and_per_page_limits():
+    relevance = np.array([0.9, 0.8, 0.7, 0.6])
+    files = ["a.pdf", "a.pdf", "a.pdf", "b.pdf"]
+    pages = [("a.pdf", 1), ("a.pdf", 1), ("a.pdf", 2), ("b.pdf", 1)]
+    assert mmr_select(relevance, np.eye(4), k=4, lambda_mult=1.0, file_keys=files, max_per_file=2) == [0, 1, 3]
+    assert mmr_select(relevance, np.eye(4), k=4, lambda_mult=1.0, page_keys=pages, max_per_page=1) == [0, 2, 3]
+
+
+def test_k_larger_than_candidates_and_empty_input():
+    assert sorted(mmr_select(np.array([0.5, 0.4]), np.eye(2), k=5)) == [0, 1]
+    assert mmr_select(np.array([]), np.zeros((0, 2)), k=3) == []
+    assert mmr_select(np.array([0.5]), np.eye(1), k=0) == []
+
+
+def _child_docs(entries):
+    return [(Document(page_content=doc_id, metadata={"_id": doc_id, "source_filename": "a.pdf", "page_num": page,
+                                                     **({"_fused_score": fused} if fused is not None else {})}),
+             dense)
+            for doc_id, dense, fused, page in entries]
+
+
+def test_rerank_uses_each_candidates_own_fused_score(monkeypatch):
+    monkeypatch.setattr(Config, "MMR_LAMBDA", 1.0)
+    monkeypatch.setattr(Config, "MMR_MAX_PER_FILE", 0)
+    monkeypatch.setattr(Config, "MMR_MAX_PER_PAGE", 0)
+    # 融合後的順序與向量分數不同：向量分數最高的 x 融合分數最低
+    child_docs = _child_docs([("y", 0.5, 0.03, 1), ("z", 0.7, 0.02, 2), ("x", 0.9, 0.01, 3)])
+    vectors = {doc_id: np.eye(3)[row] for row, doc_id in enumerate("xyz")}
+
+    selected = LangChainParentChildRAG._mmr_rerank(None, child_docs, vectors, 3)
+    assert [doc.page_content for doc, _ in selected] == ["y", "z", "x"]
+    # 原本的向量分數保留在結果中
+    assert [score for _, score in selected] == [0.5, 0.7, 0.9]
+
+
+def test_rerank_without_fusion_uses_dense_scores(monkeypatch):
+    monkeypatch.setattr(Config, "MMR_LAMBDA", 1.0)
+    monkeypatch.setattr(Config, "MMR_MAX_PER_FILE", 0)
+    monkeypatch.setattr(Config, "MMR_MAX_PER_PAGE", 0)
+    child_docs = _child_docs([("y", 0.5, None, 1), ("x", 0.9, None, 2), ("z", 0.7, None, 3)])
+    vectors = {doc_id: np.eye(3)[row] for row, doc_id in enumerate("xyz")}
+
+    selected = LangChainParentChildRAG._mmr_rerank(None, child_docs, vectors, 3)
+    assert [doc.page_content for doc, _ in selected] == ["x", "z", "y"]
+
+
+def test_rerank_skips_candidates_without_vectors(monkeypatch):
+    monkeypatch.setattr(Config, "MMR_LAMBDA", 1.0)
+    child_docs = _child_docs([("x", 0.9, None, 1), ("y", 0.5, None, 2)])
+    assert LangChainParentChildRAG._mmr_rerank(None, child_docs, {"x": np.ones(2)}, 2) == child_docs[:2]
@@ -0,0 +1,188 @@
+"""視覺請求自適應頁面解析度規劃的測試"""
+
+import asyncio
+import types
+
+import fitz
+import pytest
+
+from src.processors.page_resolution import (
+    LEVEL_HIGH, LEVEL_LOW, LEVEL_MEDIUM, content_density, escalate, estimate_image_tokens, image_size,
+    is_low_confidence, parse_levels, plan_page_resolution, record_image, start_low, summarize_resolution
+)
+from src.processors.pdf_page_render import PageImageRenderer, page_image_path, render_and_save_page, render_page_png
+from src.processors.pdf_page_scan import PAGE_KIND_IMAGE, PAGE_KIND_TEXT, PageProfile
+
+HEIGHTS = [512, 768, 1056]
+MODEL = "gpt-4o"
+
+
+def text_profile(text_chars=100, drawing_ratio=0.0, image_ratio=0.0):
+    return PageProfile(1, PAGE_KIND_TEXT, text_chars, image_ratio=image_ratio, drawing_ratio=drawing_ratio,
+                       width=595, height=842)
+
+
+def test_parse_levels():
+    assert parse_levels("1056, 512,768") == HEIGHTS
+    with pytest.raises(ValueError):
+        parse_levels("512,768")
+
+
+def test_image_size_follows_page_aspect_ratio():
+    assert image_size(PageProfile(1, PAGE_KIND_TEXT, width=842, height=595), 595) == (842, 595)
+    assert image_size(None, 1414) == (1000, 1414)
+
+
+def test_openai_tile_estimate():
+    assert estimate_image_tokens(1000, 2000, MODEL) == (85 + 170 * 6, 6)
+    assert estimate_image_tokens(362, 512, MODEL) == (85 + 170, 1)
+
+
+def test_claude_pixel_estimate():
+    tokens, tiles = estimate_image_tokens(1000, 2000, "bedrock/anthropic.claude-3-5-sonnet")
+    assert (tokens, tiles) == (1640, 0)
+
+
+def test_content_density():
+    assert content_density(None) == 1.0
+    assert content_density(PageProfile(1, PAGE_KIND_IMAGE, white_ratio=0.9)) == pytest.approx(0.5)
+    assert content_density(text_profile(text_chars=4000)) == 1.0
+    assert content_density(text_profile(drawing_ratio=0.3)) == pytest.approx(0.3)
+
+
+@pytest.mark.parametrize("profile, level, height", [
+    (text_profile(text_chars=100), LEVEL_LOW, 512),
+    (text_profile(drawing_ratio=0.3), LEVEL_MEDIUM, 768),
+    (text_profile(drawing_ratio=0.6), LEVEL_HIGH, 1056),
+])
+def test_plan_picks_level_by_density(profile, level, height):
+    plan = plan_page_resolution(1, profile, MODEL, HEIGHTS, baseline_height=1056)
+    assert (plan.level, plan.image_height) == (level, height)
+    assert plan.image_tokens <= plan.baseline_tokens
+    assert plan.image_tokens == estimate_image_tokens(*image_size(profile, height), MODEL)[0]
+
+
+def test_low_first_and_escalation_accounting():
+    profile = text_profile(drawing_ratio=0.6)
+    plan = plan_page_resolution(1, profile, MODEL, HEIGHTS, baseline_height=1056)
+    escalation_height = start_low(plan, profile, MODEL, HEIGHTS)
+    assert escalation_height == 1056
+    assert (plan.level, plan.image_height) == (LEVEL_LOW, 512)
+
+    low_tokens = plan.image_tokens
+    escalate(plan, profile, MODEL, HEIGHTS, escalation_height)
+    assert plan.escalated and plan.level == LEVEL_HIGH
+    assert plan.escalation_tokens == low_tokens
+
+
+def test_record_image_uses_rendered_size():
+    plan = plan_page_resolution(1, None, MODEL, HEIGHTS, baseline_height=1056)
+    record_image(plan, 747, 1056, MODEL, baseline_height=1056)
+    assert (plan.image_width, plan.rendered_height) == (747, 1056)
+    assert plan.image_tokens == plan.baseline_tokens == estimate_image_tokens(747, 1056, MODEL)[0]
+
+
+def test_low_confidence_detection():
+    long_text = "配電盤 AB-1234 接線說明 " * 10
+    assert is_low_confidence("", None)
+    assert is_low_confidence(long_text + " the label is illegible", None)
+    assert is_low_confidence(long_text + "文字模糊", None)
+    assert not is_low_confidence(long_text, None)
+    assert is_low_confidence(long_text, text_profile(text_chars=len(long_text) * 3))
+
+
+def test_summary_counts_savings_and_actual_tokens():
+    profiles = [text_profile(text_chars=100), text_profile(drawing_ratio=0.6)]
+    plans = [plan_page_resolution(page, profile, MODEL, HEIGHTS, baseline_height=1056)
+             for page, profile in enumerate(profiles, start=1)]
+    record_image(plans[0], 362, 512, MODEL, baseline_height=1056)
+    plans[0].input_tokens = 400
+
+    summary = summarize_resolution(plans, [text_profile(text_chars=3000)], MODEL, baseline_height=1056)
+    assert summary["levels"] == {LEVEL_LOW: 1, LEVEL_MEDIUM: 0, LEVEL_HIGH: 1}
+    assert summary["resolution_tokens_saved"] == summary["baseline_image_tokens"] - summary["planned_image_tokens"]
+    assert summary["resolution_tokens_saved"] > 0
+    assert summary["text_layer_tokens_saved"] == estimate_image_tokens(*image_size(profiles[0], 1056), MODEL)[0]
+    assert summary["rendered_pages"] == 1
+    assert summary["actual_input_tokens"] == 400
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    doc = fitz.open()
+    doc.new_page(width=595, height=842).insert_text((72, 72), "page one")
+    doc.new_page(width=842, height=595).insert_text((72, 72), "page two")
+    path = tmp_path / "sample.pdf"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_render_page_png_uses_planned_height(pdf_path):
+    png, width, height = render_page_png(pdf_path, 1, 512)
+    assert png.startswith(b"\x89PNG")
+    assert height == 512 and width == pytest.approx(512 * 595 / 842, abs=1)
+    assert fitz.Pixmap(png).height == 512
+
+    _, width, height = render_page_png(pdf_path, 2, 768)
+    assert height == 768 and width == pytest.approx(768 * 842 / 595, abs=1)
+
+
+def test_page_image_renderer(pdf_path):
+    renderer = PageImageRenderer(pdf_path, workers=1)
+    try:
+        _, width, height = asyncio.run(renderer.render(1, 1056))
+    finally:
+        renderer.close()
+    assert height == 1056 and width == pytest.approx(1056 * 595 / 842, abs=1)
+
+
+def test_render_and_save_page_rasterizes_once(pdf_path, tmp_path):
+    image_path = str(tmp_path / "page.png")
+    png, width, height, saved = render_and_save_page(pdf_path, 1, 512, image_path, zoom=2.0)
+
+    # 頁面圖片以顯示倍率保存，送給模型的圖片縮放為規劃的高度
+    assert fitz.Pixmap(image_path).height == round(842 * 2)
+    assert saved.bytes_written == (tmp_path / "page.png").stat().st_size and not saved.skipped
+    assert height == 512 and width == pytest.approx(512 * 595 / 842, abs=1)
+    assert fitz.Pixmap(png).height == 512
+
+    _, _, height, saved = render_and_save_page(pdf_path, 1, 768, image_path)
+    assert saved.skipped and height == 768
+
+
+def test_page_image_renderer_saves_each_page_once(pdf_path, tmp_path):
+    renderer = PageImageRenderer(pdf_path, workers=1, output_dir=str(tmp_path), pdf_name="sample")
+    try:
+        asyncio.run(renderer.render(1, 512))
+        # 提高解析度重新處理時不重新寫入頁面圖片
+        _, _, height = asyncio.run(renderer.render(1, 1056))
+    finally:
+        renderer.close()
+    assert height == 1056
+    assert list(renderer.page_renders) == [1]
+    assert renderer.page_renders[1].image_path == page_image_path(str(tmp_path), "sample", 1)
+    assert fitz.Pixmap(renderer.page_renders[1].image_path).height == round(842 * 2)
+
+
+def test_run_vision_adaptive_reports_failed_pages_and_saves_each_page_once(pdf_path, tmp_path, monkeypatch):
+    from src.processors.zerox_pdf_processor import ZeroxPDFProcessor
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    processor = ZeroxPDFProcessor(model=MODEL)
+    processor.page_render_workers = 1
+    heights = []
+
+    async def recognize(model, image):
+        heights.append(fitz.Pixmap(image).height)
+        if len(heights) == 2:
+            raise RuntimeError("model error")
+        return types.SimpleNamespace(content="# page " + "x" * 50, input_tokens=100, output_tokens=10)
+
+    result = asyncio.run(processor.run_vision_adaptive(recognize, pdf_path, [1, 2], str(tmp_path)))
+
+    assert len(result.pages) == 1 and len(result.failed_pages) == 1
+    assert result.input_tokens == 100
+    # 兩頁都只渲染一次並保存頁面圖片（失敗的頁面也保留圖片）
+    assert [render.page_num for render in result.page_renders] == [1, 2]
+    assert all(not render.skipped and render.bytes_written for render in result.page_renders)
+    assert sorted(path.name for path in tmp_path.glob("*.png")) == ["sample_page_1.png", "sample_page_2.png"]
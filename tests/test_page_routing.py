@@ -0,0 +1,117 @@
+"""頁面掃描、文字層快速路徑路由與表格轉換的測試"""
+
+import fitz
+import pytest
+
+from src.processors import pdf_page_scan
+from src.processors.page_routing import ROUTE_TEXT_LAYER, ROUTE_VISION, route_pages, table_to_markdown
+from src.processors.pdf_page_scan import PAGE_KIND_BLANK, PAGE_KIND_IMAGE, PAGE_KIND_TEXT, scan_pdf_pages
+
+BODY = "Installation notes for the distribution panel, section {}. Check every terminal before power on."
+
+
+def _text_page(doc, lines=12):
+    page = doc.new_page()
+    for i in range(lines):
+        page.insert_text((72, 72 + i * 16), BODY.format(i), fontsize=9)
+    return page
+
+
+def _table_page(doc):
+    page = _text_page(doc, lines=4)
+    x0, y0, cell_w, cell_h = 72, 200, 120, 24
+    rows = [["Item", "Part", "Qty"], ["Breaker", "AB-1234", "2"], ["Relay", "CD-5678", "4"]]
+    for r, row in enumerate(rows):
+        for c, value in enumerate(row):
+            rect = fitz.Rect(x0 + c * cell_w, y0 + r * cell_h, x0 + (c + 1) * cell_w, y0 + (r + 1) * cell_h)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+            page.insert_text((rect.x0 + 4, rect.y1 - 8), value, fontsize=9)
+    return page
+
+
+def _drawing_page(doc):
+    page = _text_page(doc, lines=12)
+    shape = page.new_shape()
+    for i in range(40):
+        shape.draw_line((60 + i * 12, 300), (300 + i * 6, 780))
+        shape.draw_circle((120 + (i % 8) * 50, 420 + (i // 8) * 60), 18)
+    shape.finish(color=(0, 0, 0), width=0.6)
+    shape.commit()
+    return page
+
+
+def _scanned_page(doc):
+    page = doc.new_page()
+    page.draw_rect(fitz.Rect(50, 50, 550, 750), color=(0, 0, 0), fill=(0.2, 0.2, 0.2))
+    return page
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    doc = fitz.open()
+    _text_page(doc)                      # 1: 文字為主
+    _table_page(doc)                     # 2: 文字 + 表格
+    _drawing_page(doc)                   # 3: 圖面為主
+    doc.new_page().insert_text((72, 72), "Sheet 3 of 9", fontsize=9)  # 4: 文字量不足
+    _scanned_page(doc)                   # 5: 無文字層
+    doc.new_page()                       # 6: 空白
+    path = tmp_path / "sample.pdf"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_table_to_markdown():
+    markdown = table_to_markdown([["Item", "Part"], ["Breaker", "AB|1234"], [None, None], ["Relay\nunit", None]])
+    assert markdown.splitlines() == [
+        "| Item | Part |",
+        "| --- | --- |",
+        "| Breaker | AB\\|1234 |",
+        "| Relay unit |  |",
+    ]
+
+
+def test_table_to_markdown_pads_ragged_rows_and_handles_empty():
+    assert table_to_markdown([["A", "B", "C"], ["1"]]).splitlines()[-1] == "| 1 |  |  |"
+    assert table_to_markdown([[None, ""], []]) == ""
+
+
+def test_scan_classifies_pages(pdf_path):
+    profiles = scan_pdf_pages(pdf_path, workers=1)
+    assert [profiles[page].kind for page in range(1, 7)] == [
+        PAGE_KIND_TEXT, PAGE_KIND_TEXT, PAGE_KIND_TEXT, PAGE_KIND_TEXT, PAGE_KIND_IMAGE, PAGE_KIND_BLANK
+    ]
+    assert profiles[5].white_ratio is not None and profiles[1].white_ratio is None
+
+
+def test_scan_computes_visual_ratios_only_for_requested_text_pages(pdf_path, monkeypatch):
+    calls = []
+    real_visual_ratios = pdf_page_scan.visual_ratios
+
+    def counting_visual_ratios(page):
+        calls.append(page.number + 1)
+        return real_visual_ratios(page)
+
+    monkeypatch.setattr(pdf_page_scan, "visual_ratios", counting_visual_ratios)
+
+    scan_pdf_pages(pdf_path, workers=1)
+    assert calls == []
+
+    profiles = scan_pdf_pages(pdf_path, workers=1, visual_min_chars=200)
+    assert calls == [1, 2, 3]
+    assert profiles[3].drawing_ratio > profiles[1].drawing_ratio
+
+
+def test_route_pages(pdf_path):
+    profiles = scan_pdf_pages(pdf_path, workers=1, visual_min_chars=200)
+    routes = route_pages(pdf_path, profiles, pages=[1, 2, 3, 4, 5], min_text_chars=200, max_visual_ratio=0.15)
+
+    assert [routes[page].route for page in range(1, 6)] == [
+        ROUTE_TEXT_LAYER, ROUTE_TEXT_LAYER, ROUTE_VISION, ROUTE_VISION, ROUTE_VISION
+    ]
+    assert [routes[page].reason for page in (3, 4, 5)] == ["圖面為主", "文字量不足", "無文字層"]
+
+    assert "section 0" in routes[1].markdown
+    # 表格框線不算圖面，表格內容轉為 markdown 表格
+    assert routes[2].table_count == 1
+    assert "| Breaker | AB-1234 | 2 |" in routes[2].markdown
+    assert "markdown" not in routes[2].to_dict()
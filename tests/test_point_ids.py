@@ -0,0 +1,39 @@
+"""穩定點ID（UUIDv5）的測試"""
+
+import uuid
+
+from src.core.langchain_rag_system import stable_point_id
+
+
+def test_same_parts_give_same_id():
+    assert stable_point_id("manual.pdf", 3, 0) == stable_point_id("manual.pdf", 3, 0)
+
+
+def test_id_is_a_valid_uuid5():
+    point_id = stable_point_id("manual.pdf", 1, 0)
+    assert uuid.UUID(point_id).version == 5
+
+
+def test_parts_are_stringified():
+    assert stable_point_id("manual.pdf", 3, 0) == stable_point_id("manual.pdf", "3", "0")
+
+
+def test_different_parts_give_different_ids():
+    ids = {
+        stable_point_id(source, page, index)
+        for source in ("a.pdf", "b.pdf", "content:0f3a")
+        for page in range(1, 51)
+        for index in range(20)
+    }
+    assert len(ids) == 3 * 50 * 20
+
+
+def test_child_ids_do_not_collide_with_parent_ids():
+    parent_ids = [stable_point_id("a.pdf", page, index) for page in range(1, 11) for index in range(5)]
+    child_ids = [stable_point_id(parent_id, child_index) for parent_id in parent_ids for child_index in range(8)]
+    assert len(set(child_ids)) == len(child_ids)
+    assert not set(child_ids) & set(parent_ids)
+
+
+def test_part_order_matters():
+    assert stable_point_id("a.pdf", 1, 2) != stable_point_id("a.pdf", 2, 1)
@@ -0,0 +1,123 @@
+"""int8 / binary 量化與本地向量副本搜尋的測試"""
+
+import types
+
+import numpy as np
+import pytest
+
+from src.core.local_vector_index import LocalVectorIndex
+from src.core.quantization import (
+    build_search_params, hamming_distances, normalize_mode, pack_binary, quantize_int8
+)
+from src.core.retrieval_filters import RetrievalFilter
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(300, 64)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+class FakeQdrantClient:
+    """以 scroll 返回固定點的 Qdrant 客戶端"""
+
+    def __init__(self, matrix):
+        self.points = [
+            types.SimpleNamespace(
+                id=f"p{row}",
+                vector=matrix[row].tolist(),
+                payload={"page_content": f"chunk {row}",
+                         "metadata": {"source_filename": f"{row % 3}.pdf", "page_num": row % 10 + 1}}
+            )
+            for row in range(len(matrix))
+        ]
+
+    def scroll(self, collection_name, limit, offset, with_payload, with_vectors):
+        start = offset or 0
+        end = start + limit
+        return self.points[start:end], (end if end < len(self.points) else None)
+
+
+def test_normalize_mode():
+    assert normalize_mode(None) == "none"
+    assert normalize_mode("INT8") == "int8"
+    with pytest.raises(ValueError):
+        normalize_mode("pq")
+
+
+def test_search_params_only_for_quantized_collections():
+    assert build_search_params("none", 2.0) is None
+    params = build_search_params("int8", 2.0)
+    assert params.quantization.rescore and params.quantization.oversampling == 2.0
+    assert build_search_params("none", 2.0, ignore=True).quantization.ignore
+
+
+def test_int8_round_trip_error_is_within_one_step(vectors):
+    quantized, scales = quantize_int8(vectors, quantile=1.0)
+    assert quantized.dtype == np.int8
+    restored = quantized.astype(np.float32) * scales
+    assert np.all(np.abs(restored - vectors) <= scales / 2 + 1e-6)
+
+
+def test_int8_clips_outliers_beyond_quantile(vectors):
+    quantized, scales = quantize_int8(vectors, quantile=0.9)
+    assert quantized.min() >= -127 and quantized.max() <= 127
+    inner = np.abs(vectors) <= scales * 127
+    restored = quantized.astype(np.float32) * scales
+    assert np.all(np.abs(restored - vectors)[inner] <= (scales / 2 + 1e-6)[np.nonzero(inner)[1]])
+
+
+def test_int8_preserves_ranking(vectors):
+    quantized, scales = quantize_int8(vectors)
+    query = vectors[7]
+    exact = vectors @ query
+    approx = quantized.astype(np.float32) @ (query * scales)
+    assert np.argmax(approx) == np.argmax(exact) == 7
+    assert np.corrcoef(exact, approx)[0, 1] > 0.99
+
+
+def test_pack_binary_round_trip(vectors):
+    packed = pack_binary(vectors)
+    assert packed.shape == (len(vectors), vectors.shape[1] // 8)
+    assert np.array_equal(np.unpackbits(packed, axis=-1).astype(bool), vectors > 0)
+
+
+def test_hamming_distances_match_bit_count(vectors):
+    packed = pack_binary(vectors)
+    distances = hamming_distances(packed, packed[3])
+    expected = np.count_nonzero((vectors > 0) != (vectors[3] > 0), axis=1)
+    assert np.array_equal(distances, expected)
+    assert distances[3] == 0
+
+
+@pytest.mark.parametrize("mode", ["none", "int8", "binary"])
+def test_local_index_search_matches_exact_top_k(tmp_path, vectors, mode):
+    index = LocalVectorIndex(str(tmp_path), "children", quantization=mode, oversampling=8.0)
+    assert index.sync(FakeQdrantClient(vectors)) == len(vectors)
+
+    query = vectors[42] + 0.05 * vectors[43]
+    exact = [row for row, _ in index.search(query, k=5, exact=True)]
+    approx = index.search(query, k=5)
+    assert approx[0][0] == exact[0] == 42
+    if mode != "binary":  # binary 只保留正負號，過採樣的候選只保證最相關的結果
+        assert [row for row, _ in approx] == exact
+    # 候選以原始向量重新評分
+    normalized = query / np.linalg.norm(query)
+    assert [score for _, score in approx] == pytest.approx([float(vectors[row] @ normalized) for row, _ in approx],
+                                                          abs=1e-5)
+    assert [score for _, score in approx] == sorted((score for _, score in approx), reverse=True)
+
+    rows = [row for row, _ in index.search(query, k=50, filters=RetrievalFilter(source_filenames=["1.pdf"],
+                                                                               page_min=3, page_max=5))]
+    expected = {row for row in range(len(vectors)) if row % 3 == 1 and 3 <= row % 10 + 1 <= 5}
+    assert set(rows) == expected
+
+
+def test_local_index_reopens_same_version(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path), "children", quantization="int8")
+    index.sync(FakeQdrantClient(vectors))
+
+    reopened = LocalVectorIndex(str(tmp_path), "children", quantization="int8")
+    assert reopened.ready and reopened.version == index.version
+    assert reopened.search(vectors[5], k=1)[0][0] == 5
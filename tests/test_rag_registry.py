@@ -0,0 +1,105 @@
+"""共用 RAG 實例登錄表的測試：建立不阻塞其他集合、釋放與刪除時停止追蹤集合狀態"""
+
+import threading
+import time
+import types
+
+import pytest
+
+import src.core.langchain_rag_system as rag_module
+from config.config import Config
+from src.core.collection_monitor import CollectionStateMonitor
+
+
+monitor = CollectionStateMonitor(qdrant_client=None)
+
+
+class FakeRAG:
+    """只記錄集合名稱的 RAG 替身（建立時可等待 gate）"""
+
+    gates = {}
+    created = []
+
+    def __init__(self, collection_name):
+        gate = self.gates.get(collection_name)
+        if gate is not None:
+            gate.wait(5)
+        self.created.append(collection_name)
+        self.child_collection_name = f"{collection_name}_langchain_children"
+        self.docstore = types.SimpleNamespace(collection_name=f"{collection_name}_docstore")
+        self.collection_monitor = monitor
+        monitor.watch([self.child_collection_name, self.docstore.collection_name], refresh=False)
+        self.local_index = None
+
+    def reset_bm25_index(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag_module, "LangChainParentChildRAG", FakeRAG)
+    monkeypatch.setattr(rag_module, "_rag_systems", {})
+    monkeypatch.setattr(rag_module, "_rag_last_used", {})
+    monkeypatch.setattr(rag_module, "_rag_creation_locks", {})
+    monkeypatch.setattr(Config, "QDRANT_COLLECTION_NAME", "primary")
+    monkeypatch.setattr(Config, "RAG_REGISTRY_TTL", 3600)
+    monkeypatch.setattr(Config, "RAG_REGISTRY_MAX_SYSTEMS", 10)
+    monkeypatch.setattr(Config, "BM25_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "LOCAL_VECTOR_INDEX_DIR", str(tmp_path))
+    FakeRAG.gates, FakeRAG.created = {}, []
+    monitor._states.clear()
+
+
+def test_same_collection_is_created_once():
+    gate = FakeRAG.gates["a"] = threading.Event()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(rag_module.get_rag_system("a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert FakeRAG.created == ["a"]
+    assert len({id(rag) for rag in results}) == 1
+    assert not rag_module._rag_creation_locks
+
+
+def test_slow_construction_does_not_block_other_collections():
+    FakeRAG.gates["slow"] = gate = threading.Event()
+    slow = threading.Thread(target=rag_module.get_rag_system, args=("slow",))
+    slow.start()
+    time.sleep(0.05)
+
+    # 另一個集合在 slow 建立期間即可取得
+    started = time.monotonic()
+    assert rag_module.get_rag_system("fast").child_collection_name == "fast_langchain_children"
+    assert time.monotonic() - started < 1
+    gate.set()
+    slow.join(5)
+    assert set(rag_module._rag_systems) == {"slow", "fast"}
+
+
+def test_eviction_unwatches_collections(monkeypatch):
+    monkeypatch.setattr(Config, "RAG_REGISTRY_MAX_SYSTEMS", 2)
+    rag_module.get_rag_system("primary")
+    rag_module.get_rag_system("old")
+    assert "old_langchain_children" in monitor._states
+
+    rag_module.get_rag_system("new")
+    assert set(rag_module._rag_systems) == {"primary", "new"}
+    assert "old_langchain_children" not in monitor._states
+    assert "old_docstore" not in monitor._states
+    assert "new_langchain_children" in monitor._states
+
+
+def test_release_collection_unwatches_unused_collections():
+    rag_module.get_rag_system("primary")
+    monitor.watch(["orphan_langchain_children"], refresh=False)
+
+    rag_module.release_collection("orphan_langchain_children")
+    assert "orphan_langchain_children" not in monitor._states
+
+    # 仍有實例使用的集合保留狀態（刪除端點已記錄為不存在）
+    rag_module.release_collection("primary_langchain_children")
+    assert "primary_langchain_children" in monitor._states
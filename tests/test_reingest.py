@@ -0,0 +1,111 @@
+"""重新處理文件時的穩定點ID與舊段落清除的測試"""
+
+import types
+
+import pytest
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from qdrant_client.models import MatchAny, MatchValue
+
+from config.config import Config
+from src.core import context_packer
+from src.core.langchain_rag_system import LangChainParentChildRAG
+from src.core.retrieval_filters import METADATA_PAYLOAD_KEY
+
+
+class FakeQdrantClient:
+    """以字典保存子段落的 Qdrant 客戶端，scroll 依 metadata 欄位過濾"""
+
+    def __init__(self):
+        self.points = {}  # point_id -> payload
+
+    def upsert(self, documents, ids):
+        for document, point_id in zip(documents, ids):
+            self.points[point_id] = {METADATA_PAYLOAD_KEY: dict(document.metadata)}
+
+    def scroll(self, collection_name, scroll_filter, limit, offset, with_payload, with_vectors):
+        def matches(payload, condition):
+            value = payload.get(METADATA_PAYLOAD_KEY, {}).get(condition.key.split(".", 1)[1])
+            if isinstance(condition.match, MatchValue):
+                return value == condition.match.value
+            if isinstance(condition.match, MatchAny):
+                return value in condition.match.any
+            raise AssertionError(f"unexpected condition {condition}")
+
+        points = [types.SimpleNamespace(id=point_id, payload=payload) for point_id, payload in self.points.items()
+                  if all(matches(payload, condition) for condition in scroll_filter.must)]
+        return points, None
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    monkeypatch.setitem(context_packer._encodings, Config.OPENAI_MODEL, None)
+    rag = LangChainParentChildRAG.__new__(LangChainParentChildRAG)
+    separators = ["\n\n", "\n", "。", " ", ""]
+    rag.parent_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0, separators=separators)
+    rag.child_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0, separators=separators)
+    rag.retriever = types.SimpleNamespace(id_key="doc_id")
+    rag.qdrant_client = FakeQdrantClient()
+    rag.child_collection_name = "manuals_langchain_children"
+    return rag
+
+
+def page(page_num, paragraphs, file_hash="hash-a", filename="manual"):
+    content = "\n\n".join(f"第{page_num}頁第{i}段 " + "配電盤接線說明。" * 8 for i in range(paragraphs))
+    return Document(page_content=content, metadata={"page_num": page_num, "source_filename": filename,
+                                                    "source_file_hash": file_hash})
+
+
+def ingest(rag, documents):
+    child_docs, child_ids, parent_docs = rag._split_documents_for_ingest(documents)
+    stale = rag._find_stale_points(documents, child_ids, [parent_id for parent_id, _ in parent_docs])
+    rag.qdrant_client.upsert(child_docs, child_ids)
+    for point_id in stale[0]:
+        del rag.qdrant_client.points[point_id]
+    return child_ids, [parent_id for parent_id, _ in parent_docs], stale
+
+
+def test_reingest_is_idempotent(rag):
+    documents = [page(1, 4), page(2, 3)]
+    child_ids, parent_ids, stale = ingest(rag, documents)
+    assert len(set(child_ids)) == len(child_ids) and len(set(parent_ids)) == len(parent_ids)
+    assert stale == ([], [])
+
+    again_child_ids, again_parent_ids, stale = ingest(rag, [page(1, 4), page(2, 3)])
+    assert (again_child_ids, again_parent_ids) == (child_ids, parent_ids)
+    assert stale == ([], [])
+    assert sorted(rag.qdrant_client.points) == sorted(child_ids)
+
+
+def test_shorter_page_removes_leftover_points(rag):
+    child_ids, parent_ids, _ = ingest(rag, [page(1, 6), page(2, 3)])
+    page_two_ids = {point_id for point_id, payload in rag.qdrant_client.points.items()
+                    if payload[METADATA_PAYLOAD_KEY]["page_num"] == 2}
+
+    new_child_ids, new_parent_ids, (stale_child_ids, stale_parent_ids) = ingest(rag, [page(1, 2)])
+    assert stale_child_ids and stale_parent_ids and not set(stale_child_ids) & set(new_child_ids)
+    assert set(stale_child_ids) == set(child_ids) - set(new_child_ids) - page_two_ids
+    assert set(stale_parent_ids) == set(parent_ids) - set(new_parent_ids) - {
+        payload[METADATA_PAYLOAD_KEY]["doc_id"] for point_id, payload in rag.qdrant_client.points.items()
+        if point_id in page_two_ids
+    }
+    # 未重新處理的頁面保留
+    assert page_two_ids <= set(rag.qdrant_client.points)
+
+
+def test_same_filename_with_different_hash_is_not_touched(rag):
+    other_ids, _, _ = ingest(rag, [page(1, 6, file_hash="hash-other")])
+    _, _, (stale_child_ids, _) = ingest(rag, [page(1, 2)])
+    assert stale_child_ids == []
+
+    ingest(rag, [page(1, 6)])
+    _, _, (stale_child_ids, _) = ingest(rag, [page(1, 2)])
+    assert stale_child_ids and not set(stale_child_ids) & set(other_ids)
+    assert set(other_ids) <= set(rag.qdrant_client.points)
+
+
+def test_documents_without_hash_are_not_matched(rag):
+    documents = [page(1, 3, file_hash="")]
+    child_ids, _, _ = ingest(rag, documents)
+    assert rag._find_stale_points([page(1, 1, file_hash="")], [], []) == ([], [])
+    assert sorted(rag.qdrant_client.points) == sorted(child_ids)
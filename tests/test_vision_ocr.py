@@ -0,0 +1,17 @@
+"""視覺模型輸出格式化的測試"""
+
+import pytest
+
+pytest.importorskip("litellm")
+
+from src.processors.vision_ocr import strip_code_fence
+
+
+def test_strip_code_fence_removes_wrapping_fence():
+    assert strip_code_fence("```markdown\n# 標題\n\n| a |\n```") == "# 標題\n\n| a |"
+    assert strip_code_fence("```\n內容\n```\n") == "內容"
+
+
+def test_strip_code_fence_keeps_inner_code_blocks():
+    text = "# 標題\n```python\nx = 1\n```"
+    assert strip_code_fence(text) == text